@@ -1,24 +1,26 @@
 import json
 import os
 import time
-import urllib.request
 import subprocess
-import requests
-import pandas as pd
 from datetime import datetime
+from functools import cached_property
 from dotenv import load_dotenv
-from anthropic import Anthropic
-from openai import OpenAI
 
-# Import the get_campaign_insight function from your saved file
-from tools.campaign_insight import get_campaign_insight
+# Import the campaign insight loader from your saved file
+from tools.campaign_insight import load_campaign_insight
+from tools.base import Parameter, ToolRegistry, ToolSpec
+from tools.telegram_dispatcher import get_telegram_dispatcher
+from utils.http_client import get_http_client
+from utils.tracing import span, traced, record_llm_usage
+from utils.report_cache import (
+    ReportCache, REPORT_SECTIONS, PERIOD_SENSITIVE_SECTIONS,
+    report_fingerprint, split_latest_period, split_sections, join_sections
+)
 
 load_dotenv()
 
 class BigMind:
     def __init__(self):
-        self.client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
         # Telegram configuration
         self.telegram_bot_token = os.getenv("BOT_TOKEN")
         self.telegram_chat_id = os.getenv("TARGET_CHAT_ID")
@@ -26,37 +28,18 @@ class BigMind:
         # Meta Ads configuration
         self.ad_account_id = os.getenv("AD_ACCOUNT_ID")
         self.meta_access_token = os.getenv("ACCESS_TOKEN")
-        
-        self.available_tools = {
-            "Write_Report": {
-                "description": "Creates detailed marketing reports",
-                "parameters": ["campaign_data"]
-            },
-            "Send_Message": {
-                "description": "Sends message via telegram to user",
-                "parameters": ["message"]
-            },
-            "Create_Ad_from_Image": {
-                "description": "Creates video advertisements from input images + video description"
-            },
-            "Post_Video_Ad": {
-                "description": "Posts a video to Meta Ads campaign",
-                "parameters": ["remote_file_path", "title", "description"]
-            },
-            "Fetch_Campaign_Insight": {
-                "description": "Fetches campaign insight data from Facebook API for a given date range",
-                "parameters": ["start_date", "end_date"]
-            }
-        }
+        self.graph_api_base = os.getenv("GRAPH_API_BASE", "https://graph.facebook.com/v20.0")
+        # Report cache, keyed by account, date window and data fingerprint
+        self.report_cache = ReportCache(os.getenv(
+            "REPORT_CACHE_PATH",
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory", "report_cache.json")
+        ))
         
         self.system_prompt = """You are an AI Chief Marketing Officer with access to several tools. Your role is to analyze user requests and determine if and which tools should be used to fulfill them.
 
         Available tools:
-        - Write_Report: For creating detailed marketing reports (requires campaign_data parameter)
-        - Send_Message: For sending messages via Telegram
+        {tools}
         - Create_Ad_from_Image: For creating video ads from images
-        - Post_Video_Ad: For uploading videos to Meta Ads campaigns
-        - Fetch_Campaign_Insight: For fetching campaign insights from Facebook API
 
         When you receive a message, you should:
         1. Analyze if the request requires using any of the available tools
@@ -68,9 +51,6 @@ class BigMind:
             "parameters": {...} # any parameters needed for the tool
         }
 
-        For Write_Report tool, include a "campaign_data" parameter with the path to the campaign data.
-        For Send_Message tool, include a "message" parameter with the text to be sent.
-
         Example user messages and responses:
         "Can you create a video ad from this product image?" 
         → {"requires_tool": true, "tool_name": "Create_Ad_from_Image", "reason": "User explicitly requested video ad creation", "parameters": {"image_path": "path_to_image", "video_description": "user_description"}}
@@ -84,16 +64,135 @@ class BigMind:
         "Upload our new product video to the Meta Ads campaign"
         → {"requires_tool": true, "tool_name": "Post_Video_Ad", "reason": "User requested to upload a video to Meta Ads Campaign", "parameters": {"remote_file_path": "https://example.com/video.mp4", "title": "New Product Launch", "description": "Exciting new product features"}}
 
+        "What did last month's report say about cost per result?"
+        → {"requires_tool": true, "tool_name": "Search_Past_Work", "reason": "The answer is in a report that was already generated", "parameters": {"query": "cost per result", "source": "report"}}
+
         "What do you think about our marketing strategy?"
         → {"requires_tool": false, "tool_name": null, "reason": "This is a general discussion query that doesn't require tool usage", "parameters": {}}
 
-        Remember: Only suggest using a tool when it's clearly needed to fulfill the user's request."""
+        Remember: Only suggest using a tool when it's clearly needed to fulfill the user's request.""".replace(
+            "{tools}", TOOLS.prompt_section().replace("\n", "\n        ")
+        )
     
-    def generate_performance_report(self, campaign_data: dict) -> dict:
+    # SDK clients are imported and built on first use, not when the module loads
+    @cached_property
+    def client(self):
+        from anthropic import Anthropic
+        return Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+    @cached_property
+    def memory(self):
+        """Process-wide conversation memory, shared with SmallMind."""
+        from agents.runtime import get_memory_manager
+        return get_memory_manager()
+
+    @cached_property
+    def knowledge(self):
+        """Vector index of past reports, insight snapshots and creatives."""
+        from agents.runtime import get_knowledge_index
+        return get_knowledge_index()
+
+    @cached_property
+    def prefetcher(self):
+        """Insight windows fetched speculatively while SmallMind was replying."""
+        from agents.runtime import get_insight_prefetcher
+        return get_insight_prefetcher()
+
+    def _remember(self, texts: list, metadatas: list):
+        # Indexing is best-effort; it must never fail the tool that produced the data
         try:
-            data_context = json.dumps(campaign_data, indent=2)
-            
-            system_prompt = """You are an expert marketing analyst tasked with creating detailed performance reports for Meta Ad campaigns.
+            self.knowledge.add(texts, metadatas)
+        except Exception as e:
+            print(f"Could not index {len(texts)} chunk(s): {e}")
+
+    @cached_property
+    def openai_client(self):
+        from openai import OpenAI
+        return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    def _complete_report(self, system_prompt: str, user_prompt: str) -> str:
+        """Run a report prompt through the reasoning model and return its text."""
+        response = self.openai_client.chat.completions.create(
+            model="o3-mini-2025-01-31",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            reasoning_effort="low",  # Options: "low", "medium", "high"
+            max_completion_tokens=3000
+        )
+        record_llm_usage("o3-mini-2025-01-31", response)
+        return response.choices[0].message.content
+
+    def _regenerate_period_sections(self, previous_sections: dict, campaign_data, latest_period) -> str:
+        """Rewrite only the period-sensitive sections of a previous report."""
+        reused = {title: text for title, text in previous_sections.items() if title not in PERIOD_SENSITIVE_SECTIONS}
+
+        system_prompt = f"""You are an expert marketing analyst updating an existing Meta Ad campaign performance report.
+            Only the latest reporting period has changed. Rewrite ONLY these sections, keeping their numbered headings:
+            {", ".join(f"{REPORT_SECTIONS.index(title) + 1}. {title}" for title in PERIOD_SENSITIVE_SECTIONS)}
+            Do not output any other section."""
+
+        user_prompt = f"""Existing report sections (for context, do not repeat them):
+            {join_sections(reused)}
+
+            Latest period data:
+            {json.dumps(latest_period, indent=2)}
+
+            Full campaign data:
+            {json.dumps(campaign_data, indent=2)}"""
+
+        updated_sections = split_sections(self._complete_report(system_prompt, user_prompt), PERIOD_SENSITIVE_SECTIONS)
+        if len(updated_sections) != len(PERIOD_SENSITIVE_SECTIONS):
+            raise ValueError("Partial report update did not return the expected sections")
+        return join_sections({**reused, **updated_sections})
+
+    def _resolve_campaign_data(self, campaign_data, start_date: str = None, end_date: str = None):
+        """Turn Write_Report's campaign_data into rows: the data itself, a JSON file, or else the insight window."""
+        if not isinstance(campaign_data, str) and campaign_data is not None:
+            return campaign_data
+        if campaign_data and os.path.isfile(campaign_data):
+            with open(campaign_data, "r", encoding="utf-8") as f:
+                return json.load(f)
+        # A placeholder name from the model: report on the requested window
+        insight = self.fetch_campaign_insight(start_date, end_date)
+        if not insight["success"]:
+            raise ValueError(insight["details"])
+        return insight["data"]
+
+    @traced("tool.Write_Report")
+    def generate_performance_report(self, campaign_data: dict, start_date: str = None, end_date: str = None) -> dict:
+        """Generate a performance report, reusing cached reports where the data allows."""
+        try:
+            campaign_data = self._resolve_campaign_data(campaign_data, start_date, end_date)
+            fingerprint = report_fingerprint(self.ad_account_id, start_date, end_date, campaign_data)
+            cached = self.report_cache.get(fingerprint)
+            if cached:
+                return {
+                    "success": True,
+                    "report": f"Report Generated: {cached['created_at']}\n\n{cached['report']}",
+                    "cached": True
+                }
+
+            latest_period, earlier_periods = split_latest_period(campaign_data)
+            base_fingerprint = None
+            previous = None
+            if latest_period is not None:
+                base_fingerprint = report_fingerprint(self.ad_account_id, start_date, None, earlier_periods)
+                previous = self.report_cache.find_previous(self.ad_account_id, base_fingerprint)
+
+            report_content = None
+            previous_sections = split_sections(previous["report"]) if previous else {}
+            if previous_sections:
+                try:
+                    report_content = self._regenerate_period_sections(previous_sections, campaign_data, latest_period)
+                except ValueError:
+                    report_content = None
+
+            if report_content is None:
+                data_context = json.dumps(campaign_data, indent=2)
+
+                system_prompt = """You are an expert marketing analyst tasked with creating detailed performance reports for Meta Ad campaigns.
             Your reports should be professional, data-driven, and ready to be sent to clients.
             
             Structure your report with the following sections:
@@ -103,8 +202,8 @@ class BigMind:
             4. Week-over-Week Performance
             5. Areas for Optimization
             6. Recommendations"""
-            
-            user_prompt = f"""Please analyze this Meta Ads campaign performance data and generate a comprehensive report:
+
+                user_prompt = f"""Please analyze this Meta Ads campaign performance data and generate a comprehensive report:
 
             Campaign Data:
             {data_context}
@@ -114,20 +213,21 @@ class BigMind:
             - Key metrics and their changes over time
             - Notable improvements or areas of concern
             - Specific recommendations for optimization"""
-            
-            response = self.openai_client.chat.completions.create(
-                model="o3-mini-2025-01-31",
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt}
-                ],
-                reasoning_effort="low",  # Options: "low", "medium", "high"
-                max_completion_tokens=3000
-            )
-            
-            report_content = response.choices[0].message.content
+
+                report_content = self._complete_report(system_prompt, user_prompt)
+
+            data_fingerprint = report_fingerprint(self.ad_account_id, start_date, None, campaign_data)
+            self.report_cache.put(fingerprint, self.ad_account_id, base_fingerprint, data_fingerprint, report_content)
+
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             report_with_timestamp = f"Report Generated: {timestamp}\n\n{report_content}"
+            # numpy (behind the index) is only loaded once there is something to index
+            from utils.vector_index import chunk_text
+            chunks = chunk_text(report_content)
+            self._remember(chunks, [{
+                "source": "report", "account": self.ad_account_id, "start_date": start_date,
+                "end_date": end_date, "created_at": timestamp
+            }] * len(chunks))
             
             return {
                 "success": True,
@@ -144,12 +244,13 @@ class BigMind:
     def download_file(self, remote_url: str, file_name: str) -> bool:
         """Downloads a file from a remote repository and stores it locally."""
         try:
-            urllib.request.urlretrieve(remote_url, file_name)
+            get_http_client().download(remote_url, file_name)
             return True
         except Exception as e:
             print(f"Download failed: {e}")
             return False
 
+    @traced("tool.Post_Video_Ad")
     def upload_video_ad(self, remote_file_path: str, title: str, description: str) -> dict:
         """Uploads a video to Meta's Marketing API."""
         try:
@@ -162,19 +263,23 @@ class BigMind:
                     "details": "Failed to download video file"
                 }
             
-            url = f"https://graph.facebook.com/v20.0/act_{self.ad_account_id}/advideos"
+            url = f"{self.graph_api_base}/act_{self.ad_account_id}/advideos"
             headers = {"Authorization": f"Bearer {self.meta_access_token}"}
             
             with open(local_file_path, "rb") as video_file:
                 files = {"source": video_file}
                 data = {"title": title, "description": description}
-                response = requests.post(url, headers=headers, files=files, data=data)
+                response = get_http_client().post(url, headers=headers, files=files, data=data)
             
             if os.path.exists(local_file_path):
                 os.remove(local_file_path)
             
             result = response.json()
             if 'id' in result:
+                self._remember([f"Video ad \"{title}\": {description} ({remote_file_path})"], [{
+                    "source": "creative", "title": title, "video_url": remote_file_path,
+                    "video_id": result['id'], "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                }])
                 return {
                     "success": True,
                     "details": f"Video uploaded successfully! Video ID: {result['id']}"
@@ -191,20 +296,26 @@ class BigMind:
                 "details": f"Error uploading video: {str(e)}"
             }
 
-    def send_telegram_message(self, message: str) -> dict:
-        """Sends a message to a Telegram user via the bot."""
-        url = f"https://api.telegram.org/bot{self.telegram_bot_token}/sendMessage"
-        payload = {
-            "chat_id": self.telegram_chat_id,
-            "text": message,
-            "parse_mode": "Markdown"
-        }
+    @traced("tool.Send_Message")
+    def send_telegram_message(self, message: str, as_document: bool = False) -> dict:
+        """Queues a message to the configured Telegram chat(s) without blocking.
+
+        TARGET_CHAT_ID may hold several comma-separated chat IDs for fan-out.
+        """
+        chat_ids = [chat_id.strip() for chat_id in (self.telegram_chat_id or "").split(",") if chat_id.strip()]
+        if not chat_ids:
+            return {
+                "success": False,
+                "details": "No Telegram chat configured; set TARGET_CHAT_ID"
+            }
         try:
-            response = requests.post(url, json=payload)
-            result = response.json()
+            dispatcher = get_telegram_dispatcher(self.telegram_bot_token)
+            for chat_id in chat_ids:
+                future = dispatcher.send(chat_id, message, as_document=as_document)
+                future.add_done_callback(lambda done, chat_id=chat_id: self._log_delivery(chat_id, done))
             return {
-                "success": result.get('ok', False),
-                "details": result
+                "success": True,
+                "details": f"Message queued for delivery to {len(chat_ids)} chat(s)"
             }
         except Exception as e:
             return {
@@ -212,13 +323,35 @@ class BigMind:
                 "details": str(e)
             }
 
-    def fetch_campaign_insight(self, start_date: str, end_date: str) -> dict:
-        """Fetches campaign insight data using the integrated get_campaign_insight function."""
+    @staticmethod
+    def _log_delivery(chat_id: str, future):
+        """Reports a queued Telegram message that could not be delivered."""
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Telegram delivery to chat {chat_id} failed: {e}")
+            return
+        if not result.get("success"):
+            print(f"Telegram delivery to chat {chat_id} failed: {result.get('details')}")
+
+    @traced("tool.Fetch_Campaign_Insight")
+    def fetch_campaign_insight(self, start_date: str = None, end_date: str = None) -> dict:
+        """Fetches campaign insight data and its summary metrics, using a prefetch of the same window if one was started."""
         try:
-            insight_data = get_campaign_insight(self.ad_account_id, self.meta_access_token, start_date, end_date)
+            insight = self.prefetcher.take(start_date, end_date)
+            prefetched = insight is not None
+            if not prefetched:
+                insight = load_campaign_insight(self.ad_account_id, self.meta_access_token, start_date, end_date)
+            rows = insight["data"]
+            self._remember(
+                ["; ".join(f"{key}: {value}" for key, value in row.items()) for row in rows],
+                [{"source": "insight", "start_date": start_date, "end_date": end_date}] * len(rows)
+            )
             return {
                 "success": True,
-                "data": insight_data
+                "data": rows,
+                "metrics": insight["metrics"],
+                "prefetched": prefetched
             }
         except Exception as e:
             return {
@@ -226,53 +359,47 @@ class BigMind:
                 "details": f"Error fetching campaign insight: {str(e)}"
             }
 
-    def execute_tool(self, tool_name: str, parameters: dict) -> dict:
-        """Execute the specified tool with given parameters."""
-        if tool_name == "Write_Report":
-            if "campaign_data" not in parameters:
-                return {
-                    "success": False,
-                    "details": "Campaign data parameter is required for Write_Report tool"
-                }
-            return self.generate_performance_report(parameters["campaign_data"])
-            
-        elif tool_name == "Send_Message":
-            if "message" not in parameters:
-                return {
-                    "success": False,
-                    "details": "Message parameter is required for Send_Message tool"
-                }
-            return self.send_telegram_message(parameters["message"])
-        
-        elif tool_name == "Post_Video_Ad":
-            required_params = ["remote_file_path", "title", "description"]
-            if not all(param in parameters for param in required_params):
-                return {
-                    "success": False,
-                    "details": f"Missing required parameters. Need: {required_params}"
-                }
-            return self.upload_video_ad(
-                parameters["remote_file_path"],
-                parameters["title"],
-                parameters["description"]
-            )
-        
-        elif tool_name == "Fetch_Campaign_Insight":
-            required_params = ["start_date", "end_date"]
-            if not all(param in parameters for param in required_params):
-                return {
-                    "success": False,
-                    "details": f"Missing required parameters for Fetch_Campaign_Insight. Need: {required_params}"
-                }
-            return self.fetch_campaign_insight(parameters["start_date"], parameters["end_date"])
-        
+    @traced("tool.Search_Past_Work")
+    def search_past_work(self, query: str, source: str = None, k: int = 5) -> dict:
+        """Retrieves the past report, insight and creative chunks most relevant to a query."""
+        try:
+            results = self.knowledge.search(query, k=int(k), where={"source": source} if source else None)
+            return {
+                "success": True,
+                "details": f"Found {len(results)} relevant item(s) from past work",
+                "results": results
+            }
+        except Exception as e:
+            return {
+                "success": False,
+                "details": f"Error searching past work: {str(e)}"
+            }
+
+    @property
+    def available_tools(self) -> dict:
+        """Registered tools and their parameter names."""
         return {
-            "success": False,
-            "details": f"Tool {tool_name} not implemented yet"
+            name: {"description": TOOLS.get(name).description, "parameters": [p.name for p in TOOLS.get(name).parameters]}
+            for name in TOOLS.names()
         }
 
-    def process_request(self, user_message: str) -> dict:
-        """Process a user request and determine if tool usage is needed."""
+    def execute_tool(self, tool_name: str, parameters: dict) -> dict:
+        """Execute the specified tool with given parameters."""
+        with span("big_mind.execute_tool", tool=tool_name) as tool_span:
+            result = TOOLS.execute(tool_name, parameters, owner=self)
+            tool_span.set_attribute("success", bool(result.get("success")))
+            return result
+
+    @traced("big_mind.process_request")
+    def process_request(self, user_message: str, session_id: str = None) -> dict:
+        """Process a user request and determine if tool usage is needed.
+
+        With a session_id the session's bounded memory is included, so follow-ups
+        like "post that video" resolve, and the outcome is recorded in it.
+        """
+        context = self.memory.context_text(session_id) if session_id else ""
+        if context:
+            user_message = f"Conversation so far:\n{context}\n\nCurrent request: {user_message}"
         try:
             response = self.client.messages.create(
                 model="claude-3-5-sonnet-latest",
@@ -283,6 +410,7 @@ class BigMind:
                     {"role": "user", "content": user_message}
                 ]
             )
+            record_llm_usage("claude-3-5-sonnet-latest", response)
             
             try:
                 response_text = response.content[0].text
@@ -297,7 +425,9 @@ class BigMind:
                         decision["parameters"]
                     )
                     decision["tool_execution_result"] = tool_result
-                
+
+                if session_id:
+                    self.memory.add_turn(session_id, "assistant", f"Big Mind result: {json.dumps(decision, default=str)}")
                 return decision
                 
             except (json.JSONDecodeError, ValueError) as e:
@@ -320,7 +450,74 @@ class BigMind:
         """Validate if a tool name exists in available tools."""
         if tool_name is None:
             return True
-        return tool_name in self.available_tools
+        return tool_name in TOOLS
+
+
+TOOLS = ToolRegistry([
+    ToolSpec(
+        name="Write_Report",
+        description="Creates detailed marketing reports",
+        handler=BigMind.generate_performance_report,
+        method=True,
+        parameters=[
+            Parameter("campaign_data", None, "Path to the campaign data, or the data itself"),
+            Parameter("start_date", description="Start of the reporting window, YYYY-MM-DD", required=False),
+            Parameter("end_date", description="End of the reporting window, YYYY-MM-DD", required=False),
+        ],
+        max_concurrency=2,
+        timeout=300,
+        singleflight=True,
+        usage="Include start_date/end_date when the user names a reporting window",
+    ),
+    ToolSpec(
+        name="Send_Message",
+        description="Sends message via telegram to user",
+        handler=BigMind.send_telegram_message,
+        method=True,
+        parameters=[Parameter("message", description="Text to send")],
+    ),
+    ToolSpec(
+        name="Post_Video_Ad",
+        description="Posts a video to Meta Ads campaign",
+        handler=BigMind.upload_video_ad,
+        method=True,
+        parameters=[
+            Parameter("remote_file_path", description="URL of the video"),
+            Parameter("title"),
+            Parameter("description"),
+        ],
+        max_concurrency=2,
+        timeout=300,
+    ),
+    ToolSpec(
+        name="Fetch_Campaign_Insight",
+        description="Fetches campaign insight data from Facebook API for a given date range",
+        handler=BigMind.fetch_campaign_insight,
+        method=True,
+        parameters=[
+            Parameter("start_date", description="YYYY-MM-DD"),
+            Parameter("end_date", description="YYYY-MM-DD"),
+        ],
+        max_concurrency=4,
+        timeout=60,
+        idempotent=True,
+        cache_ttl=300,
+        singleflight=True,
+    ),
+    ToolSpec(
+        name="Search_Past_Work",
+        description="Searches past reports, insight snapshots and creatives",
+        handler=BigMind.search_past_work,
+        method=True,
+        parameters=[
+            Parameter("query", description="What to look for"),
+            Parameter("source", required=False, enum=("report", "insight", "creative")),
+            Parameter("k", "integer", "Number of results", required=False, default=5),
+        ],
+        idempotent=True,
+        usage="Prefer it over Write_Report and Fetch_Campaign_Insight when the user asks about work that was already done",
+    ),
+])
 
 # Example usage:
 if __name__ == "__main__":
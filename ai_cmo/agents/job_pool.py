@@ -0,0 +1,109 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.result_bus import ResultBus, get_result_bus
+
+
+def describe_result(decision: dict) -> str:
+    """User-facing summary of a BigMind decision.
+
+    A written report is returned as is, campaign insights as their summary
+    metrics, and other tools as their details. A tool that timed out without
+    a known outcome is not reported as failed.
+    """
+    tool_name = decision.get("tool_name")
+    outcome = decision.get("tool_execution_result")
+    if not outcome:
+        return decision.get("reason") or "Big Mind finished without running a tool."
+    if outcome.get("outcome_unknown"):
+        return f"{tool_name} may still be running: {outcome.get('details')}"
+    if not outcome.get("success"):
+        return f"{tool_name} failed: {outcome.get('details')}"
+    if "report" in outcome:
+        return outcome["report"]
+    if outcome.get("metrics"):
+        metrics = ", ".join(f"{key}: {value}" for key, value in outcome["metrics"].items())
+        return f"{tool_name} finished ({len(outcome.get('data') or [])} row(s)): {metrics}"
+    if "data" in outcome:
+        return f"{tool_name} finished:\n{json.dumps(outcome['data'], indent=2)}"
+    details = outcome.get("details", "Done.")
+    if isinstance(details, dict):
+        details = ", ".join(f"{key}: {value}" for key, value in details.items())
+    return f"{tool_name} finished: {details}"
+
+
+class BigMindJobPool:
+    """Runs BigMind requests on a bounded pool of background threads.
+
+    Callers hand off a request and get a Future back immediately; an optional
+    on_done callback receives the BigMind decision (or the raised exception)
+    from the worker thread. Requests submitted with a session_id also publish
+    "started" and then "result" or "error" events to the result bus.
+    """
+
+    def __init__(self, big_mind=None, max_workers: int = None, result_bus: ResultBus = None):
+        self._big_mind = big_mind
+        self.result_bus = result_bus or get_result_bus()
+        self._job_ids = itertools.count(1)
+        self._big_mind_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv("BIG_MIND_WORKERS", "4")),
+            thread_name_prefix="big-mind"
+        )
+
+    @property
+    def big_mind(self):
+        with self._big_mind_lock:
+            if self._big_mind is None:
+                from agents.runtime import get_big_mind
+                self._big_mind = get_big_mind()
+            return self._big_mind
+
+    def _run(self, action: str, user_message: str, on_done, session_id: str, job_id: int):
+        try:
+            result = self.big_mind.process_request(user_message, session_id=session_id)
+        except Exception as e:
+            if session_id:
+                self.result_bus.publish(session_id, "error", {"job_id": job_id, "action": action, "error": str(e)})
+            if on_done:
+                on_done(action, e)
+            raise
+        if session_id:
+            self.result_bus.publish(session_id, "result", {
+                "job_id": job_id,
+                "action": action,
+                "decision": result,
+                "summary": describe_result(result)
+            })
+        if on_done:
+            on_done(action, result)
+        return result
+
+    def submit(self, action: str, user_message: str, on_done=None, session_id: str = None) -> Future:
+        """Queue a BigMind request without blocking the caller."""
+        job_id = next(self._job_ids)
+        if session_id:
+            self.result_bus.publish(session_id, "started", {"job_id": job_id, "action": action, "request": user_message})
+        # Carry the caller's context (e.g. the active trace span) into the worker
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, self._run, action, user_message, on_done, session_id, job_id)
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
+
+
+_job_pool = None
+_job_pool_lock = threading.Lock()
+
+
+def get_job_pool() -> BigMindJobPool:
+    """Return the process-wide BigMind job pool."""
+    global _job_pool
+    with _job_pool_lock:
+        if _job_pool is None:
+            _job_pool = BigMindJobPool()
+        return _job_pool
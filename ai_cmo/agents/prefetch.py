@@ -0,0 +1,115 @@
+"""Speculative campaign insight fetching.
+
+Report and insight questions always run SmallMind -> BigMind ->
+Fetch_Campaign_Insight -> Write_Report one after another, so the Graph API
+fetch and the metric summary only start once two model calls have finished.
+A cheap local intent router looks at the user's message as soon as it
+arrives; when it reads as a data question, the insight window it names is
+fetched in the background while SmallMind replies and BigMind decides.
+BigMind then takes the prefetched result if it asks for the same window.
+Prefetches for any other window are never used and expire after a short TTL.
+"""
+import contextvars
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+# Words that mark a question about campaign data rather than creative work or chat
+DATA_INTENT_PATTERN = re.compile(
+    r"\b(reports?|insights?|performance|metrics?|kpis?|ctr|cpc|cpm|roas|spend|spent|impressions|clicks"
+    r"|conversions?|leads|cost per|analytics|how (?:are|is|did|were) (?:my|our|the) (?:ads?|campaigns?))\b",
+    re.IGNORECASE
+)
+DATE_RANGE_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2})\s*(?:-|to|–|until|through)\s*(\d{4}-\d{2}-\d{2})")
+
+
+@dataclass
+class DataIntent:
+    """A data question and the insight window it names (None for the default window)."""
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
+
+def date_window(message: str) -> Tuple[Optional[str], Optional[str]]:
+    """The explicit YYYY-MM-DD to YYYY-MM-DD window in a message, or (None, None)."""
+    match = DATE_RANGE_PATTERN.search(message)
+    return (match.group(1), match.group(2)) if match else (None, None)
+
+
+def detect_data_intent(message: str) -> Optional[DataIntent]:
+    """Return the data intent of a message, or None if it is not about campaign data."""
+    if not message or not DATA_INTENT_PATTERN.search(message):
+        return None
+    return DataIntent(*date_window(message))
+
+
+class InsightPrefetcher:
+    """Fetches insight windows ahead of BigMind and hands them over once.
+
+    Args:
+        fetch (callable): fetch(start_date, end_date) -> dict, the same call
+            BigMind would make for the window.
+        ttl (float): Seconds an unclaimed prefetch is kept before it is discarded.
+        max_workers (int): Prefetches allowed to run at once.
+    """
+
+    def __init__(self, fetch: Callable[[Optional[str], Optional[str]], dict], ttl: float = 120, max_workers: int = 2):
+        self.fetch = fetch
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self.started = 0
+        self.hits = 0
+        self.discarded = 0
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.ttl
+        for key in [key for key, (_, started) in self._entries.items() if started < cutoff]:
+            future, _ = self._entries.pop(key)
+            future.cancel()
+            self.discarded += 1
+
+    def prefetch(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> bool:
+        """Start fetching a window in the background; False if it is already prefetched."""
+        key = (start_date, end_date)
+        with self._lock:
+            self._prune()
+            if key in self._entries:
+                return False
+            context = contextvars.copy_context()
+            future = self.executor.submit(context.run, self.fetch, start_date, end_date)
+            self._entries[key] = (future, time.monotonic())
+            self.started += 1
+        return True
+
+    def maybe_prefetch(self, message: str) -> Optional[DataIntent]:
+        """Prefetch the window of a data question; returns the intent, or None for other messages."""
+        intent = detect_data_intent(message)
+        if intent:
+            self.prefetch(intent.start_date, intent.end_date)
+        return intent
+
+    def take(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+             timeout: float = None) -> Optional[dict]:
+        """Claim the prefetched result for exactly this window, waiting if it is still running.
+
+        Returns None if the window was not prefetched or the prefetch failed;
+        the caller then fetches it itself.
+        """
+        with self._lock:
+            self._prune()
+            entry = self._entries.pop((start_date, end_date), None)
+        if entry is None:
+            return None
+        try:
+            result = entry[0].result(timeout=timeout)
+        except Exception as e:
+            print(f"Prefetch of insight window {start_date} - {end_date} failed: {e}")
+            return None
+        with self._lock:
+            self.hits += 1
+        return result
@@ -0,0 +1,278 @@
+"""Hedged requests with latency-based failover across LLM providers.
+
+SmallMind sits on the latency-critical path of every chat turn. The router
+sends each request to the provider expected to be fastest and, if no valid
+answer has arrived after that provider's recent p95 latency, sends a hedged
+duplicate to the next one. The first valid response wins and the other
+request is cancelled. A provider that errors is failed over immediately, and
+one that keeps failing is taken out of rotation by a circuit breaker until a
+probe request succeeds.
+
+Providers are async callables so that a losing request can actually be
+cancelled (its HTTP connection is closed) rather than left running.
+"""
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from utils.metrics import MetricsRegistry
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class ProviderError(Exception):
+    """Raised when no provider produced a valid response.
+
+    Attributes:
+        errors (Dict[str, Exception]): The last error from each provider tried.
+    """
+
+    def __init__(self, message: str, errors: Dict[str, Exception] = None):
+        super().__init__(message)
+        self.errors = errors or {}
+
+
+@dataclass
+class Provider:
+    """An LLM provider the router may send requests to.
+
+    Attributes:
+        name (str): Name used in metrics and results, e.g. "groq".
+        complete (Callable[..., Awaitable[str]]): complete(messages, **params)
+            returning the reply text.
+    """
+    name: str
+    complete: Callable[..., Awaitable[str]]
+
+
+@dataclass
+class RouterResult:
+    """The winning response.
+
+    Attributes:
+        value (Any): The parsed reply.
+        provider (str): Provider that produced it.
+        latency (float): Seconds from the start of the request.
+        hedged (bool): Whether more than one provider was asked.
+    """
+    value: Any
+    provider: str
+    latency: float
+    hedged: bool
+
+
+class _ProviderState:
+    def __init__(self):
+        self.ewma = None
+        self.updated = 0.0
+        self.failures = 0
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.probing = False
+
+
+class ProviderRouter:
+    """Routes completions across providers with hedging and circuit breakers.
+
+    Args:
+        providers (Sequence[Provider]): In order of preference.
+        hedge_quantile (float): Percentile of the primary's recent latency
+            after which a hedged request is sent.
+        default_hedge_delay (float): Hedge delay until a provider has min_samples latencies.
+        min_hedge_delay (float): Lower bound on the hedge delay, in seconds.
+        max_hedge_delay (float): Upper bound on the hedge delay, in seconds.
+        min_samples (int): Latencies needed before the percentile is trusted.
+        max_hedges (int): Hedged requests sent on a timer per call; failures
+            always fail over to the next provider regardless.
+        ewma_alpha (float): Weight of the newest latency in the moving average.
+        stale_after (float): Seconds after which a provider's average is
+            ignored, so a provider that was slow gets probed again.
+        failure_threshold (int): Consecutive failures that open a provider's breaker.
+        reset_timeout (float): Seconds a breaker stays open before a probe is allowed.
+        timeout (float): Seconds before the whole call gives up.
+    """
+
+    def __init__(self, providers: Sequence[Provider], hedge_quantile: float = 95, default_hedge_delay: float = 1.0,
+                 min_hedge_delay: float = 0.05, max_hedge_delay: float = 5.0, min_samples: int = 10,
+                 max_hedges: int = 1, ewma_alpha: float = 0.2, stale_after: float = 60,
+                 failure_threshold: int = 3, reset_timeout: float = 30, timeout: float = 30):
+        if not providers:
+            raise ValueError("ProviderRouter needs at least one provider")
+        self.providers = list(providers)
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.min_samples = min_samples
+        self.max_hedges = max_hedges
+        self.ewma_alpha = ewma_alpha
+        self.stale_after = stale_after
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.timeout = timeout
+        self.metrics = MetricsRegistry()
+        self._states = {provider.name: _ProviderState() for provider in self.providers}
+        self._lock = threading.Lock()
+
+    # Health tracking
+
+    def state(self, name: str) -> str:
+        """Breaker state of a provider: "closed", "open" or "half_open"."""
+        with self._lock:
+            state = self._states[name]
+            if state.state == OPEN and time.monotonic() - state.opened_at >= self.reset_timeout:
+                state.state = HALF_OPEN
+            return state.state
+
+    def ewma(self, name: str) -> Optional[float]:
+        """Moving average of a provider's latency in seconds, or None if unknown or stale."""
+        with self._lock:
+            state = self._states[name]
+            if state.ewma is None or time.monotonic() - state.updated > self.stale_after:
+                return None
+            return state.ewma
+
+    def hedge_delay(self, name: str) -> float:
+        """Seconds to wait on a provider before hedging."""
+        histogram = self.metrics.histogram(name)
+        if histogram.count >= self.min_samples:
+            delay = histogram.percentile(self.hedge_quantile)
+        else:
+            delay = self.default_hedge_delay
+        return min(self.max_hedge_delay, max(self.min_hedge_delay, delay))
+
+    def _update_ewma(self, state: _ProviderState, seconds: float):
+        state.ewma = seconds if state.ewma is None else self.ewma_alpha * seconds + (1 - self.ewma_alpha) * state.ewma
+        state.updated = time.monotonic()
+
+    def _record_success(self, name: str, seconds: float):
+        self.metrics.histogram(name).record(seconds)
+        with self._lock:
+            state = self._states[name]
+            self._update_ewma(state, seconds)
+            state.failures, state.state, state.probing = 0, CLOSED, False
+
+    def _record_failure(self, name: str, seconds: float):
+        self.metrics.histogram(name).record(seconds, error=True)
+        with self._lock:
+            state = self._states[name]
+            state.failures += 1
+            state.probing = False
+            if state.state == HALF_OPEN or state.failures >= self.failure_threshold:
+                state.state, state.opened_at = OPEN, time.monotonic()
+
+    def _record_cancelled(self, name: str, seconds: float):
+        # The real latency is at least this long, so it may only raise a known average
+        with self._lock:
+            state = self._states[name]
+            state.probing = False
+            if state.ewma is not None and seconds > state.ewma:
+                self._update_ewma(state, seconds)
+
+    def _acquire(self, name: str) -> bool:
+        """Whether a request may go to the provider now; claims the probe if half open."""
+        if self.state(name) == OPEN:
+            return False
+        with self._lock:
+            state = self._states[name]
+            if state.state == HALF_OPEN:
+                if state.probing:
+                    return False
+                state.probing = True
+            return True
+
+    def ranked(self) -> List[Provider]:
+        """Providers whose breaker is not open, fastest known average first."""
+        order = {provider.name: i for i, provider in enumerate(self.providers)}
+        candidates = [provider for provider in self.providers if self.state(provider.name) != OPEN]
+        return sorted(candidates, key=lambda p: (self.ewma(p.name) or float("inf"), order[p.name]))
+
+    # Requests
+
+    async def complete(self, messages: List[dict], parse: Callable[[str], Any] = None, **params) -> RouterResult:
+        """Get the first valid reply to messages from the providers.
+
+        Args:
+            messages (List[dict]): Chat messages.
+            parse (Callable[[str], Any]): Turns the reply text into the result;
+                raising ValueError marks the reply invalid, and the next
+                provider is asked. Defaults to returning the text.
+            **params: Passed to every provider, e.g. temperature and max_tokens.
+
+        Returns:
+            RouterResult: The winning reply.
+
+        Raises:
+            ProviderError: If every available provider failed or the call timed out.
+        """
+        parse = parse or (lambda text: text)
+        started = time.monotonic()
+        queue = self.ranked()
+        attempts = {}  # task -> (provider name, launch time)
+        errors = {}
+        hedges = launches = 0
+
+        def launch() -> bool:
+            nonlocal launches
+            while queue:
+                provider = queue.pop(0)
+                if self._acquire(provider.name):
+                    task = asyncio.ensure_future(provider.complete(messages, **params))
+                    attempts[task] = (provider.name, time.monotonic())
+                    launches += 1
+                    return True
+            return False
+
+        try:
+            if not launch():
+                raise ProviderError("No LLM provider is available right now; please try again shortly")
+            while attempts:
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    for task, (name, launched) in list(attempts.items()):
+                        task.cancel()
+                        self._record_failure(name, time.monotonic() - launched)
+                        errors[name] = TimeoutError(f"{name} timed out")
+                    attempts.clear()
+                    raise ProviderError(f"No provider replied within {self.timeout}s", errors)
+                wait = remaining
+                if hedges < self.max_hedges and queue:
+                    # Hedge once the newest request has run past its provider's p95
+                    name, launched = max(attempts.values(), key=lambda attempt: attempt[1])
+                    wait = min(wait, max(0.0, launched + self.hedge_delay(name) - time.monotonic()))
+                done, _ = await asyncio.wait(list(attempts), timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedges < self.max_hedges and launch():
+                        hedges += 1
+                    continue
+                for task in done:
+                    name, launched = attempts.pop(task)
+                    elapsed = time.monotonic() - launched
+                    try:
+                        value = parse(task.result())
+                    except Exception as e:
+                        errors[name] = e
+                        if isinstance(e, ValueError):
+                            # An unusable reply says nothing about the provider's health
+                            self._record_success(name, elapsed)
+                        else:
+                            self._record_failure(name, elapsed)
+                        continue
+                    self._record_success(name, elapsed)
+                    return RouterResult(value, name, time.monotonic() - started, hedged=launches > 1)
+                # Fail over at once rather than waiting for the hedge timer
+                launch()
+            raise ProviderError(
+                "All LLM providers failed: " + "; ".join(f"{name}: {e}" for name, e in errors.items()), errors
+            )
+        finally:
+            for task, (name, launched) in attempts.items():
+                if task.done():
+                    # Finished alongside the winner; retrieve its outcome so it is not logged as lost
+                    if not task.cancelled():
+                        task.exception()
+                    continue
+                task.cancel()
+                self._record_cancelled(name, time.monotonic() - launched)
@@ -0,0 +1,133 @@
+"""Process-lifetime agents, clients and loggers.
+
+Streamlit re-executes a page script top to bottom on every interaction, so
+anything constructed at module level (agents, SDK clients and their connection
+pools, the prompt logger's writer thread) would be rebuilt on each rerun. The
+getters here build each object once per process, thread-safely, and return
+the same instance afterwards. Pages call them through cached_resource() so the
+objects are also registered with st.cache_resource.
+
+Nothing heavy is imported at module level: agents and SDKs are imported by the
+getter that first needs them, and warm_up() can do that in the background.
+"""
+import functools
+import os
+import threading
+
+_MISSING = object()
+_instances = {}
+_warm_up_started = False
+_warm_up_lock = threading.Lock()
+
+
+def process_singleton(factory):
+    """Decorate a factory so it runs once per process (per distinct arguments)."""
+    lock = threading.Lock()
+
+    @functools.wraps(factory)
+    def getter(*args):
+        key = (factory.__qualname__,) + args
+        instance = _instances.get(key, _MISSING)
+        if instance is _MISSING:
+            with lock:
+                instance = _instances.get(key, _MISSING)
+                if instance is _MISSING:
+                    instance = factory(*args)
+                    _instances[key] = instance
+        return instance
+
+    return getter
+
+
+def reset():
+    """Forget every instance (for tests); the next getter call builds a new one."""
+    _instances.clear()
+
+
+@process_singleton
+def get_small_mind():
+    from agents.small_mind import SmallMind
+    return SmallMind()
+
+
+@process_singleton
+def get_big_mind():
+    from agents.Big_Mind import BigMind
+    return BigMind()
+
+
+@process_singleton
+def get_video_creator():
+    from tools.video_creator import VideoCreator
+    return VideoCreator()
+
+
+@process_singleton
+def get_memory_manager():
+    from utils.memory_manager import MemoryManager
+    # Older turns are summarized by the cheap routing model, off the request path
+    return MemoryManager(summarize=lambda summary, turns: get_small_mind().summarize(summary, turns))
+
+
+@process_singleton
+def get_knowledge_index():
+    from utils.vector_index import VectorIndex
+    return VectorIndex(os.getenv(
+        "VECTOR_INDEX_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory", "vector_index")
+    ))
+
+
+@process_singleton
+def get_insight_prefetcher():
+    from agents.prefetch import InsightPrefetcher
+    from tools.campaign_insight import load_campaign_insight
+    # The same account and token BigMind fetches with
+    return InsightPrefetcher(lambda start_date, end_date: load_campaign_insight(
+        os.getenv("AD_ACCOUNT_ID"), os.getenv("ACCESS_TOKEN"), start_date, end_date
+    ))
+
+
+@process_singleton
+def get_groq_client():
+    from groq import Groq
+    return Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+
+@process_singleton
+def get_prompt_logger(log_file_path: str):
+    from utils.logger import PromptLogger
+    return PromptLogger(log_file_path)
+
+
+def cached_resource(getter):
+    """Wrap a getter with st.cache_resource when Streamlit is installed."""
+    try:
+        import streamlit as st
+    except ImportError:
+        return getter
+    return st.cache_resource(show_spinner=False)(getter)
+
+
+def warm_up():
+    """Build both agents and their SDK clients on a background thread.
+
+    The first page render then does not wait for the SDK imports, and the first
+    request usually finds them done. Only the first call per process starts a thread.
+    """
+    global _warm_up_started
+    with _warm_up_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+
+    def run():
+        try:
+            get_small_mind().client
+            big_mind = get_big_mind()
+            big_mind.client, big_mind.openai_client
+        except Exception as e:
+            # The same error surfaces, with context, when the agent is actually used
+            print(f"Agent warm-up failed: {e}")
+
+    threading.Thread(target=run, name="runtime-warm-up", daemon=True).start()
@@ -1,14 +1,31 @@
-from groq import Groq
+import asyncio
 import json
 import os
+import time
+from functools import cached_property
 from dotenv import load_dotenv
+from agents.prefetch import date_window
+from agents.provider_router import Provider, ProviderError, ProviderRouter
+from utils.batching import AdaptiveBatchSizer
+from utils.tracing import traced, record_llm_usage
 
 load_dotenv()
 
+# Hedge providers for the routing model in order of preference, each used only if its API key is set
+HEDGE_PROVIDERS = {"openai": "OPENAI_API_KEY", "anthropic": "ANTHROPIC_API_KEY"}
+
+BATCH_INSTRUCTIONS = """
+        Batch mode: the user message is a JSON array of messages from different conversations, each
+        with an "id". Decide on each one independently and reply with only this JSON object, holding
+        exactly one entry per id:
+        {"results": [{"id": <id>, "activate_big_mind": ..., "action": ..., "message_to_user": ...}, ...]}
+        """
+# Output tokens allowed per message in a batch, and for the whole batch
+BATCH_TOKENS_PER_ITEM = 150
+BATCH_MAX_TOKENS = 8000
+
 class SmallMind:
     def __init__(self):
-        self.client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        
         self.system_prompt = self.system_prompt = """
         You are an AI Chief Marketing Officer's interface. You handle all communication with users and coordinate with background systems when needed. Your responses should be quick, friendly, and informative.
 
@@ -49,40 +66,262 @@ class SmallMind:
         3. Keep the conversation flowing naturally even when tasks are being processed
         """
 
-    def process_message(self, user_message: str) -> dict:
-        """Process user message and determine if Big Mind needs to be activated."""
+    @cached_property
+    def client(self):
+        """Groq client, imported and built on first use."""
+        from groq import Groq
+        return Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+    @cached_property
+    def async_client(self):
+        """AsyncGroq client for routed requests; bound to the shared background loop."""
+        from groq import AsyncGroq
+        return AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+
+    @cached_property
+    def openai_client(self):
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    @cached_property
+    def anthropic_client(self):
+        from anthropic import AsyncAnthropic
+        return AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+    async def _groq_complete(self, messages: list, **params) -> str:
+        completion = await self.async_client.chat.completions.create(
+            messages=messages, model="llama-3.1-8b-instant", **params
+        )
+        record_llm_usage("llama-3.1-8b-instant", completion)
+        return completion.choices[0].message.content
+
+    async def _openai_complete(self, messages: list, **params) -> str:
+        model = os.getenv("SMALL_MIND_OPENAI_MODEL", "gpt-4o-mini")
+        completion = await self.openai_client.chat.completions.create(messages=messages, model=model, **params)
+        record_llm_usage(model, completion)
+        return completion.choices[0].message.content
+
+    async def _anthropic_complete(self, messages: list, **params) -> str:
+        model = os.getenv("SMALL_MIND_ANTHROPIC_MODEL", "claude-3-5-haiku-latest")
+        response = await self.anthropic_client.messages.create(
+            model=model,
+            system="\n\n".join(m["content"] for m in messages if m["role"] == "system"),
+            messages=[m for m in messages if m["role"] != "system"],
+            **params
+        )
+        record_llm_usage(model, response)
+        return response.content[0].text
+
+    @cached_property
+    def router(self) -> ProviderRouter:
+        """Groq first, hedged to OpenAI and Anthropic small models when their keys are set."""
+        providers = [Provider("groq", self._groq_complete)]
+        for name, key_variable in HEDGE_PROVIDERS.items():
+            if os.getenv(key_variable):
+                providers.append(Provider(name, getattr(self, f"_{name}_complete")))
+        return ProviderRouter(providers)
+
+    @staticmethod
+    def _parse_decision(response_text: str) -> dict:
+        """Extract the JSON decision from a reply; raises ValueError if there is none."""
+        json_start = response_text.find('{')
+        json_end = response_text.rfind('}') + 1
+        result = json.loads(response_text[json_start:json_end])
+        if not isinstance(result, dict) or "message_to_user" not in result:
+            raise ValueError(f"Not a routing decision: {response_text[:200]}")
+        return result
+
+    @cached_property
+    def batch_router(self) -> ProviderRouter:
+        """The same providers for batches, with their own latency stats and no hedging (batches are large)."""
+        return ProviderRouter(self.router.providers, max_hedges=0, timeout=60)
+
+    @cached_property
+    def batch_sizer(self) -> AdaptiveBatchSizer:
+        return AdaptiveBatchSizer(
+            maximum=BATCH_MAX_TOKENS // BATCH_TOKENS_PER_ITEM,
+            target_latency=float(os.getenv("SMALL_MIND_BATCH_TARGET_SECONDS", "3"))
+        )
+
+    @staticmethod
+    def _parse_batch(response_text: str) -> dict:
+        """Map each id to its decision; raises ValueError if the reply holds no usable decision."""
+        try:
+            parsed = json.loads(response_text)
+        except ValueError:
+            # Text around the JSON object
+            json_start = response_text.find('{')
+            json_end = response_text.rfind('}') + 1
+            parsed = json.loads(response_text[json_start:json_end])
+        if not isinstance(parsed, dict):
+            # A formatting slip, not a provider fault: retried in halves like any malformed reply
+            raise ValueError(f"Batch reply is a JSON {type(parsed).__name__}, not an object: {response_text[:200]}")
+        results = parsed.get("results")
+        decisions = {}
+        for item in results if isinstance(results, list) else []:
+            if isinstance(item, dict) and isinstance(item.get("id"), int) and "message_to_user" in item:
+                decisions[item.pop("id")] = item
+        if not decisions:
+            raise ValueError(f"No batch decisions in: {response_text[:200]}")
+        return decisions
+
+    @cached_property
+    def prefetcher(self):
+        """Starts insight fetches for data questions before BigMind asks for them."""
+        from agents.runtime import get_insight_prefetcher
+        return get_insight_prefetcher()
+
+    @cached_property
+    def memory(self):
+        """Process-wide conversation memory, shared with BigMind."""
+        from agents.runtime import get_memory_manager
+        return get_memory_manager()
+
+    @traced("small_mind.summarize")
+    def summarize(self, summary: str, turns: list) -> str:
+        """Fold older conversation turns into the rolling summary."""
+        transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+        completion = self.client.chat.completions.create(
+            messages=[
+                {"role": "system", "content": "You maintain a running summary of a marketing chat. Update the summary with the new turns in under 150 words. Keep requests, decisions, results, names, numbers and dates; drop small talk. Reply with the summary only."},
+                {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew turns:\n{transcript}"}
+            ],
+            model="llama-3.1-8b-instant",
+            temperature=0,
+            max_tokens=300,
+        )
+        record_llm_usage("llama-3.1-8b-instant", completion)
+        return completion.choices[0].message.content.strip()
+
+    @traced("small_mind.process_message")
+    def process_message(self, user_message: str, session_id: str = None) -> dict:
+        """Process user message and determine if Big Mind needs to be activated.
+
+        With a session_id the session's bounded memory is sent along and the
+        exchange is recorded in it. Data questions also start fetching their
+        campaign insight window in the background for BigMind.
+        """
+        from utils.async_runtime import get_async_runtime
+        # Local intent router: a data question starts its insight fetch now, overlapping this reply
+        intent = self.prefetcher.maybe_prefetch(user_message) if self.prefetcher else None
         try:
-            completion = self.client.chat.completions.create(
-                messages=[
+            # Hedged across providers on the shared background loop, so a slow
+            # provider's request can be cancelled once another one answers
+            routed = get_async_runtime().run(self.router.complete(
+                [
                     {"role": "system", "content": self.system_prompt},
+                    *(self.memory.context_messages(session_id) if session_id else []),
                     {"role": "user", "content": user_message}
                 ],
-                model="llama-3.1-8b-instant",  # Replace with llama-3.1-8b-instant when available
+                parse=self._parse_decision,
                 temperature=0.7,
                 max_tokens=1000,
-            )
-            
-            try:
-                # Extract JSON from response
-                response_text = completion.choices[0].message.content
-                json_start = response_text.find('{')
-                json_end = response_text.rfind('}') + 1
-                json_str = response_text[json_start:json_end]
-                return json.loads(json_str)
-            except (json.JSONDecodeError, ValueError):
+            ))
+        except Exception as e:
+            errors = getattr(e, "errors", None)
+            if isinstance(e, ProviderError) and errors and all(isinstance(error, ValueError) for error in errors.values()):
+                # Every provider answered, but not with a usable decision
                 return {
                     "activate_big_mind": False,
                     "action": None,
                     "message_to_user": "I apologize, but I encountered an error processing your request. Could you please rephrase it?"
                 }
-                
-        except Exception as e:
             return {
                 "activate_big_mind": False,
                 "action": None,
                 "message_to_user": f"I encountered an error: {str(e)}. Please try again."
             }
 
+        result = routed.value
+        if self.prefetcher and not intent and result.get("activate_big_mind") and result.get("action") == "Write_Report":
+            # The model saw a report request the keywords missed; BigMind has yet to start
+            self.prefetcher.prefetch(*date_window(user_message))
+        if session_id:
+            self.memory.add_turn(session_id, "user", user_message)
+            self.memory.add_turn(session_id, "assistant", result.get("message_to_user", ""))
+        return result
+
+    async def _classify_batch(self, messages: list, indexes: list, results: list):
+        """Classify messages[i] for i in indexes in one request, splitting the batch on failure."""
+        started = time.monotonic()
+        try:
+            routed = await self.batch_router.complete(
+                [
+                    {"role": "system", "content": self.system_prompt + BATCH_INSTRUCTIONS},
+                    {"role": "user", "content": json.dumps([{"id": i, "message": messages[i]} for i in indexes])}
+                ],
+                parse=self._parse_batch,
+                temperature=0.7,
+                max_tokens=min(BATCH_MAX_TOKENS, BATCH_TOKENS_PER_ITEM * len(indexes) + 100),
+            )
+            decisions, error = routed.value, None
+        except Exception as e:
+            decisions, error = {}, e
+        missing = [i for i in indexes if i not in decisions]
+        self.batch_sizer.record(len(indexes), time.monotonic() - started, ok=not missing)
+        for i in indexes:
+            if i in decisions:
+                results[i] = decisions[i]
+        if not missing:
+            return
+        if len(missing) == 1 and len(indexes) == 1:
+            results[missing[0]] = {
+                "activate_big_mind": False,
+                "action": None,
+                "message_to_user": f"I encountered an error: {error or 'no decision returned'}. Please try again.",
+                "error": str(error or "no decision returned")
+            }
+            return
+        # Retry what is left in halves, so one bad message cannot fail its whole batch
+        middle = (len(missing) + 1) // 2
+        await asyncio.gather(*[
+            self._classify_batch(messages, part, results) for part in (missing[:middle], missing[middle:]) if part
+        ])
+
+    async def _drain(self, messages: list, concurrency: int) -> list:
+        results = [None] * len(messages)
+        pending = list(range(len(messages)))
+
+        async def worker():
+            while pending:
+                # Sized when taken, so every batch uses the latest feedback
+                batch = pending[:self.batch_sizer.size]
+                del pending[:len(batch)]
+                await self._classify_batch(messages, batch, results)
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return results
+
+    @traced("small_mind.process_messages_batch")
+    def process_messages_batch(self, user_messages: list, session_ids: list = None) -> list:
+        """Classify a backlog of messages, many per model request.
+
+        Messages are packed into structured batch requests whose size adapts to
+        the observed latency, with several batches in flight at once. A batch
+        that fails, or that leaves messages out, is retried in halves.
+
+        Args:
+            user_messages (list): Message texts.
+            session_ids (list): Optional session ID per message; each exchange
+                is then recorded in that session's memory. Session history is not
+                sent with batches.
+
+        Returns:
+            list: One process_message-style decision per message, in order.
+                Messages that could not be classified get an error reply and
+                an "error" key.
+        """
+        from utils.async_runtime import get_async_runtime
+        if not user_messages:
+            return []
+        concurrency = int(os.getenv("SMALL_MIND_BATCH_CONCURRENCY", "4"))
+        results = get_async_runtime().run(self._drain(list(user_messages), concurrency))
+        for user_message, session_id, result in zip(user_messages, session_ids or [], results):
+            if session_id and "error" not in result:
+                self.memory.add_turn(session_id, "user", user_message)
+                self.memory.add_turn(session_id, "assistant", result.get("message_to_user", ""))
+        return results
+
 # Example usage
 if __name__ == "__main__":
     small_mind = SmallMind()
@@ -3,22 +3,29 @@ import os
 import sys
 from pathlib import Path
 from dotenv import load_dotenv
-from groq import Groq
 import asyncio
+import uuid
+from datetime import datetime
 
 # Add parent directory to Python path
 parent_dir = str(Path(__file__).parents[1])
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from tools.video_creator import VideoCreator, VideoGenerationConfig, ScriptConfig
+from agents import runtime
+from tools.video_creator import VideoGenerationConfig, ScriptConfig
+from utils.async_runtime import get_async_runtime
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-video_creator = VideoCreator()
+# Built once per process and reused across Streamlit reruns
+client = runtime.cached_resource(runtime.get_groq_client)()
+video_creator = runtime.cached_resource(runtime.get_video_creator)()
+memory = runtime.cached_resource(runtime.get_memory_manager)()
+knowledge = runtime.cached_resource(runtime.get_knowledge_index)()
+# Renders run here, so the page never blocks on them and they share the SDK clients
+async_runtime = get_async_runtime()
 
 def initialize_session_state():
     """Initialize session state variables."""
@@ -32,9 +39,17 @@ def initialize_session_state():
         st.session_state.video_config = None
     if "test_mode" not in st.session_state:
         st.session_state.test_mode = False
+    if "video_jobs" not in st.session_state:
+        st.session_state.video_jobs = []
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
 
-def get_ai_response(prompt, context=None):
-    """Get response from Small Mind (Llama-3.1-8b-instant)."""
+def get_ai_response(prompt, context=None, session_id=None):
+    """Get response from Small Mind (Llama-3.1-8b-instant).
+
+    The session's bounded memory (key facts, rolling summary and recent turns)
+    is sent along, so the prompt stays the same size as the chat grows.
+    """
     system_message = """You are an AI Chief Marketing Officer. You help with marketing strategy, content creation, and campaign management. 
     When users upload images for video creation:
     1. Ask them about their desired video style and creative direction
@@ -46,7 +61,8 @@ def get_ai_response(prompt, context=None):
     For complex tasks, you defer to Big Mind, but for quick strategic advice and simple queries, you handle them directly."""
     
     messages = [
-        {"role": "system", "content": system_message}
+        {"role": "system", "content": system_message},
+        *memory.context_messages(session_id)
     ]
     
     if context:
@@ -61,11 +77,14 @@ def get_ai_response(prompt, context=None):
             temperature=0.7,
             max_tokens=1000,
         )
-        return completion.choices[0].message.content
+        response = completion.choices[0].message.content
+        memory.add_turn(session_id, "user", prompt)
+        memory.add_turn(session_id, "assistant", response)
+        return response
     except Exception as e:
         return f"Error: {str(e)}"
 
-async def generate_video(image_path: str, prompt: str, duration: str, aspect_ratio: str, script_enabled: bool = False, script_text: str = None):
+async def generate_video(image_path: str, prompt: str, duration: str, aspect_ratio: str, script_enabled: bool = False, script_text: str = None, progress=None):
     """Generate video using the VideoCreator.
     
     Args:
@@ -75,6 +94,7 @@ async def generate_video(image_path: str, prompt: str, duration: str, aspect_rat
         aspect_ratio (str): Video aspect ratio ("16:9", "9:16", or "1:1").
         script_enabled (bool, optional): Whether to generate a script. Defaults to False.
         script_text (str, optional): Custom script text. Defaults to None.
+        progress (callable, optional): Receives a message as each stage starts.
     """
     config = VideoGenerationConfig(
         prompt=prompt,
@@ -86,7 +106,71 @@ async def generate_video(image_path: str, prompt: str, duration: str, aspect_rat
             base_script=script_text
         )
     )
-    return await video_creator.create_video(config)
+    try:
+        return await video_creator.create_video(config, progress=progress)
+    finally:
+        Path(image_path).unlink(missing_ok=True)
+
+def start_video_job(uploaded_file, prompt, duration, aspect_ratio, script_enabled=False, script_text=None):
+    """Save the uploaded image and start rendering it on the background runtime."""
+    temp_dir = Path("temp")
+    temp_dir.mkdir(exist_ok=True)
+    # Unique name so concurrent renders of the same upload don't share a file
+    image_path = temp_dir / f"{uuid.uuid4().hex}_{uploaded_file.name}"
+    with open(image_path, "wb") as f:
+        f.write(uploaded_file.getbuffer())
+
+    session_id = st.session_state.session_id
+
+    async def render(report):
+        result = await generate_video(
+            str(image_path), prompt, duration, aspect_ratio, script_enabled, script_text, progress=report
+        )
+        # Lets a later "post that video" resolve to this render
+        memory.set_slot(session_id, "video_url", result["video"]["url"])
+        # Creative metadata goes into the retrieval index Big Mind searches
+        description = f"Video ad ({duration}s, {aspect_ratio}): {prompt}"
+        if result.get("script"):
+            description += f"\nScript: {result['script']}"
+        await asyncio.to_thread(knowledge.add, [description], [{
+            "source": "creative", "video_url": result["video"]["url"],
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }])
+        return result
+
+    job = async_runtime.start_job(prompt[:60], render)
+    st.session_state.video_jobs.append(job)
+    return job
+
+def show_video_result(video_result):
+    """Display a finished render."""
+    if "video" in video_result and "url" in video_result["video"]:
+        st.success("✅ Video generated successfully!")
+        st.video(video_result["video"]["url"])
+
+        # Show script if it was generated
+        if "script" in video_result:
+            st.info("📝 Generated Script:")
+            st.text(video_result["script"])
+
+        # Add direct link
+        st.markdown(f"[📥 Download Video]({video_result['video']['url']})")
+    else:
+        st.error("❌ Failed to generate video - Invalid response format")
+        st.json(video_result)  # Show raw response for debugging
+
+@st.fragment(run_every=2)
+def show_video_jobs():
+    """Poll the session's renders; only this fragment reruns, so chatting is unaffected."""
+    for job in reversed(st.session_state.video_jobs):
+        with st.expander(f"🎬 {job.label}", expanded=job.status != "failed"):
+            if job.status == "running":
+                st.info(f"⏳ {job.last_progress}...")
+            elif job.status == "failed":
+                error = job.future.exception() if not job.future.cancelled() else "Cancelled"
+                st.error(f"❌ Error generating video: {error}")
+            else:
+                show_video_result(job.future.result())
 
 def main():
     st.title("AI Chief Marketing Officer 🎯")
@@ -137,43 +221,8 @@ def main():
                 )
                 
                 if st.button("🚀 Test Video Generation"):
-                    with st.spinner("Generating video..."):
-                        try:
-                            # Save uploaded image temporarily
-                            temp_dir = Path("temp")
-                            temp_dir.mkdir(exist_ok=True)
-                            image_path = temp_dir / uploaded_file.name
-                            with open(image_path, "wb") as f:
-                                f.write(uploaded_file.getbuffer())
-                            
-                            # Generate video with test parameters
-                            video_result = asyncio.run(generate_video(
-                                str(image_path),
-                                test_prompt,
-                                duration,
-                                aspect_ratio,
-                                script_enabled,
-                                script_text
-                            ))
-                            
-                            # Display video result
-                            if "video" in video_result and "url" in video_result["video"]:
-                                st.success("✅ Video generated successfully!")
-                                st.video(video_result["video"]["url"])
-                                
-                                # Show script if it was generated
-                                if "script" in video_result:
-                                    st.info("📝 Generated Script:")
-                                    st.text(video_result["script"])
-                            else:
-                                st.error("❌ Failed to generate video")
-                                st.json(video_result)  # Show raw response for debugging
-                            
-                            # Cleanup
-                            image_path.unlink()
-                        except Exception as e:
-                            st.error(f"❌ Error generating video: {str(e)}")
-                            st.exception(e)  # Show full traceback for debugging
+                    start_video_job(uploaded_file, test_prompt, duration, aspect_ratio, script_enabled, script_text)
+                    st.toast("📤 Video generation started")
             
             if "video_config" not in st.session_state or st.session_state.video_config is None:
                 st.session_state.video_config = {
@@ -206,7 +255,7 @@ def main():
                     if st.session_state.uploaded_image and not st.session_state.video_config["prompt"]:
                         context = "I see you've uploaded an image! Let me help you create a video from it. "
                     
-                    response = get_ai_response(prompt, context)
+                    response = get_ai_response(prompt, context, st.session_state.session_id)
                     st.write(response)
                     st.session_state.messages.append({"role": "assistant", "content": response})
                     
@@ -216,53 +265,20 @@ def main():
                         
                         # Generate video button
                         if st.button("Generate Video"):
-                            with st.spinner("Generating video... This may take a few minutes"):
-                                try:
-                                    # Save uploaded image temporarily
-                                    temp_dir = Path("temp")
-                                    temp_dir.mkdir(exist_ok=True)
-                                    image_path = temp_dir / uploaded_file.name
-                                    with open(image_path, "wb") as f:
-                                        f.write(uploaded_file.getbuffer())
-                                    
-                                    # Show progress message
-                                    progress_placeholder = st.empty()
-                                    progress_placeholder.info("📤 Uploading image and initializing video generation...")
-                                    
-                                    # Generate video
-                                    video_result = asyncio.run(generate_video(
-                                        str(image_path),
-                                        st.session_state.video_config["prompt"],
-                                        st.session_state.video_config["duration"],
-                                        st.session_state.video_config["aspect_ratio"],
-                                        st.session_state.video_config["script_enabled"],
-                                        st.session_state.video_config["script_text"]
-                                    ))
-                                    
-                                    # Update progress
-                                    progress_placeholder.info("✨ Video generation completed!")
-                                    
-                                    # Display video result
-                                    if "video" in video_result and "url" in video_result["video"]:
-                                        st.success(f"✅ Video generated successfully!")
-                                        st.video(video_result["video"]["url"])
-                                        
-                                        # Show script if it was generated
-                                        if "script" in video_result:
-                                            st.info("📝 Generated Script:")
-                                            st.text(video_result["script"])
-                                        
-                                        # Add direct link
-                                        st.markdown(f"[📥 Download Video]({video_result['video']['url']})")
-                                    else:
-                                        st.error("❌ Failed to generate video - Invalid response format")
-                                        st.json(video_result)  # Show raw response for debugging
-                                    
-                                    # Cleanup
-                                    image_path.unlink()
-                                except Exception as e:
-                                    st.error(f"❌ Error generating video: {str(e)}")
-                                    st.exception(e)  # Show full traceback for debugging
+                            config = st.session_state.video_config
+                            start_video_job(
+                                uploaded_file,
+                                config["prompt"],
+                                config["duration"],
+                                config["aspect_ratio"],
+                                config["script_enabled"],
+                                config["script_text"]
+                            )
+                            st.toast("📤 Video generation started - keep chatting, it will appear below")
+
+    # Renders in progress or finished this session
+    if st.session_state.video_jobs:
+        show_video_jobs()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
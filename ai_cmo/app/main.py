@@ -1,29 +1,35 @@
 import streamlit as st
 import sys
 import os
-import threading
+import uuid
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from dotenv import load_dotenv
-from agents.small_mind import SmallMind
-from agents.Big_Mind import BigMind
-from utils.logger import PromptLogger
-from tools.visuals import process_campaign_data, plot_campaign_metrics, get_campaign_data
+from agents import runtime
+from agents.job_pool import get_job_pool
+from utils.result_bus import get_result_bus
+from utils.tracing import traced
 
 # Load environment variables
 load_dotenv()
 
-# Initialize agents
-small_mind = SmallMind()
-big_mind = BigMind()
+# Agents, their clients and the logger live for the whole process; Streamlit
+# reruns this script on every interaction and gets the same instances back
+small_mind = runtime.cached_resource(runtime.get_small_mind)()
+big_mind = runtime.cached_resource(runtime.get_big_mind)()
+# Import the SDKs and build the clients while the first page renders
+runtime.warm_up()
 
 # Initialize logger
 current_dir = os.path.dirname(os.path.abspath(__file__))
-logger = PromptLogger(os.path.join(current_dir, 'current_prompt.txt'))
+logger = runtime.cached_resource(runtime.get_prompt_logger)(os.path.join(current_dir, 'current_prompt.jsonl'))
 
 def initialize_session_state():
     """Initialize session state variables."""
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    if "session_id" not in st.session_state:
+        # Key for this browser session's Big Mind results on the result bus
+        st.session_state.session_id = uuid.uuid4().hex
     if "conversation_active" not in st.session_state:
         st.session_state.conversation_active = False
         # Log new conversation start
@@ -32,10 +38,10 @@ def initialize_session_state():
             "New conversation started"
         )
 
-def execute_big_mind_task(action: str, user_message: str):
-    """Execute Big Mind task in background"""
-    big_mind_response = big_mind.process_request(user_message)
-    # Log Big Mind's response
+def on_big_mind_done(action: str, big_mind_response):
+    """Log Big Mind's response (or error) from the job pool's worker thread"""
+    if isinstance(big_mind_response, Exception):
+        big_mind_response = {"error": str(big_mind_response)}
     logger.log_interaction(
         "BIG_MIND",
         big_mind_response
@@ -43,7 +49,8 @@ def execute_big_mind_task(action: str, user_message: str):
     # Here you would handle the actual tool execution
     print(f"Big Mind executing task: {action}")  # For debugging
 
-def process_request(user_message: str):
+@traced("streamlit.process_request")
+def process_request(user_message: str, session_id: str = None):
     """Process user request through Small Mind and potentially trigger Big Mind"""
     # Log user message
     logger.log_interaction(
@@ -52,7 +59,7 @@ def process_request(user_message: str):
     )
     
     # Get Small Mind's response
-    small_mind_response = small_mind.process_message(user_message)
+    small_mind_response = small_mind.process_message(user_message, session_id=session_id)
     
     # Log Small Mind's response
     logger.log_interaction(
@@ -60,17 +67,40 @@ def process_request(user_message: str):
         small_mind_response
     )
     
-    # If Big Mind needs to be activated, do it in background
+    # If Big Mind needs to be activated, do it in background on the shared,
+    # bounded pool rather than a new thread per request; its result is pushed
+    # back to this session through the result bus
     if small_mind_response["activate_big_mind"]:
-        thread = threading.Thread(
-            target=execute_big_mind_task,
-            args=(small_mind_response["action"], user_message)
+        get_job_pool().submit(
+            small_mind_response["action"], user_message,
+            on_done=on_big_mind_done, session_id=session_id
         )
-        thread.start()
     
     # Return Small Mind's message to user
     return small_mind_response["message_to_user"]
 
+@st.fragment(run_every=2)
+def show_big_mind_results():
+    """Render Big Mind results for this session as they land on the result bus.
+
+    Only this fragment reruns while polling; events are replayed from the bus,
+    so results are still shown after a full rerun or page refresh.
+    """
+    pending = {}
+    for event in get_result_bus().events(st.session_state.session_id):
+        if event.kind == "started":
+            pending[event.payload["job_id"]] = event.payload["action"]
+            continue
+        pending.pop(event.payload["job_id"], None)
+        with st.chat_message("assistant", avatar="🧠"):
+            if event.kind == "result":
+                st.write(event.payload["summary"])
+            else:
+                st.error(f"Big Mind could not finish {event.payload['action']}: {event.payload['error']}")
+    for action in pending.values():
+        st.caption(f"🧠 Big Mind is working on {action}...")
+
+@traced("streamlit.rerun")
 def main():
     st.title("AI Chief Marketing Officer 🎯")
     
@@ -91,11 +121,14 @@ def main():
         
         # Get AI response (only from Small Mind)
         with st.chat_message("assistant"):
-            response = process_request(prompt)
+            response = process_request(prompt, st.session_state.session_id)
             st.write(response)
             st.session_state.messages.append({"role": "assistant", "content": response})
 
         if "report" in prompt.lower():
+            # pandas and plotly are only loaded once a report is asked for
+            from tools.visuals import process_campaign_data, plot_campaign_metrics, get_campaign_data
+
             # Table
             st.markdown("##### Campaign Data Overview")
             df_for_plot = process_campaign_data()
@@ -112,5 +145,8 @@ def main():
             """
             st.components.v1.html(response_html, height=150, scrolling=False)
 
+    # Big Mind results for this session, pushed in as background jobs finish
+    show_big_mind_results()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,25 +1,26 @@
 import streamlit as st
 import sys
 import os
+import uuid
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from dotenv import load_dotenv
-from agents.small_mind import SmallMind
-from agents.Big_Mind import BigMind
-from utils.logger import PromptLogger
+from agents import runtime
+from agents.job_pool import get_job_pool
 from elevenlabs import ElevenLabs
 from elevenlabs.conversational_ai.conversation import Conversation, ClientTools
 from elevenlabs.conversational_ai.default_audio_interface import DefaultAudioInterface
+from utils.result_bus import get_result_bus
 
 # Load environment variables
 load_dotenv()
 
-# Initialize agents
-small_mind = SmallMind()
-big_mind = BigMind()
+# Agents and logger are shared across Streamlit reruns
+small_mind = runtime.cached_resource(runtime.get_small_mind)()
+big_mind = runtime.cached_resource(runtime.get_big_mind)()
 
 # Initialize logger
 current_dir = os.path.dirname(os.path.abspath(__file__))
-logger = PromptLogger(os.path.join(current_dir, 'current_prompt.txt'))
+logger = runtime.cached_resource(runtime.get_prompt_logger)(os.path.join(current_dir, 'current_prompt.jsonl'))
 
 # Initialize session state
 if 'messages' not in st.session_state:
@@ -28,22 +29,26 @@ if 'conversation_active' not in st.session_state:
     st.session_state.conversation_active = False
 if 'conversation' not in st.session_state:
     st.session_state.conversation = None
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'unsubscribe_results' not in st.session_state:
+    st.session_state.unsubscribe_results = None
 
-def process_small_mind(parameters):
+def process_small_mind(parameters, session_id=None):
     """Client tool to process Small Mind response"""
     user_message = parameters.get("message")
-    small_mind_response = small_mind.process_message(user_message)
+    small_mind_response = small_mind.process_message(user_message, session_id=session_id)
     
     # Log Small Mind's response
     logger.log_interaction("SMALL_MIND", small_mind_response)
     
-    # If Big Mind needs to be activated, do it in background
+    # If Big Mind needs to be activated, do it in background; the result is
+    # published to this session and spoken by the agent when it lands
     if small_mind_response["activate_big_mind"]:
-        thread = threading.Thread(
-            target=execute_big_mind_task,
-            args=(small_mind_response["action"], user_message)
+        get_job_pool().submit(
+            small_mind_response["action"], user_message,
+            on_done=log_big_mind_result, session_id=session_id
         )
-        thread.start()
     
     # Return response for voice output
     return {
@@ -52,11 +57,21 @@ def process_small_mind(parameters):
         "action_type": small_mind_response["action"]
     }
 
-def execute_big_mind_task(action: str, user_message: str):
-    """Execute Big Mind task in background"""
-    big_mind_response = big_mind.process_request(user_message)
+def log_big_mind_result(action: str, big_mind_response):
+    """Log Big Mind's response (or error) from the job pool's worker thread"""
+    if isinstance(big_mind_response, Exception):
+        big_mind_response = {"error": str(big_mind_response)}
     logger.log_interaction("BIG_MIND", big_mind_response)
-    print(f"Big Mind executing task: {action}")
+    print(f"Big Mind finished task: {action}")
+
+def tell_agent(conversation):
+    """Result bus subscriber that passes finished Big Mind results to the voice agent"""
+    def on_event(event):
+        if event.kind == "result":
+            conversation.send_contextual_update(f"Big Mind finished {event.payload['action']}: {event.payload['summary']}")
+        elif event.kind == "error":
+            conversation.send_contextual_update(f"Big Mind could not finish {event.payload['action']}: {event.payload['error']}")
+    return on_event
 
 def update_chat_history(role, content):
     """Update chat history in a thread-safe way"""
@@ -75,12 +90,23 @@ def log_user_transcript(transcript):
         logger.log_interaction("USER", transcript)
         st.rerun()
 
+@st.fragment(run_every=2)
+def show_big_mind_results():
+    """Replay this session's Big Mind results from the result bus"""
+    for event in get_result_bus().events(st.session_state.session_id):
+        if event.kind == "result":
+            with st.chat_message("assistant", avatar="🧠"):
+                st.write(event.payload["summary"])
+        elif event.kind == "error":
+            st.error(f"Big Mind could not finish {event.payload['action']}: {event.payload['error']}")
+
 def main():
     st.title("AI Chief Marketing Officer 🎯 - Voice Edition")
     
     # Setup client tools
     client_tools = ClientTools()
-    client_tools.register("processSmallMind", process_small_mind)
+    session_id = st.session_state.session_id
+    client_tools.register("processSmallMind", lambda parameters: process_small_mind(parameters, session_id))
     
     # Start/Stop conversation button
     if st.button("Toggle Voice Conversation"):
@@ -94,12 +120,18 @@ def main():
                     audio_interface=DefaultAudioInterface()
                 )
                 st.session_state.conversation.start_session()
+                st.session_state.unsubscribe_results = get_result_bus().subscribe(
+                    session_id, tell_agent(st.session_state.conversation)
+                )
                 st.session_state.conversation_active = True
                 st.write("Voice conversation active - speak to interact")
             except Exception as e:
                 st.error(f"Error starting conversation: {e}")
         else:
             try:
+                if st.session_state.unsubscribe_results:
+                    st.session_state.unsubscribe_results()
+                    st.session_state.unsubscribe_results = None
                 if st.session_state.conversation:
                     st.session_state.conversation.end_session()
                 st.session_state.conversation_active = False
@@ -113,6 +145,9 @@ def main():
         with st.chat_message(message["role"]):
             st.write(message["content"])
     
+    # Big Mind results for this session, as they land
+    show_big_mind_results()
+
     # Display conversation status
     if st.session_state.conversation_active:
         status_placeholder = st.empty()
@@ -0,0 +1,111 @@
+"""Import-time benchmark for the modules on the Streamlit cold-start path.
+
+Each module is imported in a fresh interpreter with `python -X importtime`,
+so nothing is shared between samples. The report gives the median cumulative
+import time per module, the heaviest dependencies it pulled in, and whether
+any SDK that is meant to be lazily imported was loaded anyway. With
+--budget-ms the run fails if a module's median exceeds the budget.
+
+    python -m benchmarks.import_time --repeat 5 --output import_time.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+AI_CMO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "agents.runtime",
+    "agents.small_mind",
+    "agents.Big_Mind",
+    "tools.video_creator",
+    "tools.campaign_insight",
+    "utils.logger",
+]
+# Imported on first use only; none of them should load with the modules above
+LAZY_SDKS = ["anthropic", "openai", "groq", "elevenlabs", "fal_client", "pandas", "plotly"]
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$')
+
+
+def parse_importtime(stderr: str) -> list:
+    """Parse `-X importtime` output into (module, self_us, cumulative_us, depth) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def sample_import(module: str) -> list:
+    """Import module in a fresh interpreter and return its importtime rows."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=AI_CMO_DIR, capture_output=True, text=True,
+        env={**os.environ, "PYTHONPATH": AI_CMO_DIR, "PYTHONDONTWRITEBYTECODE": "1"}
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def measure(module: str, repeat: int, top: int = 5) -> dict:
+    totals = []
+    rows = []
+    for _ in range(repeat):
+        rows = sample_import(module)
+        totals.append(next((row[2] for row in rows if row[0] == module), 0) / 1000)
+
+    loaded = {row[0] for row in rows}
+    # Rows are printed as imports finish, so the module's direct dependencies are
+    # the depth-1 rows between it and the previous top-level import
+    dependencies = []
+    end = next((i for i, row in enumerate(rows) if row[0] == module and row[3] == 0), 0)
+    for row in reversed(rows[:end]):
+        if row[3] == 0:
+            break
+        if row[3] == 1:
+            dependencies.append(row)
+    heaviest = sorted(dependencies, key=lambda row: row[2], reverse=True)[:top]
+    return {
+        "module": module,
+        "median_ms": statistics.median(totals),
+        "min_ms": min(totals),
+        "max_ms": max(totals),
+        "modules_loaded": len(loaded),
+        "eager_sdks": [sdk for sdk in LAZY_SDKS if sdk in loaded],
+        "heaviest": [{"module": row[0], "cumulative_ms": row[2] / 1000} for row in heaviest],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cold import time of the app modules.")
+    parser.add_argument("--modules", default=",".join(DEFAULT_MODULES))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, help="Fail when a module's median import exceeds this.")
+    parser.add_argument("--output", help="Write results JSON here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    results = [measure(module, args.repeat) for module in args.modules.split(",") if module]
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    over_budget = [r["module"] for r in results if args.budget_ms and r["median_ms"] > args.budget_ms]
+    if over_budget:
+        print(f"Over the {args.budget_ms}ms import budget: {', '.join(over_budget)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
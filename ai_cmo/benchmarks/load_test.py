@@ -0,0 +1,360 @@
+"""Load test for the voiceover Quart server.
+
+Virtual users repeat the creative flow (upload a video, generate scripts,
+generate the voiceover, combine, fetch the final video) against the app served
+by Hypercorn, with every provider replaced by the local stub server. The
+report has requests/sec and latency percentiles per step, event-loop lag on
+the server loop and the number of concurrent ffmpeg processes.
+
+Pass several user counts to ramp up and find how many concurrent creatives
+the box sustains within the p95 objective:
+
+    python -m benchmarks.load_test --users 1,2,4,8,16 --iterations 5 --slo-p95-ms 20000
+
+With --url the flow runs against an already running server (e.g. launched
+with tools/test_pages/hypercorn_config.py); loop lag is then not available.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+
+from benchmarks.run_benchmarks import load_voiceover_app
+from benchmarks.stub_providers import StubProviderServer
+from utils.loop_lag import LoopLagMonitor
+from utils.metrics import LatencyHistogram
+
+STEPS = ["upload", "generate-scripts", "generate", "combine", "video"]
+
+# Placeholder MP4 header; pass --video with a real clip to exercise ffmpeg
+PLACEHOLDER_VIDEO = b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 256 * 1024
+
+
+def count_processes(name: str = "ffmpeg"):
+    """Count running processes by executable name (Linux /proc; None elsewhere)."""
+    if not os.path.isdir("/proc"):
+        return None
+    count = 0
+    for pid in os.listdir("/proc"):
+        if not pid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{pid}/comm", "r") as f:
+                if f.read().strip() == name:
+                    count += 1
+        except OSError:
+            continue
+    return count
+
+
+class ProcessSampler:
+    """Samples the ffmpeg process count on a background thread."""
+
+    def __init__(self, name: str = "ffmpeg", interval: float = 0.05):
+        self.name = name
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            count = count_processes(self.name)
+            if count is None:
+                return
+            self.samples.append(count)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {"available": False}
+        return {
+            "available": True,
+            "max_concurrent": max(self.samples),
+            "mean_concurrent": sum(self.samples) / len(self.samples),
+        }
+
+
+class ServerThread:
+    """Serves the voiceover app with Hypercorn on a background event loop.
+
+    A LoopLagMonitor runs on the same loop, so blocking handlers show up as lag.
+    """
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.monitor = None
+        self._ready = threading.Event()
+        self._loop = None
+        self._shutdown = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def _run(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        import socket
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+
+        if not self.port:
+            with socket.socket() as s:
+                s.bind((self.host, 0))
+                self.port = s.getsockname()[1]
+        config = Config()
+        config.bind = [f"{self.host}:{self.port}"]
+        config.accesslog = None
+        config.loglevel = "WARNING"
+        config.backlog = 2048
+
+        self._loop = asyncio.get_running_loop()
+        self._shutdown = asyncio.Event()
+        self.monitor = LoopLagMonitor().start()
+
+        async def on_started():
+            # Wait for the socket to accept before releasing the caller
+            while True:
+                try:
+                    _, writer = await asyncio.open_connection(self.host, self.port)
+                    writer.close()
+                    break
+                except OSError:
+                    await asyncio.sleep(0.01)
+            self._ready.set()
+
+        started = asyncio.create_task(on_started())
+        await serve(self.app, config, shutdown_trigger=self._shutdown.wait)
+        started.cancel()
+        await self.monitor.stop()
+
+    def reset_monitor(self):
+        """Start a fresh lag monitor (called between ramp stages)."""
+        async def restart():
+            await self.monitor.stop()
+            self.monitor = LoopLagMonitor().start()
+        asyncio.run_coroutine_threadsafe(restart(), self._loop).result()
+
+    def start(self) -> "ServerThread":
+        self._thread.start()
+        if not self._ready.wait(30):
+            raise RuntimeError("voiceover server did not start")
+        return self
+
+    def stop(self):
+        self._loop.call_soon_threadsafe(self._shutdown.set)
+        self._thread.join(timeout=30)
+
+
+async def run_user(client, user: int, iterations: int, steps: list, video_bytes: bytes,
+                   histograms: dict, flows: LatencyHistogram, think: float):
+    """One virtual user running the creative flow iterations times."""
+
+    async def timed(step, call):
+        start = time.perf_counter()
+        try:
+            response = await call()
+            failed = response.status_code >= 400
+        except Exception:
+            response, failed = None, True
+        histograms[step].record(time.perf_counter() - start, error=failed)
+        return None if failed else response
+
+    for i in range(iterations):
+        flow_start = time.perf_counter()
+        flow_failed = False
+        video_path = video_url = audio_url = None
+        text = f"Lower your energy bills. Book a survey with user {user} today."
+
+        if "upload" in steps:
+            files = {"video": (f"load_{user}_{i}.mp4", video_bytes, "video/mp4")}
+            response = await timed("upload", lambda: client.post("/api/upload-video", files=files))
+            if response is not None:
+                video_path, video_url = response.json()["video_path"], response.json()["video_url"]
+            flow_failed |= response is None
+
+        if "generate-scripts" in steps:
+            payload = {"prompt": f"Heat pump ad for user {user}", "duration": "15"}
+            response = await timed("generate-scripts", lambda: client.post("/api/generate-scripts", json=payload))
+            if response is not None and response.json().get("scripts"):
+                text = response.json()["scripts"][0]
+            flow_failed |= response is None
+
+        if "generate" in steps:
+            # Vary the text per iteration so each request writes its own audio file
+            payload = {"text": f"{text} ({user}-{i})", "voice": "JBFqnCBsd6RMkjVDRZzb"}
+            response = await timed("generate", lambda: client.post("/api/generate", json=payload))
+            if response is not None:
+                audio_url = response.json()["audio_url"]
+            flow_failed |= response is None
+
+        if "combine" in steps and video_path and audio_url:
+            payload = {"video_path": video_path, "audio_url": audio_url, "text": text, "duration": "15"}
+            response = await timed("combine", lambda: client.post("/api/combine", json=payload))
+            if response is not None:
+                video_url = response.json()["video_url"]
+            flow_failed |= response is None
+
+        if "video" in steps and video_url:
+            response = await timed("video", lambda: client.get(video_url))
+            flow_failed |= response is None
+
+        flows.record(time.perf_counter() - flow_start, error=flow_failed)
+        if think:
+            await asyncio.sleep(think)
+
+
+def summarize_step(name: str, histogram: LatencyHistogram, wall: float) -> dict:
+    stats = histogram.summary()
+    return {
+        "step": name,
+        "requests": stats["count"],
+        "errors": stats["errors"],
+        "rps": stats["count"] / wall if wall else 0.0,
+        "p50_ms": stats["p50_ms"],
+        "p95_ms": stats["p95_ms"],
+        "p99_ms": stats["p99_ms"],
+        "max_ms": stats["max_ms"],
+    }
+
+
+async def run_stage(base_url: str, users: int, iterations: int, steps: list,
+                    video_bytes: bytes, think: float = 0.0) -> dict:
+    """Run users concurrent virtual users and summarise their requests."""
+    import httpx
+
+    histograms = {step: LatencyHistogram(max_samples=users * iterations) for step in steps}
+    flows = LatencyHistogram(max_samples=users * iterations)
+    limits = httpx.Limits(max_connections=users * 2, max_keepalive_connections=users * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            run_user(client, user, iterations, steps, video_bytes, histograms, flows, think)
+            for user in range(users)
+        ))
+        wall = time.perf_counter() - start
+
+    step_results = [summarize_step(step, histograms[step], wall) for step in steps if histograms[step].summary()["count"]]
+    flow_stats = flows.summary()
+    return {
+        "users": users,
+        "wall_s": wall,
+        "requests": sum(result["requests"] for result in step_results),
+        "rps": sum(result["requests"] for result in step_results) / wall if wall else 0.0,
+        "flows": flow_stats["count"],
+        "flows_per_min": flow_stats["count"] / wall * 60 if wall else 0.0,
+        "flow_errors": flow_stats["errors"],
+        "flow_p50_ms": flow_stats["p50_ms"],
+        "flow_p95_ms": flow_stats["p95_ms"],
+        "steps": step_results,
+    }
+
+
+def within_slo(stage: dict, slo_p95_ms: float, max_error_rate: float) -> bool:
+    error_rate = stage["flow_errors"] / stage["flows"] if stage["flows"] else 1.0
+    return error_rate <= max_error_rate and (not slo_p95_ms or stage["flow_p95_ms"] <= slo_p95_ms)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test the voiceover Quart server.")
+    parser.add_argument("--users", default="4",
+                        help="Concurrent virtual users; a comma-separated list ramps through stages.")
+    parser.add_argument("--iterations", type=int, default=3, help="Flows per user per stage.")
+    parser.add_argument("--steps", default=",".join(STEPS))
+    parser.add_argument("--think", type=float, default=0.0, help="Seconds each user waits between flows.")
+    parser.add_argument("--video", help="Video file to upload (a real clip is needed for combine to succeed).")
+    parser.add_argument("--url", help="Target a running server instead of serving the app in-process.")
+    parser.add_argument("--time-scale", type=float, default=0.05,
+                        help="Multiplier on recorded provider latencies (1.0 = production-like).")
+    parser.add_argument("--latency", action="append", default=[], metavar="PROVIDER=SPEC")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--slo-p95-ms", type=float, default=0.0, help="Flow p95 objective for --users ramps.")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-loop-lag-ms", type=float, default=0.0,
+                        help="Exit non-zero when the server loop stalls longer than this.")
+    parser.add_argument("--output", help="Write results JSON here instead of stdout.")
+    args = parser.parse_args(argv)
+
+    steps = [step for step in args.steps.split(",") if step]
+    unknown = set(steps) - set(STEPS)
+    if unknown:
+        parser.error(f"unknown steps: {', '.join(sorted(unknown))}")
+    user_stages = [int(users) for users in args.users.split(",")]
+    video_bytes = PLACEHOLDER_VIDEO
+    if args.video:
+        with open(args.video, "rb") as f:
+            video_bytes = f.read()
+
+    latency = dict(item.split("=", 1) for item in args.latency)
+    stages = []
+    with StubProviderServer(latency=latency, time_scale=args.time_scale, seed=args.seed) as stub:
+        server = None
+        if args.url:
+            base_url = args.url
+        else:
+            os.environ.update(stub.env())
+            os.environ.setdefault("VOICEOVER_LOG_LEVEL", "WARNING")
+            os.environ.setdefault("VOICEOVER_LOG_FILE", "")
+            server = ServerThread(load_voiceover_app().app).start()
+            base_url = server.url
+
+        try:
+            for users in user_stages:
+                if server:
+                    server.reset_monitor()
+                with ProcessSampler("ffmpeg") as sampler:
+                    stage = asyncio.run(run_stage(base_url, users, args.iterations, steps, video_bytes, args.think))
+                stage["ffmpeg"] = sampler.summary()
+                stage["loop_lag"] = server.monitor.summary() if server else None
+                stage["within_slo"] = within_slo(stage, args.slo_p95_ms, args.max_error_rate)
+                stages.append(stage)
+        finally:
+            if server:
+                server.stop()
+
+        sustained = [stage["users"] for stage in stages if stage["within_slo"]]
+        output = {
+            "target": args.url or "in-process",
+            "time_scale": args.time_scale,
+            "latency": latency,
+            "ffmpeg_installed": shutil.which("ffmpeg") is not None,
+            "slo_p95_ms": args.slo_p95_ms,
+            "sustained_users": max(sustained) if sustained else 0,
+            "stages": stages,
+            "provider_calls": len(stub.calls),
+        }
+
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.max_loop_lag_ms:
+        worst = max((stage["loop_lag"] or {}).get("max_ms", 0.0) for stage in stages)
+        if worst > args.max_loop_lag_ms:
+            print(f"LOOP LAG {worst:.1f}ms exceeds {args.max_loop_lag_ms:.1f}ms", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
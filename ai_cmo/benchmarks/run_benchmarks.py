@@ -0,0 +1,224 @@
+"""Offline benchmark suite for the agent pipeline.
+
+Replays recorded provider responses from a local stub server and measures
+throughput and tail latency of SmallMind.process_message,
+BigMind.process_request, VideoCreator.create_video and the voiceover Quart
+endpoints under concurrency. Results are printed (or written) as JSON; with
+--baseline the run fails when a scenario's p95 regresses beyond the allowed
+ratio.
+
+    python -m benchmarks.run_benchmarks --requests 40 --concurrency 8 --output bench.json
+"""
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_providers import StubFalClient, StubProviderServer
+from utils.metrics import LatencyHistogram
+
+AI_CMO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VOICEOVER_APP_PATH = os.path.join(AI_CMO_DIR, "tools", "test_pages", "voiceover_test.py")
+
+
+def summarize(name: str, histogram: LatencyHistogram, wall: float, requests: int, concurrency: int) -> dict:
+    stats = histogram.summary()
+    return {
+        "scenario": name,
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": stats["errors"],
+        "wall_s": wall,
+        "throughput_rps": requests / wall if wall else 0.0,
+        "p50_ms": stats["p50_ms"],
+        "p95_ms": stats["p95_ms"],
+        "p99_ms": stats["p99_ms"],
+        "max_ms": stats["max_ms"],
+    }
+
+
+def run_threaded(name: str, call, requests: int, concurrency: int, is_error=lambda result: False) -> dict:
+    """Run a blocking callable requests times across concurrency threads."""
+    histogram = LatencyHistogram(max_samples=max(requests, 1))
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            failed = is_error(call(i))
+        except Exception:
+            failed = True
+        histogram.record(time.perf_counter() - start, error=failed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return summarize(name, histogram, time.perf_counter() - start, requests, concurrency)
+
+
+async def run_async(name: str, call, requests: int, concurrency: int, is_error=lambda result: False) -> dict:
+    """Run a coroutine function requests times with at most concurrency in flight."""
+    histogram = LatencyHistogram(max_samples=max(requests, 1))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                failed = is_error(await call(i))
+            except Exception:
+                failed = True
+            histogram.record(time.perf_counter() - start, error=failed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return summarize(name, histogram, time.perf_counter() - start, requests, concurrency)
+
+
+def bench_small_mind(requests: int, concurrency: int) -> dict:
+    from agents.small_mind import SmallMind
+    small_mind = SmallMind()
+    return run_threaded(
+        "small_mind.process_message",
+        lambda i: small_mind.process_message(f"Write a performance report for week {i}"),
+        requests, concurrency,
+        is_error=lambda result: "error" in result["message_to_user"].lower()
+    )
+
+
+def bench_big_mind(requests: int, concurrency: int) -> dict:
+    from agents.Big_Mind import BigMind
+    big_mind = BigMind()
+    return run_threaded(
+        "big_mind.process_request",
+        lambda i: big_mind.process_request(f"Benchmark request {i}"),
+        requests, concurrency,
+        is_error=lambda result: not result.get("tool_execution_result", {}).get("success", False)
+    )
+
+
+def bench_create_video(stub: StubProviderServer, requests: int, concurrency: int) -> dict:
+    from tools.video_creator import VideoCreator, VideoGenerationConfig
+
+    creator = VideoCreator()
+    creator.fal = StubFalClient(stub.url)
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as image:
+        image.write(b"\x89PNG\r\n\x1a\n" + b"\x00" * 1024)
+
+    async def one(i):
+        return await creator.create_video(VideoGenerationConfig(prompt=f"Product spin {i}", image_url=image.name))
+
+    try:
+        return asyncio.run(run_async(
+            "video_creator.create_video", one, requests, concurrency,
+            is_error=lambda result: "url" not in result.get("video", {})
+        ))
+    finally:
+        os.remove(image.name)
+
+
+def load_voiceover_app():
+    spec = importlib.util.spec_from_file_location("voiceover_test", VOICEOVER_APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # Registered first so Quart resolves the app's root_path to tools/test_pages
+    sys.modules["voiceover_test"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_quart_endpoints(requests: int, concurrency: int) -> list:
+    import logging
+    module = load_voiceover_app()
+    logging.getLogger().setLevel(logging.WARNING)
+    client = module.app.test_client()
+
+    scenarios = {
+        "quart.generate_scripts": ("/api/generate-scripts", lambda i: {"prompt": f"Heat pump ad {i}", "duration": "15"}),
+        "quart.generate_voiceover": ("/api/generate", lambda i: {"text": f"Lower bills in {i} days.", "voice": "JBFqnCBsd6RMkjVDRZzb"}),
+    }
+
+    async def run_all():
+        results = []
+        for name, (path, payload) in scenarios.items():
+            async def one(i, path=path, payload=payload):
+                return await client.post(path, json=payload(i))
+            results.append(await run_async(name, one, requests, concurrency,
+                                           is_error=lambda response: response.status_code >= 400))
+        return results
+
+    return asyncio.run(run_all())
+
+
+def compare_to_baseline(results: list, baseline_path: str, max_regression: float) -> list:
+    """Return descriptions of scenarios whose p95 regressed beyond max_regression."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {entry["scenario"]: entry for entry in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result["scenario"])
+        if previous and previous["p95_ms"] and result["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{result['scenario']}: p95 {previous['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the AI CMO pipeline.")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--time-scale", type=float, default=0.05,
+                        help="Multiplier on recorded provider latencies (1.0 = production-like).")
+    parser.add_argument("--latency", action="append", default=[], metavar="PROVIDER=SPEC",
+                        help="Override a provider's latency, e.g. anthropic=lognormal:1.2:0.35")
+    parser.add_argument("--scenarios", default="small_mind,big_mind,create_video,quart")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results JSON here instead of stdout.")
+    parser.add_argument("--baseline", help="Previous results JSON to compare p95 latencies against.")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    latency = dict(item.split("=", 1) for item in args.latency)
+    scenarios = set(args.scenarios.split(","))
+
+    with StubProviderServer(latency=latency, time_scale=args.time_scale, seed=args.seed) as stub:
+        os.environ.update(stub.env())
+        os.environ["REPORT_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "report_cache.json")
+
+        results = []
+        if "small_mind" in scenarios:
+            results.append(bench_small_mind(args.requests, args.concurrency))
+        if "big_mind" in scenarios:
+            results.append(bench_big_mind(args.requests, args.concurrency))
+        if "create_video" in scenarios:
+            results.append(bench_create_video(stub, args.requests, args.concurrency))
+        if "quart" in scenarios:
+            results.extend(bench_quart_endpoints(args.requests, args.concurrency))
+
+        output = {
+            "time_scale": args.time_scale,
+            "latency": {**latency},
+            "seed": args.seed,
+            "results": results,
+            "provider_calls": len(stub.calls),
+        }
+
+    text = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.max_regression)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
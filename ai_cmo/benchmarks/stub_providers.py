@@ -0,0 +1,260 @@
+"""Local stub server replaying recorded provider responses.
+
+One threaded HTTP server impersonates Groq, Anthropic, OpenAI, ElevenLabs,
+fal, the Graph API and Telegram under path prefixes, adding a configurable
+latency per provider. env() returns the variables that point the SDKs and
+tools at it, so benchmarks and tests never touch the network.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "provider_responses.json")
+
+# A short silent MPEG frame, repeated to stand in for TTS audio
+SILENT_MP3_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413
+
+
+class LatencyModel:
+    """Samples response delays in seconds.
+
+    Specs: "fixed:0.05", "uniform:0.02:0.2" or "lognormal:<median>:<sigma>".
+    """
+
+    def __init__(self, kind: str = "fixed", a: float = 0.0, b: float = 0.0, rng: random.Random = None):
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        self.kind, self.a, self.b = kind, a, b
+        self.rng = rng or random.Random()
+
+    @classmethod
+    def parse(cls, spec: str, rng: random.Random = None) -> "LatencyModel":
+        kind, *params = spec.split(":")
+        values = [float(p) for p in params] + [0.0, 0.0]
+        return cls(kind, values[0], values[1], rng)
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.a
+        if self.kind == "uniform":
+            return self.rng.uniform(self.a, self.b)
+        return self.a * math.exp(self.rng.gauss(0, self.b))
+
+
+# Rough shape of production latencies, in seconds
+DEFAULT_LATENCY = {
+    "groq": "lognormal:0.25:0.4",
+    "anthropic": "lognormal:1.2:0.35",
+    "openai": "lognormal:6.0:0.3",
+    "elevenlabs": "lognormal:1.5:0.3",
+    "fal": "lognormal:0.4:0.3",
+    "graph": "lognormal:0.5:0.4",
+    "telegram": "lognormal:0.15:0.3",
+    "files": "fixed:0",
+}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, payload, content_type: str = "application/json", headers: dict = None):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the request (e.g. a cancelled hedge)
+            self.close_connection = True
+
+    def _handle(self):
+        body = self._body()
+        provider = self.path.strip("/").split("/", 1)[0]
+        stub = self.server.stub
+        stub.record(provider, self.command, self.path, body)
+        time.sleep(stub.delay(provider))
+
+        route = self.path.split("?", 1)[0]
+        if provider == "groq":
+            return self._send(200, stub.next_response("groq"))
+        if provider == "anthropic":
+            return self._send(200, stub.next_response("anthropic"))
+        if provider == "openai":
+            model = json.loads(body or b"{}").get("model", "")
+            return self._send(200, stub.next_response("openai", model))
+        if provider == "elevenlabs":
+            if route.endswith("/v1/voices"):
+                voices = stub.fixture("elevenlabs", "voices")
+                etag = f'"{hashlib.sha256(json.dumps(voices).encode()).hexdigest()[:16]}"'
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, b"", headers={"ETag": etag})
+                return self._send(200, voices, headers={"ETag": etag})
+            pcm_rate = re.search(r"output_format=pcm_(\d+)", self.path)
+            if pcm_rate:
+                # Silent 16-bit PCM, about a third of a second per word
+                words = len(json.loads(body or b"{}").get("text", "").split())
+                samples = int(int(pcm_rate.group(1)) * 0.3 * max(words, 1))
+                return self._send(200, b"\x00\x00" * samples, "audio/pcm")
+            return self._send(200, SILENT_MP3_FRAME * stub.tts_frames, "audio/mpeg")
+        if provider == "fal":
+            if route.startswith("/fal/storage"):
+                return self._send(200, stub.fixture("fal", "upload"))
+            if "/requests/" in route:
+                return self._send(200, stub.fixture("fal", "result"))
+            return self._send(200, stub.fixture("fal", "submit"))
+        if provider == "graph":
+            return self._send(200, stub.fixture("graph", route.rsplit("/", 1)[-1]))
+        if provider == "telegram":
+            return self._send(200, stub.fixture("telegram"))
+        if provider == "files":
+            if route.endswith(".mp3"):
+                return self._send(200, SILENT_MP3_FRAME * 16, "audio/mpeg")
+            return self._send(200, b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 4096, "video/mp4")
+        return self._send(404, {"error": f"no stub for {self.path}"})
+
+    do_GET = _handle
+    do_POST = _handle
+    do_PUT = _handle
+
+
+class StubProviderServer:
+    """Threaded HTTP server serving recorded provider fixtures with injected latency.
+
+    Args:
+        latency (dict): Provider name to LatencyModel spec; missing providers use DEFAULT_LATENCY.
+        time_scale (float): Multiplier applied to every sampled delay.
+        seed (int): Seed for reproducible latency samples.
+    """
+
+    def __init__(self, latency: dict = None, time_scale: float = 1.0, seed: int = 0,
+                 fixtures_path: str = FIXTURES_PATH, tts_frames: int = 64):
+        rng = random.Random(seed)
+        specs = {**DEFAULT_LATENCY, **(latency or {})}
+        self.latency = {name: LatencyModel.parse(spec, rng) for name, spec in specs.items()}
+        self.time_scale = time_scale
+        self.tts_frames = tts_frames
+        with open(fixtures_path, "r", encoding="utf-8") as f:
+            self._raw_fixtures = f.read()
+        self.fixtures = {}
+        self.calls = []
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "StubProviderServer":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self._server.daemon_threads = True
+        self._server.request_queue_size = 256
+        self._server.stub = self
+        self.fixtures = json.loads(self._raw_fixtures.replace("{stub_url}", self.url))
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def env(self) -> dict:
+        """Environment variables that route every provider to this server."""
+        return {
+            "GROQ_BASE_URL": f"{self.url}/groq",
+            "ANTHROPIC_BASE_URL": f"{self.url}/anthropic",
+            "OPENAI_BASE_URL": f"{self.url}/openai/v1",
+            "ELEVENLABS_BASE_URL": f"{self.url}/elevenlabs",
+            "GRAPH_API_BASE": f"{self.url}/graph/v20.0",
+            "TELEGRAM_API_BASE": f"{self.url}/telegram",
+            "GROQ_API_KEY": "stub", "ANTHROPIC_API_KEY": "stub", "OPENAI_API_KEY": "stub",
+            "ELEVENLABS_API_KEY": "stub", "FAL_KEY": "stub", "BOT_TOKEN": "stub",
+            "TARGET_CHAT_ID": "1", "AD_ACCOUNT_ID": "1", "ACCESS_TOKEN": "stub",
+            "LIVE_CAMPAIGN_INSIGHTS": "1",
+        }
+
+    def delay(self, provider: str) -> float:
+        model = self.latency.get(provider)
+        with self._lock:
+            return max(0.0, model.sample() * self.time_scale) if model else 0.0
+
+    def record(self, provider: str, method: str, path: str, body: bytes):
+        with self._lock:
+            self.calls.append((provider, method, re.sub(r"/bot[^/]+/", "/bot<token>/", path), len(body)))
+
+    def fixture(self, provider: str, key: str = None):
+        value = self.fixtures[provider]
+        return value.get(key, {}) if key is not None else value
+
+    def next_response(self, provider: str, key: str = None):
+        """Cycle through the recorded responses for a provider (and model)."""
+        responses = self.fixtures[provider]
+        if key is not None:
+            responses = responses.get(key) or next(iter(responses.values()))
+        with self._lock:
+            counter_key = (provider, key)
+            index = self._counters.get(counter_key, 0)
+            self._counters[counter_key] = index + 1
+        return responses[index % len(responses)]
+
+
+class StubFalClient:
+    """Drop-in for the fal_client functions VideoCreator uses, backed by the stub server."""
+
+    def __init__(self, base_url: str):
+        self.base_url = f"{base_url}/fal"
+
+    def upload_file(self, path: str) -> str:
+        from utils.http_client import get_http_client
+        with open(path, "rb") as f:
+            return get_http_client().post(f"{self.base_url}/storage/upload", data=f.read()).json()["url"]
+
+    async def upload_file_async(self, path: str) -> str:
+        with open(path, "rb") as f:
+            data = f.read()
+        response = await self._client().post(f"{self.base_url}/storage/upload", content=data)
+        return response.json()["url"]
+
+    async def submit_async(self, application: str, arguments: dict):
+        from types import SimpleNamespace
+        response = await self._client().post(f"{self.base_url}/queue/{application}", json=arguments)
+        return SimpleNamespace(request_id=response.json()["request_id"])
+
+    async def result_async(self, application: str, request_id: str) -> dict:
+        response = await self._client().get(f"{self.base_url}/queue/{application}/requests/{request_id}")
+        return response.json()
+
+    def _client(self):
+        import asyncio
+        from utils.http_client import AsyncHttpClient
+        loop = asyncio.get_running_loop()
+        if getattr(self, "_loop", None) is not loop:
+            self._loop, self._async_client = loop, AsyncHttpClient()
+        return self._async_client
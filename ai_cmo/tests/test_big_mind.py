@@ -0,0 +1,339 @@
+from types import SimpleNamespace
+
+import pytest
+
+from agents.Big_Mind import BigMind
+from utils.vector_index import VectorIndex
+
+
+def make_report(wow_text: str) -> str:
+    return "\n\n".join([
+        "## 1. Executive Summary\nSpend is up.",
+        "## 2. Campaign Performance Overview\nSteady delivery.",
+        "## 3. Key Metrics Analysis\nCTR holds.",
+        f"## 4. Week-over-Week Performance\n{wow_text}",
+        "## 5. Areas for Optimization\nCreative fatigue.",
+        "## 6. Recommendations\nRefresh creatives.",
+    ])
+
+
+class FakeCompletions:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        content = self.replies.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+@pytest.fixture
+def big_mind(monkeypatch, tmp_path):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("AD_ACCOUNT_ID", "123")
+    monkeypatch.setenv("REPORT_CACHE_PATH", str(tmp_path / "report_cache.json"))
+    big_mind = BigMind()
+    big_mind.knowledge = VectorIndex(str(tmp_path / "vector_index"))
+    return big_mind
+
+
+def use_completions(big_mind, completions):
+    big_mind.openai_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+
+
+WEEKS = [
+    {"Week": "2025-01-30 - 2025-02-05", "Reporting starts": "2025-01-30", "Results": 196},
+    {"Week": "2025-02-06 - 2025-02-12", "Reporting starts": "2025-02-06", "Results": 214},
+]
+
+
+def test_report_cache_hit_skips_model(big_mind):
+    completions = FakeCompletions([make_report("Results rose.")])
+    use_completions(big_mind, completions)
+
+    first = big_mind.generate_performance_report(WEEKS, "2025-01-30", "2025-02-12")
+    second = big_mind.generate_performance_report(WEEKS, "2025-01-30", "2025-02-12")
+
+    assert first["success"] and second["success"]
+    assert second["cached"] is True
+    assert len(completions.calls) == 1
+
+
+def test_latest_period_change_regenerates_only_period_sections(big_mind):
+    partial_update = "## 4. Week-over-Week Performance\nResults fell.\n\n## 6. Recommendations\nPause ad set B."
+    completions = FakeCompletions([make_report("Results rose."), partial_update])
+    use_completions(big_mind, completions)
+
+    big_mind.generate_performance_report(WEEKS, "2025-01-30", "2025-02-12")
+    refreshed = [WEEKS[0], {**WEEKS[1], "Results": 150}]
+    result = big_mind.generate_performance_report(refreshed, "2025-01-30", "2025-02-12")
+
+    assert result["success"]
+    assert len(completions.calls) == 2
+    assert "Results fell." in result["report"]
+    assert "Pause ad set B." in result["report"]
+    assert "Creative fatigue." in result["report"]
+    assert "Results rose." not in result["report"]
+
+
+def test_single_period_reports_are_never_patched_from_another_report(big_mind):
+    completions = FakeCompletions([make_report("Results rose."), make_report("Leads doubled.")])
+    use_completions(big_mind, completions)
+
+    big_mind.generate_performance_report([WEEKS[0]])
+    result = big_mind.generate_performance_report([{**WEEKS[1], "Reporting starts": "2025-03-06"}])
+
+    # Nothing earlier to build on: the second report is written in full
+    assert len(completions.calls) == 2
+    assert "updating an existing" not in completions.calls[1]["messages"][0]["content"]
+    assert "Leads doubled." in result["report"] and "Results rose." not in result["report"]
+
+    # Rows for several campaigns starting on the same day are one period
+    from utils.report_cache import split_latest_period
+    campaigns = [{"date_start": "2025-02-20", "campaign_id": c} for c in "ab"]
+    assert split_latest_period(campaigns) == (None, campaigns)
+    latest, earlier = split_latest_period(campaigns + [{"date_start": "2025-02-13", "campaign_id": "a"}])
+    assert latest == campaigns and len(earlier) == 1
+
+
+def test_video_ad_tool_stays_unavailable(big_mind):
+    result = big_mind.execute_tool("Create_Ad_from_Image", {"image_path": "product.png", "video_description": "spin"})
+    assert result == {"success": False, "details": "Tool Create_Ad_from_Image not implemented yet"}
+    # Still offered to the model, as before the registry, so its routing is unchanged
+    assert "- Create_Ad_from_Image:" in big_mind.system_prompt
+
+
+def test_process_request_against_stub_providers(monkeypatch, tmp_path):
+    from benchmarks.stub_providers import StubProviderServer
+
+    with StubProviderServer(time_scale=0) as stub:
+        for name, value in stub.env().items():
+            monkeypatch.setenv(name, value)
+        monkeypatch.setenv("REPORT_CACHE_PATH", str(tmp_path / "report_cache.json"))
+        big_mind = BigMind()
+        big_mind.knowledge = VectorIndex(str(tmp_path / "vector_index"))
+
+        report = big_mind.process_request("Write a report for 2025-01-23 to 2025-02-21")
+        message = big_mind.process_request("Tell the team the campaign is live")
+        upload = big_mind.process_request("Upload the new video to Meta")
+
+    assert report["tool_name"] == "Write_Report"
+    assert "Week-over-Week Performance" in report["tool_execution_result"]["report"]
+    assert message["tool_execution_result"]["success"]
+    assert upload["tool_execution_result"]["details"].endswith("120215678901234567")
+    providers = [call[0] for call in stub.calls]
+    assert providers.count("anthropic") == 3 and "openai" in providers and "graph" in providers
+
+    # The report and the uploaded creative are now answerable without regenerating anything
+    past = big_mind.execute_tool("Search_Past_Work", {"query": "video ad upload", "source": "creative"})
+    assert past["success"] and past["results"][0]["metadata"]["video_id"] == "120215678901234567"
+    past = big_mind.execute_tool("Search_Past_Work", {"query": "week-over-week performance", "source": "report"})
+    assert past["results"] and all(r["metadata"]["source"] == "report" for r in past["results"])
+    assert len(stub.calls) == len(providers)
+
+
+def test_agent_modules_import_sdks_lazily():
+    from benchmarks.import_time import LAZY_SDKS, sample_import
+
+    for module in ("agents.Big_Mind", "agents.small_mind", "tools.video_creator"):
+        loaded = {row[0] for row in sample_import(module)}
+        assert module in loaded
+        assert [sdk for sdk in LAZY_SDKS if sdk in loaded] == [], module
+
+
+def test_runtime_reuses_agents_across_reruns(monkeypatch, tmp_path):
+    from agents import runtime
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("REPORT_CACHE_PATH", str(tmp_path / "report_cache.json"))
+    runtime.reset()
+    try:
+        big_mind = runtime.get_big_mind()
+        # A Streamlit rerun calls the getters again and must get the same objects
+        assert runtime.get_big_mind() is big_mind
+        assert runtime.get_small_mind() is runtime.get_small_mind()
+        logger = runtime.get_prompt_logger(str(tmp_path / "prompts.jsonl"))
+        assert runtime.get_prompt_logger(str(tmp_path / "prompts.jsonl")) is logger
+        logger.close()
+        # Clients are built on first use and then kept
+        assert big_mind.openai_client is big_mind.openai_client
+    finally:
+        runtime.reset()
+
+
+def test_job_pool_publishes_results_to_the_session_with_replay():
+    from agents.job_pool import BigMindJobPool
+    from utils.result_bus import ResultBus
+
+    # The result shapes BigMind.fetch_campaign_insight and generate_performance_report return
+    insight = {"success": True, "data": [{"Clicks": 3163}, {"Clicks": 2904}],
+               "metrics": {"clicks": 6067.0, "spend": 7312.4}, "prefetched": False}
+    report = {"success": True, "report": "Report Generated: 2025-02-06\n\n## Executive Summary\nLeads are up."}
+
+    class FakeBigMind:
+        def process_request(self, user_message, session_id=None):
+            if "fail" in user_message:
+                raise RuntimeError("provider down")
+            if "report" in user_message:
+                return {"tool_name": "Write_Report", "reason": "report", "tool_execution_result": report}
+            return {"tool_name": "Fetch_Campaign_Insight", "reason": "insights", "tool_execution_result": insight}
+
+    bus = ResultBus()
+    pool = BigMindJobPool(big_mind=FakeBigMind(), max_workers=2, result_bus=bus)
+    live = []
+    unsubscribe = bus.subscribe("session-a", live.append)
+    try:
+        pool.submit("insights", "How are my ads doing?", session_id="session-a").result(timeout=5)
+        with pytest.raises(RuntimeError):
+            pool.submit("report", "please fail", session_id="session-a").result(timeout=5)
+        pool.submit("insights", "Other user", session_id="session-b").result(timeout=5)
+        pool.submit("report", "Write my weekly report", session_id="session-b").result(timeout=5)
+    finally:
+        unsubscribe()
+        pool.shutdown()
+
+    assert [event.kind for event in live] == ["started", "result", "started", "error"]
+    assert live[1].payload["summary"] == "Fetch_Campaign_Insight finished (2 row(s)): clicks: 6067.0, spend: 7312.4"
+    assert live[3].payload["error"] == "provider down"
+    assert bus.events("session-b")[-1].payload["summary"] == report["report"]
+
+    # A late subscriber replays what it missed, in order, then gets new events live
+    replayed = []
+    bus.subscribe("session-a", replayed.append, after=live[1].seq)
+    assert [event.seq for event in replayed] == [3, 4]
+    bus.publish("session-a", "result", {"summary": "late"})
+    assert replayed[-1].seq == 5
+    assert [event.kind for event in bus.events("session-b")] == ["started", "result", "started", "result"]
+
+
+def test_insight_prefetch_overlaps_the_reply_and_discards_mismatches(big_mind):
+    import time
+    from agents.prefetch import InsightPrefetcher, detect_data_intent
+    from tools.campaign_insight import load_campaign_insight
+
+    assert detect_data_intent("Make a video ad from my product photo") is None
+    assert detect_data_intent("How did our campaigns do?") is not None
+    intent = detect_data_intent("What was our CTR for 2025-01-30 to 2025-02-05?")
+    assert (intent.start_date, intent.end_date) == ("2025-01-30", "2025-02-05")
+
+    fetched = []
+
+    def slow_fetch(start_date, end_date):
+        fetched.append((start_date, end_date))
+        time.sleep(0.3)  # Graph API round trip
+        return load_campaign_insight(None, None, start_date, end_date)
+
+    big_mind.prefetcher = InsightPrefetcher(slow_fetch, ttl=0.5)
+    # The message arrives; while SmallMind and BigMind's model calls run, the data loads
+    big_mind.prefetcher.maybe_prefetch("Write a performance report for 2025-01-30 to 2025-02-05")
+    big_mind.prefetcher.maybe_prefetch("and the report for 2025-01-30 to 2025-02-05 again")
+    time.sleep(0.25)
+    start = time.perf_counter()
+    result = big_mind.execute_tool("Fetch_Campaign_Insight", {"start_date": "2025-01-30", "end_date": "2025-02-05"})
+    assert time.perf_counter() - start < 0.2
+    assert result["success"] and result["prefetched"]
+    # Only the requested week, not every sample week
+    assert len(result["data"]) == 1
+    assert result["metrics"]["clicks"] == 3163 and round(result["metrics"]["cost_per_result"], 2) == 19.86
+    assert fetched == [("2025-01-30", "2025-02-05")]
+
+    # BigMind chose another window: the speculative fetch is not used, and expires unclaimed
+    big_mind.prefetcher.maybe_prefetch("Show me spend for 2025-02-06 to 2025-02-12")
+    result = big_mind.execute_tool("Fetch_Campaign_Insight", {"start_date": "2025-02-13", "end_date": "2025-02-19"})
+    assert result["success"] and not result["prefetched"]
+    assert result["metrics"]["clicks"] == 2768
+    time.sleep(0.6)
+    assert big_mind.prefetcher.take("2025-02-06", "2025-02-12") is None
+    assert (big_mind.prefetcher.started, big_mind.prefetcher.hits, big_mind.prefetcher.discarded) == (2, 1, 1)
+
+
+def test_live_insights_are_opt_in_weekly_and_follow_every_page(monkeypatch):
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlsplit
+    from tools.campaign_insight import get_campaign_insight
+    from utils.report_cache import split_latest_period
+
+    requests_seen = []
+
+    class GraphStub(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = parse_qs(urlsplit(self.path).query)
+            requests_seen.append(query)
+            page = int(query.get("page", ["1"])[0])
+            rows = [{"campaign_id": c, "clicks": "10", "date_start": start, "date_stop": start}
+                    for start in ("2025-02-06", "2025-02-13") for c in ("a", "b")]
+            body = {"data": rows[:2] if page == 1 else rows[2:]}
+            if page == 1:
+                body["paging"] = {"next": f"http://127.0.0.1:{self.server.server_address[1]}/act_1/insights?page=2"}
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GraphStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("GRAPH_API_BASE", f"http://127.0.0.1:{server.server_address[1]}")
+    try:
+        # Sample data unless live insights are switched on, credentials or not
+        monkeypatch.delenv("LIVE_CAMPAIGN_INSIGHTS", raising=False)
+        assert "Reporting starts" in get_campaign_insight("1", "token", "2025-02-06", "2025-02-19")[0]
+        assert requests_seen == []
+
+        monkeypatch.setenv("LIVE_CAMPAIGN_INSIGHTS", "1")
+        rows = get_campaign_insight("1", "token", "2025-02-06", "2025-02-19")
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert len(requests_seen) == 2 and len(rows) == 4
+    assert requests_seen[0]["time_increment"] == ["7"] and "time_range" in requests_seen[0]
+    # Weekly rows let report reuse tell the latest week from the earlier ones
+    latest, earlier = split_latest_period(rows)
+    assert {row["date_start"] for row in latest} == {"2025-02-13"} and len(earlier) == 2
+
+
+def test_failed_telegram_delivery_is_logged(big_mind, monkeypatch, capsys):
+    import concurrent.futures
+
+    future = concurrent.futures.Future()
+
+    class FailingDispatcher:
+        def send(self, chat_id, text, as_document=False):
+            return future
+
+    monkeypatch.setattr("agents.Big_Mind.get_telegram_dispatcher", lambda token: FailingDispatcher())
+    big_mind.telegram_chat_id = "42"
+    assert big_mind.send_telegram_message("hi")["success"]
+    future.set_result({"success": False, "details": [{"ok": False, "description": "Forbidden: bot was blocked"}]})
+    assert "Telegram delivery to chat 42 failed" in capsys.readouterr().out
+
+
+def test_telegram_message_needs_a_configured_chat(big_mind, monkeypatch):
+    import concurrent.futures
+
+    sent = []
+
+    class RecordingDispatcher:
+        def send(self, chat_id, text, as_document=False):
+            sent.append(chat_id)
+            future = concurrent.futures.Future()
+            future.set_result({"success": True})
+            return future
+
+    monkeypatch.setattr("agents.Big_Mind.get_telegram_dispatcher", lambda token: RecordingDispatcher())
+    for unset in (None, "", " , "):
+        big_mind.telegram_chat_id = unset
+        result = big_mind.send_telegram_message("hi")
+        assert not result["success"] and "No Telegram chat configured" in result["details"]
+    assert sent == []
+
+    big_mind.telegram_chat_id = "42,,43"
+    assert big_mind.send_telegram_message("hi")["details"] == "Message queued for delivery to 2 chat(s)"
+    assert sent == ["42", "43"]
@@ -0,0 +1,221 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from agents.provider_router import Provider, ProviderRouter
+from agents.small_mind import SmallMind
+from utils.memory_manager import MemoryManager, estimate_tokens
+
+
+class FakeGroqCompletions:
+    def __init__(self):
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        reply = json.dumps({"activate_big_mind": False, "action": None,
+                            "message_to_user": "Noted. " + "Here is some detailed advice. " * 8})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))], usage=None)
+
+
+def test_session_memory_keeps_prompts_bounded_and_pins_facts():
+    completions = FakeGroqCompletions()
+    summaries = []
+
+    def summarize(summary, turns):
+        summaries.append(len(turns))
+        return f"{summary} Discussed {len(turns)} more turns about the spring campaign.".strip()
+
+    small_mind = SmallMind()
+    small_mind.async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    small_mind.router = ProviderRouter([Provider("groq", small_mind._groq_complete)])
+    small_mind.memory = MemoryManager(summarize=summarize, budget_tokens=600)
+
+    small_mind.process_message("Use ad account act_123456 and look at 2025-01-30 to 2025-02-05", session_id="s1")
+    small_mind.memory.set_slot("s1", "video_url", "https://cdn.example.com/renders/spin.mp4")
+    for i in range(60):
+        small_mind.process_message(f"Question {i}: how should we tweak the spring campaign creative?", session_id="s1")
+        small_mind.memory.executor.submit(lambda: None).result()  # let compaction catch up
+    small_mind.process_message("Post that video", session_id="s1")
+
+    prompt_sizes = [sum(estimate_tokens(m["content"]) for m in call["messages"]) for call in completions.calls]
+    system_size = estimate_tokens(small_mind.system_prompt)
+    # The history part never exceeds the budget, however long the chat gets
+    assert max(prompt_sizes) - system_size <= 600 + 50
+    assert prompt_sizes[-1] < prompt_sizes[0] + 700
+    assert summaries and sum(summaries) > 40
+
+    context = completions.calls[-1]["messages"][1]["content"]
+    assert "act_123456" in context and "2025-01-30 to 2025-02-05" in context
+    assert "https://cdn.example.com/renders/spin.mp4" in context
+    assert "Summary of the earlier conversation" in context
+    assert completions.calls[-1]["messages"][-1]["content"] == "Post that video"
+
+    # Sessions do not see each other's memory
+    small_mind.process_message("Hello", session_id="s2")
+    assert [m["role"] for m in completions.calls[-1]["messages"]] == ["system", "user"]
+
+
+def test_router_hedges_a_slow_provider_and_trips_the_breaker(monkeypatch):
+    import time
+    from benchmarks.stub_providers import LatencyModel, StubProviderServer
+    from utils.async_runtime import get_async_runtime
+
+    with StubProviderServer(latency={"groq": "fixed:0.02", "openai": "fixed:0.4"}, time_scale=1) as stub:
+        for name, value in stub.env().items():
+            monkeypatch.setenv(name, value)
+        small_mind = SmallMind()
+        small_mind.router = ProviderRouter(
+            [Provider("groq", small_mind._groq_complete), Provider("openai", small_mind._openai_complete)],
+            min_samples=10,
+        )
+        router = small_mind.router
+        small_mind.prefetcher = None
+
+        # Healthy Groq answers; a blip past its p95 is hedged, but Groq still finishes first
+        for i in range(20):
+            reply = small_mind.process_message(f"Write a report for week {i}")
+            assert reply["message_to_user"].startswith("I've started the performance report")
+        warm_ewma, warm_count, warm_calls = router.ewma("groq"), router.metrics.histogram("groq").count, len(stub.calls)
+        assert router.hedge_delay("groq") < 0.3
+
+        # Groq's tail spikes: a hedge goes to OpenAI after Groq's p95 and wins
+        stub.latency["groq"] = LatencyModel("fixed", 3.0)
+        start = time.perf_counter()
+        routed = get_async_runtime().run(router.complete(
+            [{"role": "user", "content": "Write a report"}], parse=small_mind._parse_decision
+        ))
+        assert time.perf_counter() - start < 1.5
+        assert routed.provider == "openai" and routed.hedged
+        assert "performance report is being prepared" in routed.value["message_to_user"]
+        assert [call[0] for call in stub.calls[warm_calls:]] == ["groq", "openai"]
+        # The cancelled Groq request raised its average but was not counted as an answer
+        assert router.ewma("groq") > warm_ewma
+        assert router.metrics.histogram("groq").count == warm_count
+
+    # Repeated failures open the breaker; requests fail over immediately meanwhile
+    attempts = []
+
+    async def flaky(messages, **params):
+        attempts.append(len(attempts))
+        if 3 <= len(attempts) <= 5:
+            raise ConnectionError("provider down")
+        return '{"activate_big_mind": false, "action": null, "message_to_user": "flaky"}'
+
+    async def backup(messages, **params):
+        await asyncio.sleep(0.01)
+        return '{"activate_big_mind": false, "action": null, "message_to_user": "backup"}'
+
+    router = ProviderRouter([Provider("flaky", flaky), Provider("backup", backup)],
+                            failure_threshold=3, reset_timeout=0.2, default_hedge_delay=5)
+    providers = [get_async_runtime().run(router.complete([], parse=json.loads)).provider for _ in range(6)]
+    assert providers == ["flaky", "flaky", "backup", "backup", "backup", "backup"]
+    assert router.state("flaky") == "open"
+    assert len(attempts) == 5  # not asked while open
+    time.sleep(0.25)
+    assert router.state("flaky") == "half_open"
+    # One probe is let through; its success closes the breaker
+    assert get_async_runtime().run(router.complete([], parse=json.loads)).provider == "flaky"
+    assert router.state("flaky") == "closed"
+
+
+def test_router_does_not_rank_a_provider_by_a_cancelled_hedge():
+    from utils.async_runtime import get_async_runtime
+
+    async def slow(messages, **params):
+        await asyncio.sleep(0.2)
+        return "slow"
+
+    async def never_finishes(messages, **params):
+        await asyncio.sleep(10)
+        return "late"
+
+    # The hedge to "backup" is cancelled 0.15s in, when the primary answers
+    router = ProviderRouter([Provider("primary", slow), Provider("backup", never_finishes)], default_hedge_delay=0.05)
+    assert get_async_runtime().run(router.complete([])).provider == "primary"
+    # Its true latency is unknown, so it must not look faster than the provider that answered
+    assert router.ewma("backup") is None
+    assert [provider.name for provider in router.ranked()] == ["primary", "backup"]
+
+
+class FakeBatchCompletions:
+    """Answers batch requests with a delay that grows with the batch; drops and breaks some items."""
+
+    def __init__(self):
+        self.batch_sizes = []
+        self.dropped = set()
+
+    async def create(self, **kwargs):
+        items = json.loads(kwargs["messages"][-1]["content"])
+        self.batch_sizes.append(len(items))
+        await asyncio.sleep(0.05 + 0.01 * len(items))
+        if any(item["message"] == "poison" for item in items):
+            reply = "Sorry, I cannot help with that."
+        else:
+            results = []
+            for item in items:
+                if item["message"].startswith("flaky") and item["id"] not in self.dropped:
+                    self.dropped.add(item["id"])  # left out of the first reply only
+                    continue
+                report = "report" in item["message"]
+                results.append({"id": item["id"], "activate_big_mind": report,
+                                "action": "Write_Report" if report else None,
+                                "message_to_user": f"Re: {item['message']}"})
+            reply = json.dumps({"results": results})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))], usage=None)
+
+
+def test_batch_classification_drains_a_backlog_with_adaptive_batches(monkeypatch):
+    import time
+    from utils.batching import AdaptiveBatchSizer
+
+    completions = FakeBatchCompletions()
+    small_mind = SmallMind()
+    small_mind.async_client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    small_mind.router = ProviderRouter([Provider("groq", small_mind._groq_complete)])
+    small_mind.batch_sizer = AdaptiveBatchSizer(initial=4, maximum=50, target_latency=0.4)
+    small_mind.memory = MemoryManager()
+
+    backlog = [f"Write a report for client {i}" if i % 3 == 0 else f"Thanks for message {i}" for i in range(400)]
+    backlog[57] = "flaky follow-up"
+    backlog[230] = "poison"
+    start = time.perf_counter()
+    results = small_mind.process_messages_batch(backlog, session_ids=[f"chat-{i % 5}" for i in range(400)])
+    elapsed = time.perf_counter() - start
+
+    # Hundreds of messages in a few seconds, in far fewer model calls than messages
+    assert elapsed < 5
+    assert len(completions.batch_sizes) < 60
+    assert len(results) == 400
+    assert results[3] == {"activate_big_mind": True, "action": "Write_Report",
+                          "message_to_user": "Re: Write a report for client 3"}
+    assert results[4]["message_to_user"] == "Re: Thanks for message 4" and not results[4]["activate_big_mind"]
+    # A message left out of a reply is retried; a message that breaks its batch fails alone
+    assert results[57]["message_to_user"] == "Re: flaky follow-up"
+    assert "error" in results[230] and not results[230]["activate_big_mind"]
+    assert sum("error" in result for result in results) == 1
+
+    # Batches grew while fast, and were cut back when they ran past the target latency
+    sizes = small_mind.batch_sizer.history
+    assert max(sizes) > 4 and max(completions.batch_sizes) <= 50
+    assert any(later < earlier for earlier, later in zip(sizes, sizes[1:]))
+    assert "Re: Thanks for message 5" in small_mind.memory.context_text("chat-0")
+
+
+def test_batch_reply_that_is_not_an_object_does_not_trip_the_breaker():
+    from agents.provider_router import ProviderError
+    from utils.async_runtime import get_async_runtime
+
+    async def lists_instead(messages, **params):
+        return '[{"id": 0, "activate_big_mind": false, "action": null, "message_to_user": "hi"}]'
+
+    with pytest.raises(ValueError):
+        SmallMind._parse_batch('["hi"]')
+    router = ProviderRouter([Provider("groq", lists_instead)], failure_threshold=1)
+    for _ in range(3):
+        with pytest.raises(ProviderError) as error:
+            get_async_runtime().run(router.complete([], parse=SmallMind._parse_batch))
+        assert isinstance(error.value.errors["groq"], ValueError)
+    assert router.state("groq") == "closed"
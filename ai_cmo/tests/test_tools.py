@@ -0,0 +1,804 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from tools.telegram_dispatcher import TelegramDispatcher, chunk_html, html_to_text, markdown_to_html
+
+
+class TelegramStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        method = self.path.rsplit("/", 1)[-1]
+        self.server.calls.append((method, body))
+        payload = json.dumps({"ok": True, "result": {}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def telegram_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TelegramStubHandler)
+    server.calls = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_markdown_to_html_keeps_formatting_and_escapes_the_rest():
+    assert markdown_to_html("CTR up 1.5% (wow)!") == "CTR up 1.5% (wow)!"
+    assert markdown_to_html("## Summary\n**Spend** < $5 & *CPC* `a*b`") == (
+        "<b>Summary</b>\n<b>Spend</b> &lt; $5 &amp; <i>CPC</i> <code>a*b</code>"
+    )
+    assert markdown_to_html("* one\n* two_three") == "* one\n* two_three"
+    assert markdown_to_html("[Ads Manager](https://example.com/?a=1&b=2)") == (
+        '<a href="https://example.com/?a=1&amp;b=2">Ads Manager</a>'
+    )
+
+
+def test_chunk_html_splits_at_paragraphs():
+    paragraphs = ["a" * 3000, "b" * 3000, "c" * 100]
+    chunks = chunk_html("\n\n".join(paragraphs))
+    assert chunks == ["a" * 3000, "b" * 3000 + "\n\n" + "c" * 100]
+
+
+def test_chunk_html_keeps_every_chunk_balanced():
+    from html.parser import HTMLParser
+
+    class Balance(HTMLParser):
+        def __init__(self):
+            super().__init__()
+            self.open = []
+
+        def handle_starttag(self, tag, attrs):
+            self.open.append(tag)
+
+        def handle_endtag(self, tag):
+            assert self.open.pop() == tag
+
+    code = "\n".join(f"print('row {i}', a < b & c)" for i in range(400))
+    spend = " ".join(["Spend & CTR"] * 400)
+    text = markdown_to_html(f"## Weekly report\n\n**{spend}**\n\n```python\n{code}\n```\n\nDone.")
+    chunks = chunk_html(text)
+    # A bold run longer than a message is cut inside the line, and stays bold on both sides
+    assert chunks[1].startswith("<b>Spend") and chunks[1].endswith("</b>") and chunks[2].startswith("<b>")
+    assert len(chunks) > 2 and all(len(chunk) <= 4096 for chunk in chunks)
+    for chunk in chunks:
+        parser = Balance()
+        parser.feed(chunk)
+        assert parser.open == []
+        assert not chunk.endswith("&") and "&amp" not in chunk.replace("&amp;", "")
+    # Code lines are never cut, and the split code block is reopened as <pre>
+    pre_chunks = [chunk for chunk in chunks if "print(" in chunk]
+    assert len(pre_chunks) > 1 and all(chunk.count("<pre>") == 1 for chunk in pre_chunks)
+    assert html_to_text("".join(chunks)).count("print('row") == 400
+    assert "print('row 399', a < b & c)" in html_to_text(chunks[-2] + chunks[-1])
+
+
+def test_dispatcher_coalesces_bursts_and_sends_large_reports_as_documents(telegram_stub):
+    dispatcher = TelegramDispatcher(
+        "TOKEN",
+        coalesce_window=0.2,
+        api_base=f"http://127.0.0.1:{telegram_stub.server_address[1]}"
+    )
+    futures = [dispatcher.send(42, f"alert {i}") for i in range(3)]
+    results = [future.result(timeout=5) for future in futures]
+    report = dispatcher.send(42, "Weekly report\n\n" + "x" * 20000).result(timeout=5)
+    dispatcher.close()
+
+    assert all(result["success"] for result in results)
+    assert report["success"]
+    methods = [method for method, _ in telegram_stub.calls]
+    assert methods == ["sendMessage", "sendDocument"]
+    sent = json.loads(telegram_stub.calls[0][1])
+    assert sent["parse_mode"] == "HTML"
+    assert sent["text"] == "alert 0\n\nalert 1\n\nalert 2"
+
+
+def test_per_chat_update_processor_orders_within_chat_only():
+    import asyncio
+    from telegram import Update
+    from tools.telegram_bot_setup import PerChatUpdateProcessor
+
+    def make_update(update_id, chat_id):
+        return Update.de_json({
+            "update_id": update_id,
+            "message": {"message_id": update_id, "date": 0, "chat": {"id": chat_id, "type": "private"}, "text": "hi"}
+        }, None)
+
+    events = []
+
+    async def handle(name, delay):
+        events.append(f"start {name}")
+        await asyncio.sleep(delay)
+        events.append(f"end {name}")
+
+    async def run():
+        processor = PerChatUpdateProcessor()
+        await asyncio.gather(
+            processor.process_update(make_update(1, 1), handle("a1", 0.05)),
+            processor.process_update(make_update(2, 1), handle("a2", 0)),
+            processor.process_update(make_update(3, 2), handle("b1", 0)),
+        )
+        return processor
+
+    processor = asyncio.run(run())
+    assert events.index("end a1") < events.index("start a2")
+    assert events.index("end b1") < events.index("end a1")
+    assert processor._chat_locks == {}
+
+
+def test_webhook_requires_secret_and_ignores_edited_messages():
+    import asyncio
+    from quart import Quart
+    from telegram import Update
+    from telegram.ext import MessageHandler
+    from tools.telegram_bot_setup import build_application, create_webhook_blueprint
+
+    application = build_application("123:ABC", small_mind=object())
+    message = {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "hi"}
+    handler = next(h for h in application.handlers[0] if isinstance(h, MessageHandler))
+    assert handler.check_update(Update.de_json({"update_id": 1, "message": message}, application.bot))
+    assert not handler.check_update(Update.de_json({"update_id": 2, "edited_message": message}, application.bot))
+
+    async def post(secret_token, header=None):
+        app = Quart(__name__)
+        app.register_blueprint(create_webhook_blueprint(application, secret_token=secret_token))
+        headers = {"X-Telegram-Bot-Api-Secret-Token": header} if header else {}
+        response = await app.test_client().post("/telegram/webhook", json={"update_id": 3}, headers=headers)
+        return response.status_code
+
+    assert asyncio.run(post(None)) == 403
+    assert asyncio.run(post("s3cret", "wrong")) == 403
+    assert asyncio.run(post("s3cret", "s3cret")) == 200
+
+
+def test_handle_message_scopes_memory_and_jobs_to_the_chat(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    from tools import telegram_bot_setup
+
+    calls = []
+
+    class FakeSmallMind:
+        def process_message(self, text, session_id=None):
+            calls.append(("small_mind", session_id))
+            return {"message_to_user": "On it.", "activate_big_mind": True, "action": "report"}
+
+    class FakeJobPool:
+        def submit(self, action, text, on_done=None, session_id=None):
+            calls.append(("job", session_id))
+
+    async def reply_text(text):
+        calls.append(("reply", text))
+
+    monkeypatch.setattr(telegram_bot_setup, "get_job_pool", lambda: FakeJobPool())
+    update = SimpleNamespace(effective_message=SimpleNamespace(text="Weekly report please", reply_text=reply_text),
+                             effective_chat=SimpleNamespace(id=42))
+    context = SimpleNamespace(bot_data={"small_mind": FakeSmallMind()}, bot=SimpleNamespace(token="123:ABC"))
+    asyncio.run(telegram_bot_setup.handle_message(update, context))
+
+    assert calls == [("small_mind", "telegram:42"), ("reply", "On it."), ("job", "telegram:42")]
+
+
+def test_voiceover_handlers_do_not_block_the_event_loop(monkeypatch):
+    import asyncio
+    from benchmarks.load_test import PLACEHOLDER_VIDEO, ServerThread, run_stage
+    from benchmarks.run_benchmarks import load_voiceover_app
+    from benchmarks.stub_providers import StubProviderServer
+
+    # Provider calls take 100ms; any of them made on the loop shows up as lag
+    slow_providers = {"openai": "fixed:0.1", "elevenlabs": "fixed:0.1"}
+    with StubProviderServer(latency=slow_providers, time_scale=1) as stub:
+        for name, value in {**stub.env(), "VOICEOVER_LOG_LEVEL": "DEBUG", "VOICEOVER_LOG_FILE": ""}.items():
+            monkeypatch.setenv(name, value)
+        server = ServerThread(load_voiceover_app().app).start()
+        steps = ["upload", "generate-scripts", "generate", "video"]
+        try:
+            # One warm-up flow: the SDKs build their pydantic validators on first use,
+            # which holds the GIL from a worker thread for a one-off ~100ms
+            asyncio.run(run_stage(server.url, users=1, iterations=1, steps=steps, video_bytes=PLACEHOLDER_VIDEO))
+            server.reset_monitor()
+            stage = asyncio.run(run_stage(server.url, users=4, iterations=2, steps=steps,
+                                          video_bytes=PLACEHOLDER_VIDEO))
+            lag = server.monitor.summary()
+        finally:
+            server.stop()
+
+    assert stage["flows"] == 8 and stage["flow_errors"] == 0
+    assert [step["step"] for step in stage["steps"]] == ["upload", "generate-scripts", "generate", "video"]
+    assert lag["samples"] > 0
+    assert lag["max_ms"] < 50, f"a handler blocked the event loop for {lag['max_ms']:.0f}ms"
+
+
+def test_media_routes_support_ranges_etags_and_immutable_caching(monkeypatch):
+    import asyncio
+    from benchmarks.run_benchmarks import load_voiceover_app
+    from benchmarks.stub_providers import StubProviderServer
+
+    async def exercise(client):
+        generated = await client.post("/api/generate", json={"text": "Book a survey.", "voice": "v1"})
+        audio_url = (await generated.get_json())["audio_url"]
+        full = await client.get(audio_url)
+        body = await full.get_data()
+        partial = await client.get(audio_url, headers={"Range": "bytes=100-199"})
+        cached = await client.get(audio_url, headers={"If-None-Match": full.headers["ETag"]})
+        return full, body, partial, await partial.get_data(), cached
+
+    with StubProviderServer(time_scale=0) as stub:
+        for name, value in {**stub.env(), "VOICEOVER_LOG_LEVEL": "WARNING", "VOICEOVER_LOG_FILE": ""}.items():
+            monkeypatch.setenv(name, value)
+        app = load_voiceover_app().app
+        full, body, partial, partial_body, cached = asyncio.run(exercise(app.test_client()))
+
+    assert full.status_code == 200 and full.headers["Accept-Ranges"] == "bytes"
+    assert "immutable" in full.headers["Cache-Control"]
+    assert partial.status_code == 206
+    assert partial.headers["Content-Range"] == f"bytes 100-199/{len(body)}"
+    assert partial_body == body[100:200]
+    assert cached.status_code == 304
+
+
+def test_upload_store_streams_multipart_and_deduplicates(tmp_path):
+    import asyncio
+    from tools.upload_store import UploadError, UploadStore
+
+    video = b"\x00\x00\x00\x18ftypmp42" + bytes(range(256)) * 400
+
+    def multipart(filename, payload):
+        body = (b"--b0undary\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nspring ad\r\n"
+                b"--b0undary\r\nContent-Disposition: form-data; name=\"video\"; filename=\"" + filename.encode()
+                + b"\"\r\nContent-Type: video/mp4\r\n\r\n" + payload + b"\r\n--b0undary--\r\n")
+
+        async def chunks():
+            for i in range(0, len(body), 1000):
+                yield body[i:i + 1000]
+        return chunks()
+
+    async def run():
+        store = UploadStore(str(tmp_path), {"mp4"})
+        first = await store.save_multipart(multipart("a.mp4", video), b"b0undary", "video")
+        second = await store.save_multipart(multipart("b.mp4", video), b"b0undary", "video")
+        with pytest.raises(UploadError) as rejected:
+            await store.save_multipart(multipart("c.mp4", b"<html>" * 100), b"b0undary", "video")
+        return first, second, rejected.value
+
+    first, second, rejected = asyncio.run(run())
+
+    assert first["path"] == second["path"] and second["deduplicated"] and not first["deduplicated"]
+    assert first["filename"].startswith("upload_") and first["container"] == "mp4"
+    assert (tmp_path / first["filename"]).read_bytes() == video
+    assert rejected.status == 415
+    assert not list((tmp_path / "uploads").iterdir())
+
+
+def test_resumable_upload_resumes_from_offset_in_another_worker(tmp_path):
+    import asyncio
+    import hashlib
+    from tools.upload_store import UploadError, UploadStore
+
+    video = b"\x1a\x45\xdf\xa3" + b"webm" * 50000
+
+    async def body(data):
+        yield data
+
+    async def run():
+        store = UploadStore(str(tmp_path), {"webm"})
+        upload_id = await store.create(len(video), "footage.webm")
+        await store.append(upload_id, 0, body(video[:70000]))
+        with pytest.raises(UploadError) as conflict:
+            await store.append(upload_id, 10, body(video[10:]))
+
+        # A different process picks the upload up where it stopped
+        other_worker = UploadStore(str(tmp_path), {"webm"})
+        offset = (await other_worker.status(upload_id))["offset"]
+        done = await other_worker.append(upload_id, offset, body(video[offset:]))
+        return conflict.value, offset, done, await other_worker.status(upload_id)
+
+    conflict, offset, done, status = asyncio.run(run())
+
+    assert conflict.status == 409 and offset == 70000
+    assert done["complete"] and status["complete"]
+    assert done["result"]["sha256"] == hashlib.sha256(video).hexdigest()
+    assert (tmp_path / done["result"]["filename"]).read_bytes() == video
+
+
+def test_concurrent_appends_from_two_workers_do_not_interleave(tmp_path):
+    import asyncio
+    from tools.upload_store import UploadError, UploadStore
+
+    video = b"\x1a\x45\xdf\xa3" + b"webm" * 50000
+
+    async def body(data):
+        for i in range(0, len(data), 10000):
+            await asyncio.sleep(0)
+            yield data[i:i + 10000]
+
+    async def run():
+        first, second = UploadStore(str(tmp_path), {"webm"}), UploadStore(str(tmp_path), {"webm"})
+        upload_id = await first.create(len(video), "footage.webm")
+        results = await asyncio.gather(
+            first.append(upload_id, 0, body(video[:100000])),
+            second.append(upload_id, 0, body(video[:100000])),
+            return_exceptions=True
+        )
+        return results, await second.status(upload_id)
+
+    results, status = asyncio.run(run())
+
+    assert sorted(type(result).__name__ for result in results) == ["UploadError", "dict"]
+    assert next(r for r in results if isinstance(r, UploadError)).status == 409
+    assert status["offset"] == 100000
+
+
+def test_create_upload_rejects_malformed_metadata(monkeypatch):
+    import asyncio
+    from benchmarks.run_benchmarks import load_voiceover_app
+    from benchmarks.stub_providers import StubProviderServer
+
+    async def create(client, metadata):
+        response = await client.post("/api/uploads", headers={"Upload-Length": "100", "Upload-Metadata": metadata})
+        return response.status_code
+
+    with StubProviderServer(time_scale=0) as stub:
+        for name, value in {**stub.env(), "VOICEOVER_LOG_LEVEL": "WARNING", "VOICEOVER_LOG_FILE": ""}.items():
+            monkeypatch.setenv(name, value)
+        client = load_voiceover_app().app.test_client()
+        assert asyncio.run(create(client, "filename not-base64!")) == 400
+        assert asyncio.run(create(client, "filename //79")) == 400
+        assert asyncio.run(create(client, "filename Zm9vdGFnZS5tcDQ=")) == 201
+
+
+FFPROBE_OUTPUT = {
+    "streams": [
+        {"index": 0, "codec_type": "video", "codec_name": "h264", "width": 1080, "height": 1920,
+         "pix_fmt": "yuv420p", "avg_frame_rate": "30000/1001", "duration": "14.981"},
+        {"index": 1, "codec_type": "audio", "codec_name": "aac", "sample_rate": "48000", "channels": 2,
+         "duration": "14.955"},
+    ],
+    "format": {"format_name": "mov,mp4,m4a,3gp,3g2,mj2", "duration": "14.981", "size": "5242880", "bit_rate": "2799000"},
+}
+
+LOUDNORM_STDERR = """[Parsed_loudnorm_0 @ 0x5581] 
+{
+	"input_i" : "-23.41",
+	"input_tp" : "-4.02",
+	"input_lra" : "6.10",
+	"input_thresh" : "-33.80",
+	"output_i" : "-14.20",
+	"target_offset" : "0.20"
+}
+"""
+
+
+def test_parse_ffprobe_and_loudnorm_output():
+    from tools.media_index import can_stream_copy_video, parse_ffprobe, parse_loudnorm
+
+    metadata = parse_ffprobe(FFPROBE_OUTPUT)
+    loudness = parse_loudnorm(LOUDNORM_STDERR)
+
+    assert metadata["duration"] == 14.981
+    assert metadata["video"]["fps"] == 29.97 and metadata["video"]["height"] == 1920
+    assert metadata["audio"]["sample_rate"] == 48000
+    assert can_stream_copy_video(metadata)
+    assert loudness == {"integrated_lufs": -23.41, "true_peak_db": -4.02, "lra": 6.1, "threshold": -33.8}
+
+
+def test_media_index_probes_each_asset_once(tmp_path, monkeypatch):
+    import asyncio
+    from tools.media_index import MediaIndex
+
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 1000)
+    copy = tmp_path / "copy.mp4"
+    copy.write_bytes(clip.read_bytes())
+    commands = []
+
+    async def fake_run(self, *cmd):
+        commands.append(cmd[0])
+        await asyncio.sleep(0.01)
+        if cmd[0] == "ffprobe":
+            return 0, json.dumps(FFPROBE_OUTPUT), ""
+        return 0, "", LOUDNORM_STDERR
+
+    monkeypatch.setattr(MediaIndex, "_run", fake_run)
+    monkeypatch.setattr(MediaIndex, "available", True)
+    index_path = str(tmp_path / "index.json")
+
+    async def run():
+        index = MediaIndex(index_path)
+        results = await asyncio.gather(*(index.get(str(clip)) for _ in range(5)), index.get(str(copy)))
+        # A new process reads the persisted entry instead of probing again
+        return results, await MediaIndex(index_path).get(str(clip))
+
+    results, reloaded = asyncio.run(run())
+
+    assert commands == ["ffprobe", "ffmpeg"]
+    assert all(result["duration"] == 14.981 for result in results)
+    assert reloaded["loudness"]["integrated_lufs"] == -23.41
+
+    async def cancel_first_caller():
+        index = MediaIndex(str(tmp_path / "fresh.json"))
+        first = asyncio.ensure_future(index.get(str(clip)))
+        second = asyncio.ensure_future(index.get(str(clip)))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second
+
+    # The caller that started the probe going away leaves it running for the others
+    assert asyncio.run(cancel_first_caller())["duration"] == 14.981
+
+
+def test_mix_graph_ducks_source_audio_and_normalizes_in_one_graph():
+    from tools.audio_mix import MixConfig, build_filter_graph
+
+    graph, maps = build_filter_graph(
+        voice_loudness={"integrated_lufs": -20.0},
+        source_has_audio=True,
+        source_loudness={"integrated_lufs": -18.0},
+        subtitles_path="/tmp/subs.srt",
+        config=MixConfig.for_platform("meta"),
+    )
+    chains = graph.split(";")
+
+    assert chains[0] == "[0:v]subtitles='/tmp/subs.srt'[vout]"
+    assert "volume=6.00dB,apad,asplit=2[voice][sidechain]" in chains[1]
+    assert "volume=-8.00dB[bed]" in chains[2]
+    assert chains[3].startswith("[bed][sidechain]sidechaincompress=")
+    assert chains[-1].startswith("[mix]loudnorm=I=-14.0:TP=-1.5")
+    assert maps == ["-map", "[vout]", "-map", "[aout]"]
+
+    voice_only, maps = build_filter_graph(config=MixConfig.for_platform("ebu_r128"))
+    assert "sidechaincompress" not in voice_only and "loudnorm=I=-23.0" in voice_only
+    assert maps == ["-map", "0:v:0", "-map", "[aout]"]
+
+
+def test_render_keeps_the_soundtrack_to_the_end_of_the_video(tmp_path, monkeypatch):
+    import asyncio
+    import subprocess
+    imageio_ffmpeg = pytest.importorskip("imageio_ffmpeg")
+    from benchmarks.run_benchmarks import load_voiceover_app
+    from benchmarks.stub_providers import StubProviderServer
+
+    # The render shells out to "ffmpeg"; use the binary bundled with imageio-ffmpeg
+    ffmpeg = imageio_ffmpeg.get_ffmpeg_exe()
+    (tmp_path / "bin").mkdir()
+    (tmp_path / "bin" / "ffmpeg").symlink_to(ffmpeg)
+    monkeypatch.setenv("PATH", f"{tmp_path / 'bin'}:{os.environ['PATH']}")
+
+    video, voice, subtitles = tmp_path / "source.mp4", tmp_path / "voice.wav", tmp_path / "voice.srt"
+    subprocess.run([ffmpeg, "-v", "error", "-f", "lavfi", "-i", "testsrc=size=160x120:rate=25:duration=6",
+                    "-f", "lavfi", "-i", "sine=frequency=220:duration=6", "-c:v", "libx264", "-c:a", "aac",
+                    "-shortest", "-y", str(video)], check=True)
+    subprocess.run([ffmpeg, "-v", "error", "-f", "lavfi", "-i", "sine=frequency=880:duration=2", "-y", str(voice)],
+                   check=True)
+    subtitles.write_text("1\n00:00:00,000 --> 00:00:02,000\nBook now.\n")
+
+    with StubProviderServer(time_scale=0) as stub:
+        for name, value in {**stub.env(), "VOICEOVER_LOG_LEVEL": "WARNING", "VOICEOVER_LOG_FILE": ""}.items():
+            monkeypatch.setenv(name, value)
+        module = load_voiceover_app()
+        rendered = asyncio.run(module.combine_video_audio_subtitles(
+            str(video), str(voice), str(subtitles),
+            video_metadata={"duration": 6.0, "audio": {"codec_name": "aac"}, "video": {"codec_name": "h264"}},
+            burn_subtitles=False
+        ))
+    try:
+        pcm = subprocess.run([ffmpeg, "-v", "error", "-i", rendered, "-map", "0:a:0", "-ac", "1", "-ar", "48000",
+                              "-f", "s16le", "-"], check=True, capture_output=True).stdout
+    finally:
+        os.remove(rendered)
+
+    assert len(pcm) / 2 / 48000 == pytest.approx(6.0, abs=0.1)
+
+
+def test_split_sentences_and_stitch_pcm_offsets():
+    import io
+    import wave
+    from tools.tts_engine import split_sentences, stitch_pcm
+
+    assert split_sentences('Book now. "Why wait?" Sale ends soon!  ') == ["Book now.", '"Why wait?"', "Sale ends soon!"]
+
+    # 0.5s and 0.25s of 16-bit audio at 1kHz; the odd trailing byte is dropped
+    voiceover = stitch_pcm([b"\x01\x00" * 500 + b"\x00", b"\x02\x00" * 250], ["One.", "Two."], 1000)
+    assert [(s.start, s.end) for s in voiceover.segments] == [(0.0, 0.5), (0.5, 0.75)]
+    assert voiceover.duration == 0.75
+    with wave.open(io.BytesIO(voiceover.audio)) as wav:
+        assert (wav.getframerate(), wav.getnframes()) == (1000, 750)
+
+
+def test_tts_engine_synthesizes_sentences_concurrently():
+    import asyncio
+    import time
+    from elevenlabs.client import ElevenLabs
+    from benchmarks.stub_providers import StubProviderServer
+    from tools.tts_engine import TTSEngine
+
+    script = "One two three. Four five. Six! Seven eight? Nine ten eleven. Twelve."
+    with StubProviderServer(latency={"elevenlabs": "fixed:0.2"}, time_scale=1) as stub:
+        engine = TTSEngine(ElevenLabs(api_key="test", base_url=stub.env()["ELEVENLABS_BASE_URL"]),
+                           max_concurrency=6)
+        started = time.perf_counter()
+        voiceover = asyncio.run(engine.synthesize(script, "v1"))
+        elapsed = time.perf_counter() - started
+
+    # Six sentences at 200ms each finish in about one round trip, not six
+    assert elapsed < 0.6
+    assert [segment.text for segment in voiceover.segments][-1] == "Twelve."
+    assert len(voiceover.segments) == 6
+    assert voiceover.segments[0].start == 0 and voiceover.segments[-1].end == voiceover.duration
+    assert all(a.end == b.start for a, b in zip(voiceover.segments, voiceover.segments[1:]))
+
+
+def test_tts_engine_falls_back_to_whole_script_mp3_when_pcm_is_rejected(monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+    from elevenlabs.core.api_error import ApiError
+    from tools.tts_engine import TTSEngine
+
+    monkeypatch.delenv("TTS_SAMPLE_RATE", raising=False)
+    formats = []
+
+    def convert(voice_id, text, model_id, output_format, **kwargs):
+        formats.append(output_format)
+        if output_format.startswith("pcm_"):
+            raise ApiError(status_code=403, body={"detail": {"status": "output_format_not_allowed",
+                                                             "message": "pcm_24000 requires a higher tier"}})
+        return iter([b"ID3", b"mp3 frames"])
+
+    engine = TTSEngine(SimpleNamespace(text_to_speech=SimpleNamespace(convert=convert)))
+    first = asyncio.run(engine.synthesize("Book now. Sale ends soon.", "v1"))
+    second = asyncio.run(engine.synthesize("Learn more.", "v1"))
+
+    assert engine.sample_rate == 24000
+    assert first.format == "mp3" and first.audio == b"ID3mp3 frames" and first.segments == []
+    # Once rejected, later scripts skip the PCM fan-out entirely
+    assert formats == ["pcm_24000", "pcm_24000", "mp3_44100_128", "mp3_44100_128"]
+    assert second.format == "mp3"
+
+
+def test_voice_catalog_revalidates_with_etag_and_caches_samples(tmp_path):
+    import asyncio
+    from benchmarks.stub_providers import StubProviderServer
+    from tools.voice_catalog import VoiceCatalog
+
+    synthesized = []
+
+    async def synthesize(text, voice_id):
+        synthesized.append(voice_id)
+        return b"RIFF" + b"\x00" * 64
+
+    async def run(stub):
+        catalog = VoiceCatalog(str(tmp_path), api_key="stub", base_url=f"{stub.url}/elevenlabs",
+                               ttl=3600, synthesize=synthesize)
+        first = await catalog.catalog()
+        revalidated = await catalog.catalog(force=True)
+        fetched = await catalog.prefetch_samples()
+        again = await catalog.prefetch_samples()
+        sample = await catalog.sample("cl0nedV0ice00000000a")
+        # The API now fails: the cached list keeps being served
+        catalog.base_url = f"{stub.url}/unavailable"
+        stale = await catalog.catalog(force=True)
+        return first, revalidated, fetched, again, sample, stale
+
+    with StubProviderServer(time_scale=0) as stub:
+        first, revalidated, fetched, again, sample, stale = asyncio.run(run(stub))
+        voice_calls = [call for call in stub.calls if call[2] == "/elevenlabs/v1/voices"]
+
+    assert [voice["name"] for voice in first["voices"]] == ["George", "Bella", "Brand voice"]
+    assert len(voice_calls) == 2 and revalidated["version"] == first["version"]
+    # Two previews downloaded, the voice without one synthesized once
+    assert (fetched, again) == (3, 0)
+    assert synthesized == ["cl0nedV0ice00000000a"]
+    assert sample.endswith(".wav")
+    assert stale["stale"] and stale["voices"] == first["voices"]
+
+
+def test_video_renders_share_the_background_runtime_and_report_progress(monkeypatch, tmp_path):
+    import time
+    monkeypatch.setenv("FAL_KEY", "stub")
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setenv("ELEVENLABS_API_KEY", "stub")
+    from benchmarks.stub_providers import StubFalClient, StubProviderServer
+    from tools.video_creator import VideoCreator, VideoGenerationConfig
+    from utils.async_runtime import AsyncRuntime
+
+    image = tmp_path / "product.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x00" * 1024)
+    runtime = AsyncRuntime(name="render-runtime")
+    loop = runtime.loop
+
+    with StubProviderServer(latency={"fal": "fixed:0.2"}, time_scale=1) as stub:
+        creator = VideoCreator()
+        creator.fal = StubFalClient(stub.url)
+        try:
+            start = time.perf_counter()
+            jobs = [
+                runtime.start_job(f"spin {i}", lambda report, i=i: creator.create_video(
+                    VideoGenerationConfig(prompt=f"Product spin {i}", image_url=str(image)), progress=report
+                ))
+                for i in range(8)
+            ]
+            # Submitting returns at once; the caller is free while renders run
+            assert time.perf_counter() - start < 0.1
+            results = [job.future.result(timeout=10) for job in jobs]
+            elapsed = time.perf_counter() - start
+        finally:
+            runtime.close()
+
+    # Three 200ms provider calls per render, overlapped across all eight
+    assert elapsed < 2.0
+    assert all(result["video"]["url"] for result in results)
+    assert all(job.progress == ["Uploading image", "Rendering video", "Done"] for job in jobs)
+    # Every render used the one client bound to the runtime's loop
+    assert creator.fal._loop is loop
+
+
+def test_identical_video_renders_share_one_provider_call(monkeypatch, tmp_path):
+    import asyncio
+    monkeypatch.setenv("FAL_KEY", "stub")
+    monkeypatch.setenv("OPENAI_API_KEY", "stub")
+    monkeypatch.setenv("ELEVENLABS_API_KEY", "stub")
+    monkeypatch.setenv("SINGLEFLIGHT_DIR", str(tmp_path / "flight"))
+    monkeypatch.setattr("utils.singleflight._singleflight", None)
+    from benchmarks.stub_providers import StubFalClient, StubProviderServer
+    from tools.video_creator import VideoCreator, VideoGenerationConfig
+
+    # Two uploads of the same picture under different names, as from two clicks
+    images = [tmp_path / f"upload-{i}.png" for i in range(2)]
+    for image in images:
+        image.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x01" * 1024)
+    other = tmp_path / "other.png"
+    other.write_bytes(b"\x89PNG\r\n\x1a\n" + b"\x02" * 1024)
+
+    async def render_all(creator, progress):
+        return await asyncio.gather(*[
+            creator.create_video(VideoGenerationConfig(prompt="Product spin", image_url=str(path)),
+                                 progress=progress[i].append)
+            for i, path in enumerate(images + [other])
+        ])
+
+    with StubProviderServer(latency={"fal": "fixed:0.2"}, time_scale=1) as stub:
+        creator = VideoCreator()
+        creator.fal = StubFalClient(stub.url)
+        progress = [[], [], []]
+        results = asyncio.run(render_all(creator, progress))
+
+    # One upload, submit and result for the shared render, and three for the other picture
+    assert len(stub.calls) == 6
+    assert results[0] == results[1]
+    assert progress[0] == progress[1] == progress[2] == ["Uploading image", "Rendering video", "Done"]
+    assert creator._watchers == {}
+
+
+def test_tool_registry_validates_caches_limits_and_loads_lazily():
+    import sys
+    import threading
+    import time
+    from tools.base import Parameter, ToolRegistry, ToolSpec
+
+    calls = []
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    class Owner:
+        def insights(self, start_date, end_date, k=5):
+            calls.append((start_date, end_date, k))
+            return {"success": True, "details": f"{start_date}..{end_date}", "k": k}
+
+        def slow(self):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+            return {"success": True, "details": "done"}
+
+    async def sleepy():
+        import asyncio
+        await asyncio.sleep(1)
+        return {"success": True, "details": "late"}
+
+    registry = ToolRegistry([
+        ToolSpec("Insights", "Fetch insights", Owner.insights, method=True, idempotent=True, cache_ttl=60,
+                 parameters=[Parameter("start_date"), Parameter("end_date"),
+                             Parameter("k", "integer", required=False, default=5)]),
+        ToolSpec("Slow", "Limited tool", Owner.slow, method=True, max_concurrency=2),
+        ToolSpec("Sleepy", "Async tool", sleepy, timeout=0.1, idempotent=True),
+        ToolSpec("Lazy", "Heavy tool", "tools.audio_mix:build_filter_graph"),
+    ])
+    owner = Owner()
+
+    assert registry.execute("Insights", {"start_date": "2025-01-01"}, owner)["details"] == \
+        "Missing required parameters for Insights. Need: ['end_date']"
+    assert "must be a integer" in registry.execute(
+        "Insights", {"start_date": "a", "end_date": "b", "k": "many"}, owner)["details"]
+    first = registry.execute("Insights", {"start_date": "2025-01-01", "end_date": "2025-01-07", "k": "3"}, owner)
+    again = registry.execute("Insights", {"end_date": "2025-01-07", "start_date": "2025-01-01", "k": 3}, owner)
+    assert first["k"] == 3 and again["cached"] and len(calls) == 1
+    assert registry.execute("Nope", {})["details"] == "Tool Nope not implemented yet"
+
+    threads = [threading.Thread(target=registry.execute, args=("Slow", {}, owner)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+
+    timed_out = registry.execute("Sleepy", {})
+    assert not timed_out["success"] and "timed out" in timed_out["details"]
+    assert registry.metrics.snapshot()["Sleepy"]["errors"] == 1
+    assert registry.metrics.snapshot()["Insights"]["count"] == 1  # cache hits and invalid calls never run
+
+    # String handlers are not imported until the tool runs
+    sys.modules.pop("tools.audio_mix", None)
+    schema = {s["name"]: s for s in registry.tool_schemas()}
+    assert schema["Insights"]["input_schema"]["required"] == ["start_date", "end_date"]
+    assert schema["Insights"]["input_schema"]["properties"]["k"]["type"] == "integer"
+    assert "- Insights: Fetch insights. Parameters: start_date (string)" in registry.prompt_section()
+    assert "tools.audio_mix" not in sys.modules
+    registry.handler("Lazy")
+    assert "tools.audio_mix" in sys.modules
+
+
+def test_timed_out_upload_keeps_its_slot_and_reports_an_unknown_outcome(capsys, monkeypatch):
+    import time
+    from tools.base import Parameter, ToolRegistry, ToolSpec
+
+    events = []
+
+    def upload(video="a"):
+        events.append(("start", video))
+        time.sleep(0.3)
+        events.append(("end", video))
+        return {"success": True, "details": "Video uploaded successfully! Video ID: 42"}
+
+    registry = ToolRegistry([ToolSpec("Upload", "Posts a video", upload, max_concurrency=1, timeout=0.1)])
+    first = registry.execute("Upload", {})
+    assert first["outcome_unknown"] and not first["success"]
+    assert "may still complete" in first["details"]
+    from agents.job_pool import describe_result
+    summary = describe_result({"tool_name": "Upload", "tool_execution_result": first})
+    assert summary.startswith("Upload may still be running") and "failed" not in summary
+
+    # The first upload still holds the only slot: the second gives up within its timeout, unrun
+    start = time.monotonic()
+    second = registry.execute("Upload", {})
+    assert second["busy"] and not second["success"] and time.monotonic() - start < 0.25
+    time.sleep(0.3)
+    assert events == [("start", "a"), ("end", "a")]
+    assert "Upload succeeded after its timeout" in capsys.readouterr().out
+    # Once it has finished, its slot is free again
+    assert registry._semaphores["Upload"].acquire(blocking=False)
+
+    # Without a concurrency limit, time queued for a worker does not count as running:
+    # a call that never got a worker is withdrawn and reported busy, not of unknown outcome
+    monkeypatch.setattr("tools.base.DEFAULT_TOOL_WORKERS", 1)
+    unlimited = ToolRegistry([ToolSpec("Upload", "Posts a video", upload, timeout=0.1,
+                                       parameters=[Parameter("video")])])
+    events.clear()
+    results = []
+    threads = [threading.Thread(target=lambda v=v: results.append(unlimited.execute("Upload", {"video": v})))
+               for v in "bc"]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    time.sleep(0.4)
+    assert [result.get("outcome_unknown", False) for result in results] == [True, False]
+    assert results[1]["busy"] and "not run" in results[1]["details"]
+    assert events == [("start", "b"), ("end", "b")]
@@ -0,0 +1,455 @@
+import asyncio
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.http_client import AsyncHttpClient, HttpClient, parse_meta_usage, parse_retry_after
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.server.hits.append((self.path, self.client_address[1]))
+        if self.path == "/flaky" and len(self.server.hits) == 1:
+            return self._reply(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.05}})
+        if self.path == "/unavailable":
+            return self._reply(503, {"ok": False})
+        if self.path == "/busy" and [path for path, _ in self.server.hits].count("/busy") == 1:
+            return self._reply(503, {"ok": False}, {"Retry-After": "0.05"})
+        self._reply(200, {"ok": True})
+
+    def do_GET(self):
+        self.server.hits.append((self.path, self.client_address[1]))
+        if self.path == "/unavailable" and len(self.server.hits) == 1:
+            return self._reply(503, {"ok": False})
+        self._reply(200, {"ok": True}, {"X-Business-Use-Case-Usage": json.dumps(
+            {"1": [{"type": "ads_management", "call_count": 95, "total_cputime": 10, "total_time": 10}]}
+        )})
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.hits = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def test_parse_meta_usage_pauses_near_limit():
+    busy = {"X-Business-Use-Case-Usage": json.dumps({"1": [{"call_count": 99, "total_time": 5}]})}
+    blocked = {"X-Business-Use-Case-Usage": json.dumps({"1": [{"call_count": 100, "estimated_time_to_regain_access": 2}]})}
+    assert parse_meta_usage({"X-Business-Use-Case-Usage": json.dumps({"1": [{"call_count": 10}]})}) == 0
+    assert 0 < parse_meta_usage(busy) <= 60
+    assert parse_meta_usage(blocked) == 120
+
+
+def test_parse_retry_after_reads_telegram_body():
+    assert parse_retry_after({}, {"ok": False, "parameters": {"retry_after": 3}}) == 3
+    assert parse_retry_after({"Retry-After": "7"}) == 7
+
+
+def test_sync_client_retries_429_and_reuses_connection(stub_server):
+    client = HttpClient(backoff_base=0.01)
+    response = client.post(f"{base_url(stub_server)}/flaky", json={"text": "hi"})
+    client.post(f"{base_url(stub_server)}/ok", json={"text": "again"})
+
+    assert response.json() == {"ok": True}
+    assert len(stub_server.hits) == 3
+    assert len({port for _, port in stub_server.hits}) == 1
+    metrics = client.host_metrics()[f"127.0.0.1:{stub_server.server_address[1]}"]
+    assert metrics["count"] == 3 and metrics["errors"] == 1
+
+
+def test_sync_client_does_not_repeat_posts_the_server_may_have_acted_on(stub_server):
+    client = HttpClient(backoff_base=0.01)
+    assert client.post(f"{base_url(stub_server)}/unavailable", json={"text": "hi"}).status_code == 503
+    assert len(stub_server.hits) == 1
+
+    # An explicit Retry-After means the message was not taken
+    assert client.post(f"{base_url(stub_server)}/busy", json={"text": "hi"}).status_code == 200
+    assert len(stub_server.hits) == 3
+
+
+def test_sync_client_retries_idempotent_requests_on_5xx(stub_server):
+    client = HttpClient(backoff_base=0.01)
+    assert client.get(f"{base_url(stub_server)}/unavailable").status_code == 200
+    assert len(stub_server.hits) == 2
+
+
+def test_post_is_retried_only_when_connection_was_refused():
+    import socket
+
+    import requests
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    client = HttpClient(backoff_base=0.01, max_retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client.post(f"http://127.0.0.1:{port}/send", json={"text": "hi"})
+    assert client.host_metrics()[f"127.0.0.1:{port}"]["count"] == 3
+
+
+def test_sync_client_throttles_host_on_meta_usage(stub_server):
+    client = HttpClient(max_throttle=0.2)
+    client.get(f"{base_url(stub_server)}/insights")
+    assert client.throttle.wait_time(f"127.0.0.1:{stub_server.server_address[1]}") > 0
+
+
+def test_async_client_retries_429(stub_server):
+    async def run():
+        client = AsyncHttpClient(backoff_base=0.01)
+        try:
+            response = await client.post(f"{base_url(stub_server)}/flaky", json={"text": "hi"})
+            return response.json()
+        finally:
+            await client.aclose()
+
+    assert asyncio.run(run()) == {"ok": True}
+    assert len(stub_server.hits) == 2
+
+
+def test_prompt_logger_writes_json_lines_from_many_threads(tmp_path):
+    from utils.logger import PromptLogger, read_log
+
+    log_path = str(tmp_path / "prompts.jsonl")
+    logger = PromptLogger(log_path)
+
+    def log_many(thread_index):
+        for i in range(50):
+            logger.log_interaction("USER", {"thread": thread_index, "i": i}, session_id=f"s{thread_index}")
+
+    threads = [threading.Thread(target=log_many, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.close()
+
+    entries = list(read_log(log_path))
+    assert len(entries) == 200
+    session = list(read_log(log_path, session_id="s2"))
+    assert [entry["content"]["i"] for entry in session] == list(range(50))
+
+
+def test_prompt_logger_rotates_into_gzip_archives(tmp_path):
+    from utils.logger import PromptLogger, replay_session
+
+    log_path = str(tmp_path / "prompts.jsonl")
+    logger = PromptLogger(log_path, max_bytes=500, backup_count=2)
+    for i in range(40):
+        logger.log_interaction("USER", f"message {i}", session_id="s")
+        logger.flush()
+    logger.close()
+
+    archives = list(tmp_path.glob("prompts.jsonl.*.gz"))
+    assert 1 <= len(archives) <= 2
+    replayed = replay_session(log_path, "s")
+    assert replayed[-1]["content"] == "message 39"
+
+
+def test_prompt_logger_keeps_writing_after_an_unexpected_error(tmp_path, monkeypatch):
+    from utils.logger import PromptLogger, read_log
+
+    log_path = str(tmp_path / "prompts.jsonl")
+    logger = PromptLogger(log_path)
+    write_batch = logger._write_batch
+    failures = []
+
+    def fail_once(lines, force_fsync):
+        if not failures:
+            failures.append(lines)
+            raise ValueError("unexpected")
+        write_batch(lines, force_fsync)
+
+    monkeypatch.setattr(logger, "_write_batch", fail_once)
+    circular = {}
+    circular["self"] = circular
+    logger.log_interaction("USER", "lost")
+    logger.flush()
+    logger.log_interaction("USER", circular)
+    logger.log_interaction("USER", "kept")
+    logger.close()
+
+    assert failures
+    assert [entry["content"] for entry in read_log(log_path)] == ["kept"]
+
+
+def test_tracer_exports_nested_spans_and_summarizes(tmp_path):
+    from types import SimpleNamespace
+    from utils.tracing import SpanExporter, Tracer, record_llm_usage, summarize_trace_file
+
+    trace_path = str(tmp_path / "trace.jsonl")
+    tracer = Tracer(SpanExporter(trace_path))
+
+    @tracer.traced("tool.Write_Report")
+    def write_report():
+        usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=500)
+        record_llm_usage("o3-mini-2025-01-31", SimpleNamespace(usage=usage))
+
+    with tracer.span("big_mind.process_request") as parent:
+        write_report()
+    with pytest.raises(ValueError):
+        with tracer.span("big_mind.process_request"):
+            raise ValueError("boom")
+    tracer.exporter.flush()
+
+    spans = [s for line in open(trace_path) for s in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    child = next(s for s in spans if s["name"] == "tool.Write_Report")
+    assert child["traceId"] == parent.trace_id and child["parentSpanId"] == parent.span_id
+
+    summary = summarize_trace_file(trace_path)
+    assert summary["big_mind.process_request"]["count"] == 2
+    assert summary["big_mind.process_request"]["errors"] == 1
+    assert summary["tool.Write_Report"]["input_tokens"] == 1000
+    assert summary["tool.Write_Report"]["cost_usd"] == pytest.approx(0.0033)
+    assert tracer.histograms()["tool.Write_Report"]["count"] == 1
+
+
+def test_async_runtime_runs_submitted_coroutines_on_one_shared_loop():
+    import contextvars
+    import time
+    from utils.async_runtime import AsyncRuntime
+
+    request_id = contextvars.ContextVar("request_id", default=None)
+    runtime = AsyncRuntime(name="test-runtime")
+
+    async def work(i):
+        await asyncio.sleep(0.2)
+        return i, request_id.get(), threading.current_thread().name
+
+    try:
+        request_id.set("from-page")
+        start = time.perf_counter()
+        futures = [runtime.submit(work(i)) for i in range(20)]
+        results = [future.result(timeout=5) for future in futures]
+        # Twenty 0.2s sleeps overlap on the one loop instead of running back to back
+        assert time.perf_counter() - start < 1.5
+        assert [r[0] for r in results] == list(range(20))
+        assert {r[1] for r in results} == {"from-page"}
+        assert {r[2] for r in results} == {"test-runtime"}
+
+        async def steps(report):
+            report("first")
+            await asyncio.sleep(0.05)
+            report("second")
+            return "rendered"
+
+        job = runtime.start_job("demo", steps)
+        assert job.future.result(timeout=5) == "rendered"
+        assert job.status == "done" and job.progress == ["first", "second"]
+
+        failed = runtime.start_job("broken", lambda report: _raise())
+        with pytest.raises(ValueError):
+            failed.future.result(timeout=5)
+        assert failed.status == "failed"
+
+        async def nested():
+            return runtime.run(asyncio.sleep(0))
+        with pytest.raises(RuntimeError):
+            runtime.run(nested(), timeout=5)
+    finally:
+        runtime.close()
+
+
+async def _raise():
+    raise ValueError("render failed")
+
+
+def test_memory_manager_extracts_slots_and_folds_turns_without_a_summarizer():
+    from utils.memory_manager import MemoryManager, extract_slots
+
+    slots = extract_slots('Video ready {"video": {"url": "https://fal.media/a/b.mp4"}}, upload_id: 9f3-x for the last 30 days')
+    assert slots == {"video_url": "https://fal.media/a/b.mp4", "upload_id": "9f3-x", "date_range": "last 30 days"}
+
+    def failing_summarizer(summary, turns):
+        raise RuntimeError("rate limited")
+
+    memory = MemoryManager(summarize=failing_summarizer, budget_tokens=200, summary_tokens=60)
+    for i in range(40):
+        memory.add_turn("s", "user", f"turn {i} " + "detail " * 20)
+        memory.executor.submit(lambda: None).result()
+
+    messages = memory.context_messages("s")
+    assert messages[0]["role"] == "system" and "turn " in messages[0]["content"]
+    assert messages[-1]["content"].startswith("turn 39 ")
+    assert sum(len(m["content"]) for m in messages) // 4 <= 200 + 60
+    assert len(memory._sessions["s"].turns) < 10
+
+
+def test_vector_index_searches_100k_chunks_in_milliseconds(tmp_path):
+    import time
+    import numpy as np
+    from utils.vector_index import VectorIndex
+
+    rng = np.random.default_rng(7)
+    index = VectorIndex(str(tmp_path / "index"), ivf_threshold=20000)
+    for batch in range(10):
+        vectors = rng.standard_normal((10000, 64)).astype(np.float32)
+        index.add_vectors(vectors, [{"source": ("report", "insight")[i % 2], "text": f"chunk {batch * 10000 + i}"}
+                                    for i in range(10000)])
+    assert len(index) == 100000 and index.info["trained_rows"] == 80000
+
+    matrix = np.memmap(index.vectors_path, dtype=np.float32, mode="r", shape=(100000, 64))
+    queries = rng.choice(100000, size=100, replace=False)
+    timings, hits = [], 0
+    for row in queries:
+        start = time.perf_counter()
+        results = index.search_vector(matrix[row] + 0.05 * rng.standard_normal(64).astype(np.float32), k=5)
+        timings.append(time.perf_counter() - start)
+        hits += results[0]["id"] == row
+    assert np.median(timings) < 0.01
+    assert hits >= 90
+
+    filtered = index.search_vector(matrix[4], k=3, where={"source": "insight"})
+    assert len(filtered) == 3 and all(r["metadata"]["source"] == "insight" for r in filtered)
+
+    # A torn final record (crash mid-append) is dropped on reopen, and adds resume cleanly
+    with open(index.records_path, "ab") as f:
+        f.write(b'{"text": "half wr')
+    reopened = VectorIndex(str(tmp_path / "index"))
+    assert len(reopened) == 100000
+    [new_id] = reopened.add(["Spring sale video ad for the running shoes"], [{"source": "creative"}])
+    assert reopened.search("Spring sale video ad for the running shoes", k=1)[0]["id"] == new_id
+    # Only one creative exists, so the filtered search falls back to an exact scan to find it
+    assert [r["id"] for r in reopened.search("shoes", k=2, where={"source": "creative"})] == [new_id]
+    assert reopened.record(new_id)["text"].startswith("Spring sale")
+
+
+def test_vector_index_writers_sharing_a_directory_keep_each_others_rows(tmp_path):
+    import subprocess
+    import sys
+    from utils.vector_index import VectorIndex
+
+    path = str(tmp_path / "index")
+    first, second = VectorIndex(path), VectorIndex(path)
+    first.add(["Spring sale report"], [{"source": "report"}])
+    second.add(["Running shoes creative"], [{"source": "creative"}])
+    first.add(["Weekly insight snapshot"], [{"source": "insight"}])
+
+    # A writer in another process appends too
+    script = (f"from utils.vector_index import VectorIndex; "
+              f"VectorIndex({path!r}).add(['Summer retargeting video'], [{{'source': 'creative'}}])")
+    subprocess.run([sys.executable, "-c", script], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+
+    reopened = VectorIndex(path)
+    texts = [reopened.record(row)["text"] for row in range(len(reopened))]
+    assert texts == ["Spring sale report", "Running shoes creative", "Weekly insight snapshot", "Summer retargeting video"]
+    # Existing instances see the other writers' rows on their next search
+    assert second.search("Weekly insight snapshot", k=1)[0]["text"] == "Weekly insight snapshot"
+    assert first.search("Summer retargeting video", k=1)[0]["id"] == 3
+
+
+def test_singleflight_shares_one_execution_across_threads_and_processes(tmp_path):
+    import subprocess
+    import sys
+    import time
+    from utils.singleflight import SingleFlight, make_key
+
+    flight = SingleFlight(str(tmp_path / "flight"))
+    calls = []
+    start = threading.Barrier(8)
+    results = [None] * 8
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"success": True, "rows": [1, 2, 3]}
+
+    def caller(i):
+        start.wait()
+        # Parameter order does not change the key
+        params = {"start_date": "2024-01-01", "end_date": "2024-01-31"} if i % 2 else \
+            {"end_date": "2024-01-31", "start_date": "2024-01-01"}
+        results[i] = flight.do(make_key("insight", params), work)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1 and flight.executions == 1 and flight.shared == 7
+    assert all(result == {"success": True, "rows": [1, 2, 3]} for result in results)
+    # Deduplication, not caching: a later call runs again
+    flight.do(make_key("insight", {"start_date": "2024-01-01", "end_date": "2024-01-31"}), work)
+    assert len(calls) == 2
+
+    # Two worker processes asking at once: one runs, the other reads its result
+    log = tmp_path / "runs.log"
+    script = (
+        "import os, sys, time, json\n"
+        "from utils.singleflight import SingleFlight\n"
+        "def work():\n"
+        "    with open(sys.argv[2], 'a') as f: f.write(str(os.getpid()) + '\\n')\n"
+        "    time.sleep(1)\n"
+        "    return {'pid': os.getpid()}\n"
+        "print(json.dumps(SingleFlight(sys.argv[1]).do('report:q1', work)))\n"
+    )
+    processes = [
+        subprocess.Popen([sys.executable, "-c", script, str(tmp_path / "flight"), str(log)],
+                         stdout=subprocess.PIPE, text=True)
+        for _ in range(2)
+    ]
+    outputs = [json.loads(process.communicate(timeout=20)[0]) for process in processes]
+    runs = log.read_text().split()
+    assert len(runs) == 1
+    assert outputs[0] == outputs[1] == {"pid": int(runs[0])}
+
+
+def test_singleflight_only_shares_through_a_private_directory(tmp_path, monkeypatch):
+    import os
+    import stat
+    import time
+    from utils.singleflight import _MISSING, SingleFlight
+
+    # A directory left world writable by an older version is locked down
+    shared = tmp_path / "flight"
+    shared.mkdir(mode=0o777)
+    os.chmod(shared, 0o777)
+    flight = SingleFlight(str(shared))
+    assert flight.cross_process and stat.S_IMODE(os.stat(shared).st_mode) == 0o700
+
+    # Anything but a pickled result, such as a truncated or garbled file, is ignored
+    _, result_path = flight._paths("report:q1")
+    with open(result_path, "wb") as f:
+        f.write(b"\x80\x04garbage")
+    assert flight.do("report:q1", lambda: {"success": True}) == {"success": True}
+    assert flight.executions == 1
+    with open(result_path, "wb") as f:
+        f.write(b"\x80\x04K\x01.")  # the integer 1, not a (timestamp, value) pair
+    assert flight._read_result(result_path, time.time()) is _MISSING
+
+    # A directory planted by another user is never read from
+    monkeypatch.setattr("os.getuid", lambda: os.stat(shared).st_uid + 1)
+    assert not SingleFlight(str(shared)).cross_process
+    # Nor is a symlink to somewhere else
+    link = tmp_path / "link"
+    link.symlink_to(shared)
+    monkeypatch.undo()
+    assert not SingleFlight(str(link)).cross_process
@@ -1,16 +1,19 @@
-import requests
-import urllib.request
 import argparse
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.http_client import get_http_client
 
 def upload_ads_video(ad_account_id, video_path, access_token, title="", description=""):
     """Uploads a video to Meta's Marketing API."""
-    url = f"https://graph.facebook.com/v20.0/act_{ad_account_id}/advideos"
+    graph_api_base = os.getenv("GRAPH_API_BASE", "https://graph.facebook.com/v20.0")
+    url = f"{graph_api_base}/act_{ad_account_id}/advideos"
     headers = {"Authorization": f"Bearer {access_token}"}
     print("Invoking video upload...")
     with open(video_path, "rb") as video_file:
         files = {"source": video_file}
         data = {"title": title, "description": description}
-        res = requests.post(url, headers=headers, files=files, data=data)
+        res = get_http_client().post(url, headers=headers, files=files, data=data)
     return res.json()['id']
 
 def download_file(remote_url, file_name):
@@ -18,7 +21,7 @@ def download_file(remote_url, file_name):
     save_path = file_name
     print("Downloading file...")
     try:
-        urllib.request.urlretrieve(remote_url, save_path)
+        get_http_client().download(remote_url, save_path)
         print("File download successful!")
     except Exception as e:
         print(f"Download failed: {e}")
@@ -0,0 +1,124 @@
+"""FFmpeg filter graphs that mix a voiceover over a video's own soundtrack.
+
+The source soundtrack is kept as a bed, ducked under the voiceover with
+sidechain compression for its full length (the voiceover is padded with
+silence once it ends) and the mix is normalised to a platform loudness target,
+all inside the same -filter_complex as the subtitle burn, so a creative is
+encoded once. Loudness measured by the media index pre-levels each input, so
+the final loudnorm only has to correct the mix rather than pump a raw TTS clip.
+"""
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+# Integrated loudness targets in LUFS
+PLATFORM_LOUDNESS = {
+    "meta": -14.0,
+    "youtube": -14.0,
+    "tiktok": -14.0,
+    "ebu_r128": -23.0,
+}
+
+
+@dataclass
+class MixConfig:
+    """Configuration for the voiceover mix.
+
+    Attributes:
+        target_lufs (float): Integrated loudness of the final mix. Defaults to -14 (Meta).
+        true_peak_db (float): Maximum true peak in dBTP. Defaults to -1.5.
+        lra (float): Target loudness range in LU. Defaults to 11.
+        bed_level_db (float): How far below the voiceover the source soundtrack sits
+            before ducking. Defaults to 12.
+        duck_threshold (float): Sidechain level (linear) above which the bed is ducked. Defaults to 0.03.
+        duck_ratio (float): Compression ratio applied to the bed under speech. Defaults to 8.
+        duck_attack_ms (float): How quickly the bed ducks when speech starts. Defaults to 20.
+        duck_release_ms (float): How quickly the bed recovers after speech. Defaults to 400.
+        sample_rate (int): Output sample rate. Defaults to 48000.
+    """
+    target_lufs: float = PLATFORM_LOUDNESS["meta"]
+    true_peak_db: float = -1.5
+    lra: float = 11.0
+    bed_level_db: float = 12.0
+    duck_threshold: float = 0.03
+    duck_ratio: float = 8.0
+    duck_attack_ms: float = 20.0
+    duck_release_ms: float = 400.0
+    sample_rate: int = 48000
+
+    @classmethod
+    def for_platform(cls, platform: str, **overrides) -> "MixConfig":
+        """Build a config targeting a platform from PLATFORM_LOUDNESS."""
+        if platform not in PLATFORM_LOUDNESS:
+            raise ValueError(f"Unknown platform '{platform}', expected one of {', '.join(PLATFORM_LOUDNESS)}")
+        return cls(target_lufs=PLATFORM_LOUDNESS[platform], **overrides)
+
+
+def escape_filter_path(path: str) -> str:
+    """Quote a file path for use as a filter option inside a filter graph."""
+    escaped = path.replace('\\', '\\\\').replace("'", "\\'").replace(':', '\\:')
+    return f"'{escaped}'"
+
+
+def level_gain(loudness: Optional[dict], target_lufs: float, limit: float = 20.0) -> float:
+    """Gain in dB that brings a measured input to target_lufs (0 when unmeasured)."""
+    measured = (loudness or {}).get('integrated_lufs')
+    if measured is None or measured < -70:
+        # Unmeasured or effectively silent
+        return 0.0
+    return max(-limit, min(limit, target_lufs - measured))
+
+
+def build_filter_graph(voice_loudness: Optional[dict] = None,
+                       source_has_audio: bool = False,
+                       source_loudness: Optional[dict] = None,
+                       subtitles_path: Optional[str] = None,
+                       config: MixConfig = None) -> Tuple[str, List[str]]:
+    """Build the -filter_complex graph and -map arguments for a voiceover render.
+
+    Input 0 is the video (with its soundtrack, if any), input 1 the voiceover.
+
+    Args:
+        voice_loudness (Optional[dict]): Media index loudness of the voiceover.
+        source_has_audio (bool): Whether input 0 has an audio stream to keep as a bed.
+        source_loudness (Optional[dict]): Media index loudness of the source soundtrack.
+        subtitles_path (Optional[str]): SRT file to burn into the picture; None keeps
+            the video stream untouched (it is mapped directly from input 0).
+        config (MixConfig): Loudness and ducking settings.
+
+    Returns:
+        Tuple[str, List[str]]: The filter graph and the -map arguments for its outputs.
+    """
+    config = config or MixConfig()
+    audio_format = f"aformat=sample_fmts=fltp:sample_rates={config.sample_rate}:channel_layouts=stereo"
+    voice_gain = level_gain(voice_loudness, config.target_lufs)
+    chains = []
+
+    if subtitles_path:
+        chains.append(f"[0:v]subtitles={escape_filter_path(subtitles_path)}[vout]")
+        maps = ['-map', '[vout]']
+    else:
+        maps = ['-map', '0:v:0']
+
+    if source_has_audio:
+        bed_gain = level_gain(source_loudness, config.target_lufs - config.bed_level_db)
+        chains += [
+            # sidechaincompress stops at the end of its shorter input, so the voiceover is
+            # padded with silence to outlast the bed; the bed alone sets the mix's length
+            f"[1:a]{audio_format},volume={voice_gain:.2f}dB,apad,asplit=2[voice][sidechain]",
+            f"[0:a]{audio_format},volume={bed_gain:.2f}dB[bed]",
+            # The voiceover drives the compressor on the bed, ducking it while someone speaks
+            f"[bed][sidechain]sidechaincompress=threshold={config.duck_threshold}:ratio={config.duck_ratio}"
+            f":attack={config.duck_attack_ms}:release={config.duck_release_ms}[ducked]",
+            # duration=first ends the mix with the soundtrack, i.e. at the end of the video
+            "[ducked][voice]amix=inputs=2:duration=first:dropout_transition=0:normalize=0[mix]",
+        ]
+    else:
+        chains.append(f"[1:a]{audio_format},volume={voice_gain:.2f}dB[mix]")
+
+    # loudnorm resamples to 192kHz internally, so resample back afterwards
+    chains.append(
+        f"[mix]loudnorm=I={config.target_lufs}:TP={config.true_peak_db}:LRA={config.lra},"
+        f"aresample={config.sample_rate}[aout]"
+    )
+    maps += ['-map', '[aout]']
+    return ';'.join(chains), maps
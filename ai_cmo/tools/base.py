@@ -0,0 +1,417 @@
+"""Declarative tool registry.
+
+Each tool is declared once as a ToolSpec: its description, typed parameters,
+whether it is sync or async, how many calls may run at once, its timeout and
+whether its results may be cached. From the declarations the registry builds
+the LLM tool schemas and the tool section of the system prompt, so the two
+can no longer drift from the code, and it applies validation, caching,
+concurrency limits, timeouts and latency metrics the same way to every tool.
+Tools marked singleflight share one execution among concurrent identical
+calls, in this process and across worker processes (see utils.singleflight).
+
+A sync tool with a timeout runs on its own worker pool, sized to its
+concurrency limit, and its timeout starts when a worker picks the call up.
+Once started it cannot be interrupted: the worker keeps running and keeps
+its concurrency slot until it returns. For tools that are not idempotent (an
+ad upload), the timeout is reported as an unknown outcome rather than a
+failure, since the call may still go through. A call that cannot get a slot
+or a worker within the timeout never starts and is reported as busy.
+
+Handlers may be given as "module:attribute" strings; the module is only
+imported the first time the tool runs, so heavy tools (video, TTS) cost
+nothing until they are used.
+"""
+import asyncio
+import contextvars
+import importlib
+import inspect
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Sequence, Union
+
+from utils.metrics import MetricsRegistry
+from utils.singleflight import get_singleflight, make_key
+
+# JSON Schema type name -> accepted Python types
+JSON_TYPES = {
+    "string": (str,),
+    "integer": (int,),
+    "number": (int, float),
+    "boolean": (bool,),
+    "object": (dict,),
+    "array": (list, tuple),
+}
+# Workers for a timed sync tool that has no concurrency limit
+DEFAULT_TOOL_WORKERS = 8
+
+
+@dataclass
+class Parameter:
+    """A tool parameter.
+
+    Attributes:
+        name (str): Argument name.
+        type (Optional[str]): JSON Schema type ("string", "integer", ...), or
+            None to accept any value.
+        description (str): Shown to the model.
+        required (bool): Whether the model must supply it. Defaults to True.
+        default (Any): Value used when an optional parameter is omitted.
+        enum (Optional[Sequence]): Allowed values.
+    """
+    name: str
+    type: Optional[str] = "string"
+    description: str = ""
+    required: bool = True
+    default: Any = None
+    enum: Optional[Sequence] = None
+
+    def schema(self) -> dict:
+        schema = {"description": self.description} if self.description else {}
+        if self.type:
+            schema["type"] = self.type
+        if self.enum:
+            schema["enum"] = list(self.enum)
+        return schema
+
+    def coerce(self, value):
+        """Return value as this parameter's type, or raise ValueError."""
+        if self.type is None or value is None:
+            return value
+        if self.type in ("integer", "number") and isinstance(value, str):
+            # Models often quote numbers
+            try:
+                value = int(value) if self.type == "integer" else float(value)
+            except ValueError:
+                raise ValueError(f"{self.name} must be a {self.type}")
+        if isinstance(value, bool) and self.type in ("integer", "number"):
+            raise ValueError(f"{self.name} must be a {self.type}")
+        if not isinstance(value, JSON_TYPES[self.type]):
+            raise ValueError(f"{self.name} must be a {self.type}")
+        if self.enum and value not in self.enum:
+            raise ValueError(f"{self.name} must be one of {list(self.enum)}")
+        return value
+
+
+class ToolOutcomeUnknown(TimeoutError):
+    """A non-idempotent tool timed out and may still complete."""
+
+
+class ToolBusy(RuntimeError):
+    """A tool call could not start within its timeout; it was not run."""
+
+
+@dataclass
+class ToolSpec:
+    """Declaration of a tool.
+
+    Attributes:
+        name (str): Tool name the model uses.
+        description (str): What the tool does, for the model.
+        handler (Union[str, Callable]): The implementation, or a
+            "module:attribute" path imported on first use. May be a coroutine
+            function, which is run on the shared background event loop.
+        parameters (List[Parameter]): Typed parameters.
+        method (bool): Whether handler is an unbound method called with the
+            registry's owner (e.g. the BigMind instance) as its first argument.
+        max_concurrency (Optional[int]): Calls allowed to run at once; None for no limit.
+        timeout (Optional[float]): Seconds a started call may run before it is
+            reported as failed, or as of unknown outcome if the tool is not
+            idempotent. Also bounds the wait for a free slot or worker.
+        idempotent (bool): Whether repeating a call with the same arguments is safe.
+        cache_ttl (float): Seconds to reuse a successful result of an idempotent
+            tool for identical arguments; 0 disables caching.
+        singleflight (bool): Whether concurrent calls with identical arguments
+            share one execution and its result.
+        usage (str): Extra guidance appended to the tool's prompt line.
+    """
+    name: str
+    description: str
+    handler: Union[str, Callable]
+    parameters: List[Parameter] = field(default_factory=list)
+    method: bool = False
+    max_concurrency: Optional[int] = None
+    timeout: Optional[float] = None
+    idempotent: bool = False
+    cache_ttl: float = 0
+    singleflight: bool = False
+    usage: str = ""
+
+    @property
+    def cacheable(self) -> bool:
+        return self.idempotent and self.cache_ttl > 0
+
+
+class ToolRegistry:
+    """Looks up, validates and runs declared tools.
+
+    Args:
+        specs (Sequence[ToolSpec]): Tools to register.
+        cache_size (int): Cached results kept across all tools.
+    """
+
+    def __init__(self, specs: Sequence[ToolSpec] = (), cache_size: int = 256):
+        self._specs = {}
+        self._handlers = {}
+        self._semaphores = {}
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self._executors = {}
+        self.metrics = MetricsRegistry()
+        for spec in specs:
+            self.register(spec)
+
+    def register(self, spec: ToolSpec) -> ToolSpec:
+        if spec.name in self._specs:
+            raise ValueError(f"Tool {spec.name} is already registered")
+        if spec.cache_ttl and not spec.idempotent:
+            raise ValueError(f"Tool {spec.name} can only be cached if it is idempotent")
+        self._specs[spec.name] = spec
+        if spec.max_concurrency:
+            self._semaphores[spec.name] = threading.BoundedSemaphore(spec.max_concurrency)
+        return spec
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def names(self) -> List[str]:
+        return list(self._specs)
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        return self._specs.get(name)
+
+    def handler(self, name: str) -> Callable:
+        """Resolve a tool's handler, importing its module on first use."""
+        handler = self._handlers.get(name)
+        if handler is None:
+            handler = self._specs[name].handler
+            if isinstance(handler, str):
+                module_name, _, attribute = handler.partition(":")
+                handler = importlib.import_module(module_name)
+                for part in attribute.split("."):
+                    handler = getattr(handler, part)
+            self._handlers[name] = handler
+        return handler
+
+    # Schema and prompt generation
+
+    def tool_schemas(self) -> List[dict]:
+        """Tool definitions in the Anthropic Messages API format."""
+        schemas = []
+        for spec in self._specs.values():
+            schemas.append({
+                "name": spec.name,
+                "description": spec.description,
+                "input_schema": {
+                    "type": "object",
+                    "properties": {p.name: p.schema() for p in spec.parameters},
+                    "required": [p.name for p in spec.parameters if p.required],
+                },
+            })
+        return schemas
+
+    def openai_tools(self) -> List[dict]:
+        """Tool definitions in the OpenAI/Groq chat completions format."""
+        return [
+            {"type": "function", "function": {
+                "name": schema["name"], "description": schema["description"], "parameters": schema["input_schema"]
+            }}
+            for schema in self.tool_schemas()
+        ]
+
+    def prompt_section(self) -> str:
+        """One line per tool, for a system prompt that asks for JSON tool calls."""
+        lines = []
+        for spec in self._specs.values():
+            params = ", ".join(
+                f"{p.name} ({p.type or 'any'}{'' if p.required else ', optional'}"
+                f"{', one of ' + '/'.join(map(str, p.enum)) if p.enum else ''})"
+                for p in spec.parameters
+            )
+            line = f"- {spec.name}: {spec.description}"
+            if params:
+                line += f". Parameters: {params}"
+            if spec.usage:
+                line += f". {spec.usage}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    # Execution
+
+    def validate(self, name: str, arguments: dict) -> dict:
+        """Return the arguments the handler is called with, or raise ValueError."""
+        spec = self._specs[name]
+        missing = [p.name for p in spec.parameters if p.required and arguments.get(p.name) is None]
+        if missing:
+            raise ValueError(f"Missing required parameters for {name}. Need: {missing}")
+        clean = {}
+        for p in spec.parameters:
+            if arguments.get(p.name) is not None:
+                clean[p.name] = p.coerce(arguments[p.name])
+            elif not p.required and p.default is not None:
+                clean[p.name] = p.default
+        return clean
+
+    def _cache_key(self, name: str, arguments: dict) -> str:
+        return f"{name}:{json.dumps(arguments, sort_keys=True, default=str)}"
+
+    def _cached(self, key: str):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires, result = entry
+            if expires < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return result
+
+    def _store(self, key: str, ttl: float, result: dict):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + ttl, result)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    @staticmethod
+    def _timed_out(spec: ToolSpec) -> TimeoutError:
+        if spec.idempotent:
+            return TimeoutError(f"{spec.name} timed out after {spec.timeout}s")
+        return ToolOutcomeUnknown(
+            f"{spec.name} did not finish within {spec.timeout}s and may still complete; check before retrying"
+        )
+
+    @staticmethod
+    def _log_late_result(name: str, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"{name} failed after its timeout: {e}")
+            return
+        status = "succeeded" if isinstance(result, dict) and result.get("success") else "failed"
+        print(f"{name} {status} after its timeout: {result}")
+
+    def _call(self, spec: ToolSpec, handler: Callable, args: tuple, kwargs: dict, release: Callable[[], None]):
+        """Run a handler; release() is called once it has really stopped running."""
+        if spec.timeout and not inspect.iscoroutinefunction(handler):
+            return self._call_in_worker(spec, handler, args, kwargs, release)
+        try:
+            if not inspect.iscoroutinefunction(handler):
+                return handler(*args, **kwargs)
+            from utils.async_runtime import get_async_runtime
+            coro = handler(*args, **kwargs)
+            if spec.timeout:
+                coro = asyncio.wait_for(coro, spec.timeout)
+            try:
+                return get_async_runtime().run(coro)
+            except asyncio.TimeoutError:
+                # The coroutine was cancelled, but a request it had sent may still land
+                raise self._timed_out(spec)
+        finally:
+            release()
+
+    def _executor(self, spec: ToolSpec) -> ThreadPoolExecutor:
+        # One pool per tool, as large as its concurrency limit, so a call holding a slot never queues for a worker
+        with self._lock:
+            executor = self._executors.get(spec.name)
+            if executor is None:
+                executor = self._executors[spec.name] = ThreadPoolExecutor(
+                    max_workers=spec.max_concurrency or DEFAULT_TOOL_WORKERS, thread_name_prefix=f"tool-{spec.name}"
+                )
+            return executor
+
+    def _call_in_worker(self, spec: ToolSpec, handler: Callable, args: tuple, kwargs: dict,
+                        release: Callable[[], None]):
+        context = contextvars.copy_context()
+        started = threading.Event()
+
+        def run():
+            started.set()
+            return context.run(handler, *args, **kwargs)
+
+        try:
+            future = self._executor(spec).submit(run)
+        except BaseException:
+            release()
+            raise
+        # The worker cannot be interrupted, so it keeps the concurrency slot until it returns
+        future.add_done_callback(lambda _: release())
+        # Only running time counts against the timeout; a call still queued is withdrawn instead
+        if not started.wait(spec.timeout) and future.cancel():
+            raise ToolBusy(f"{spec.name} is busy: no worker was free within {spec.timeout}s, so it was not run")
+        try:
+            return future.result(timeout=spec.timeout)
+        except FutureTimeoutError:
+            future.add_done_callback(lambda done: self._log_late_result(spec.name, done))
+            raise self._timed_out(spec)
+
+    def _run(self, spec: ToolSpec, owner, kwargs: dict) -> dict:
+        semaphore = self._semaphores.get(spec.name)
+        started = time.perf_counter()
+        result = None
+        try:
+            handler = self.handler(spec.name)
+            args = (owner,) if spec.method else ()
+            if semaphore and not semaphore.acquire(timeout=spec.timeout):
+                raise ToolBusy(
+                    f"{spec.name} is busy: {spec.max_concurrency} call(s) still running after {spec.timeout}s, "
+                    "so it was not run; try again shortly"
+                )
+            result = self._call(spec, handler, args, kwargs, semaphore.release if semaphore else lambda: None)
+        except ToolOutcomeUnknown as e:
+            result = {"success": False, "outcome_unknown": True, "details": str(e)}
+        except ToolBusy as e:
+            result = {"success": False, "busy": True, "details": str(e)}
+        except Exception as e:
+            result = {"success": False, "details": f"Error running {spec.name}: {e}"}
+        finally:
+            success = isinstance(result, dict) and bool(result.get("success"))
+            self.metrics.histogram(spec.name).record(time.perf_counter() - started, error=not success)
+        return result
+
+    def execute(self, name: str, arguments: dict = None, owner=None) -> dict:
+        """Validate and run a tool, returning its {"success", "details", ...} result.
+
+        Args:
+            name (str): Tool name.
+            arguments (dict): Arguments from the model.
+            owner: Passed as the first argument to method handlers.
+
+        Returns:
+            dict: The tool's result, or {"success": False, "details": ...} if the
+                tool is unknown, the arguments are invalid, it timed out or raised.
+                A non-idempotent tool that timed out also has "outcome_unknown": True,
+                and a call that could not start in time has "busy": True.
+        """
+        spec = self._specs.get(name)
+        if spec is None:
+            return {"success": False, "details": f"Tool {name} not implemented yet"}
+        try:
+            kwargs = self.validate(name, arguments or {})
+        except ValueError as e:
+            return {"success": False, "details": str(e)}
+
+        key = self._cache_key(name, kwargs) if spec.cacheable else None
+        if key:
+            cached = self._cached(key)
+            if cached is not None:
+                return {**cached, "cached": True}
+
+        if spec.singleflight:
+            # Callers joining an identical in-flight call get its result
+            result = get_singleflight().do(make_key(f"tool:{name}", kwargs), lambda: self._run(spec, owner, kwargs))
+        else:
+            result = self._run(spec, owner, kwargs)
+
+        if key and result.get("success"):
+            self._store(key, spec.cache_ttl, result)
+        return result
@@ -1,31 +1,52 @@
-import requests
-import pandas as pd
 import json
 import os
 
 CAMPAIGN_AD_ACCOUNT_ID="312327524514512"
 ACCESS_TOKEN = "EAASO6K2Xl0MBO8ZBXxGF1Rq1ZCYwyiMQZBbwl7F5X6HvGZCq0H6cgvCOdF0QPbrD9fjlHR5TvH5cAAevfnXFzJ0BDhj2GIQEFOdyV6XFCZADz5zGFMGEyKH6EOZBa1Q3FmIrYsZCNEXQl87yYd6MjZBoDwAGLJJWwlMOSkac1X02hHmQq0znwhCcchR12N3nB02K"
 
-def get_campaign_insight() -> pd.DataFrame:
-    """Get campaign insight from Facebook API.
-    Args: start_date, end_date: formatted as "YYYY-MM-DD".
+# Insight fields in the Graph API format and in the sample export format
+METRIC_FIELDS = {
+    "impressions": ("impressions", "Impressions"),
+    "clicks": ("clicks", "Clicks (all)"),
+    "spend": ("spend", "Amount spent (GBP)"),
+    "results": ("results", "Results"),
+}
+
+def fetch_graph_insight(ad_account_id: str, access_token: str, start_date: str = None, end_date: str = None) -> list:
+    """Fetch weekly per-campaign insight rows from the Graph API, following every page.
+    Each row covers one campaign for one week, from its date_start to its date_stop.
+    """
+    from utils.http_client import get_http_client
+    params = {
+        "fields": "campaign_id,campaign_name,impressions,clicks,spend",
+        "level": "campaign",
+        "time_increment": 7,
+        "access_token": access_token
+    }
+    if start_date and end_date:
+        params["time_range"] = json.dumps({"since": start_date, "until": end_date})
+    else:
+        params["date_preset"] = "last_30d"
+    graph_api_base = os.getenv("GRAPH_API_BASE", "https://graph.facebook.com/v20.0")
+    url, rows = f"{graph_api_base}/act_{ad_account_id}/insights", []
+    while url:
+        res = get_http_client().get(url, params=params).json()
+        if "error" in res:
+            raise Exception(res["error"].get("message", res["error"]))
+        rows.extend(res.get("data", []))
+        # The next page's URL already carries the query
+        url, params = res.get("paging", {}).get("next"), None
+    return rows
+
+def get_campaign_insight(ad_account_id: str = None, access_token: str = None,
+                         start_date: str = None, end_date: str = None) -> list:
+    """Get campaign insight, from the sample weeks below unless LIVE_CAMPAIGN_INSIGHTS=1.
+    Args: ad_account_id, access_token: the Meta ad account and its token, used for the live Graph API.
+          start_date, end_date: formatted as "YYYY-MM-DD"; without them the last 30 days (every sample week).
     """
-    # time_range = json.dumps({
-    #     "since": start_date,
-    #     "until": end_date
-    # })
-    # params = {
-    #     "fields": "campaign_id,campaign_name,impressions,clicks,spend",
-    #     "level": "campaign",
-    #     "time_range": time_range,
-    #     "access_token": access_token
-    # }
-    # try:
-    #     url = f"https://graph.facebook.com/v19.0/act_{ad_account_id}/insights"
-    #     res = requests.get(url, params=params)
-    #     return res.json()
-    # except Exception as e:
-    #     print(f"Error: {e}")
+    if ad_account_id and access_token and os.getenv("LIVE_CAMPAIGN_INSIGHTS", "0") == "1":
+        return fetch_graph_insight(ad_account_id, access_token, start_date, end_date)
+
     json_data = '''[
         {"Week":"2025-02-20 - 2025-02-21","Reach":129351,"Impressions":212067,"Clicks (all)":1914,"Amount spent (GBP)":2214.25,"Result Type":"Website leads","Results":74,"Cost per result":29.9222973,"Video plays":59320,"Video plays at 25%":9825,"CTR (all)":0.90254495,"Reporting starts":"2025-02-20","Reporting ends":"2025-02-21"},
         {"Week":"2025-02-13 - 2025-02-19","Reach":146941,"Impressions":317377,"Clicks (all)":2768,"Amount spent (GBP)":3622.17,"Result Type":"Website leads","Results":177,"Cost per result":20.46423729,"Video plays":133882,"Video plays at 25%":22566,"CTR (all)":0.8721489,"Reporting starts":"2025-02-13","Reporting ends":"2025-02-19"},
@@ -34,12 +55,40 @@ def get_campaign_insight() -> pd.DataFrame:
         {"Week":"2025-01-23 - 2025-01-29","Reach":58819,"Impressions":97745,"Clicks (all)":874,"Amount spent (GBP)":948.77,"Result Type":"Website leads","Results":62,"Cost per result":15.30274194,"Video plays":38600,"Video plays at 25%":5772,"CTR (all)":0.89416338,"Reporting starts":"2025-01-23","Reporting ends":"2025-01-29"}
     ]'''
     data = json.loads(json_data)
+    # Keep the sample weeks that overlap the requested window, as the Graph API would
+    if start_date:
+        data = [row for row in data if row["Reporting ends"] >= start_date]
+    if end_date:
+        data = [row for row in data if row["Reporting starts"] <= end_date]
     return data
 
+def summarize_insight(rows: list) -> dict:
+    """Totals and derived rates (CTR, cost per click, cost per result) over insight rows."""
+    totals = {}
+    for metric, names in METRIC_FIELDS.items():
+        values = [float(row[name]) for row in rows for name in names if row.get(name) not in (None, "")]
+        if values:
+            totals[metric] = round(sum(values), 2)
+    if totals.get("impressions") and "clicks" in totals:
+        totals["ctr"] = round(totals["clicks"] / totals["impressions"] * 100, 4)
+    if totals.get("clicks") and "spend" in totals:
+        totals["cost_per_click"] = round(totals["spend"] / totals["clicks"], 4)
+    if totals.get("results") and "spend" in totals:
+        totals["cost_per_result"] = round(totals["spend"] / totals["results"], 4)
+    return totals
+
+def load_campaign_insight(ad_account_id: str, access_token: str, start_date: str = None, end_date: str = None) -> dict:
+    """Fetch insight rows for a window together with their summary metrics."""
+    insight_data = get_campaign_insight(ad_account_id, access_token, start_date, end_date)
+    rows = insight_data if isinstance(insight_data, list) else [insight_data]
+    return {"data": rows, "metrics": summarize_insight(rows)}
+
 def process_campaign_data_to_json(data):
     """Processes campaign data to calculate click thru rate and cost per click."""
     if not data:
         return "[]"
+    # pandas is only needed here; importing it at module level slows every agent start
+    import pandas as pd
     df = pd.DataFrame(data)
 
     # Ensure required columns exist to prevent KeyError
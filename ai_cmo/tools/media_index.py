@@ -0,0 +1,245 @@
+"""Media metadata index keyed by content hash.
+
+Each asset is run through ffprobe (streams, codecs, resolution, duration) and,
+when it has audio, one ffmpeg loudnorm analysis pass (integrated loudness,
+true peak, loudness range) exactly once per SHA-256. Results are kept in a
+small JSON index, so subtitle timing, script length targets and render
+decisions read them without probing or decoding the file again. Other
+processes' results are picked up from the index file on a miss.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Optional
+
+# Video codecs that can be stream-copied into an MP4 container
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'av1', 'mpeg4'}
+
+
+def _file_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+def _float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(value: str) -> Optional[float]:
+    numerator, _, denominator = (value or '').partition('/')
+    numerator, denominator = _float(numerator), _float(denominator or 1)
+    if not numerator or not denominator:
+        return None
+    return round(numerator / denominator, 3)
+
+
+def parse_ffprobe(data: dict) -> dict:
+    """Reduce `ffprobe -show_format -show_streams -of json` output to the fields we use.
+
+    Args:
+        data (dict): Parsed ffprobe JSON.
+
+    Returns:
+        dict: duration, size, format_name, bit_rate, the list of streams and
+            the first video and audio stream (None when absent).
+    """
+    streams = []
+    for stream in data.get('streams', []):
+        entry = {
+            'index': stream.get('index'),
+            'codec_type': stream.get('codec_type'),
+            'codec_name': stream.get('codec_name'),
+            'duration': _float(stream.get('duration')),
+        }
+        if entry['codec_type'] == 'video':
+            entry.update({
+                'width': stream.get('width'),
+                'height': stream.get('height'),
+                'pix_fmt': stream.get('pix_fmt'),
+                'fps': _frame_rate(stream.get('avg_frame_rate')) or _frame_rate(stream.get('r_frame_rate')),
+            })
+        elif entry['codec_type'] == 'audio':
+            entry.update({
+                'sample_rate': int(stream['sample_rate']) if stream.get('sample_rate') else None,
+                'channels': stream.get('channels'),
+            })
+        streams.append(entry)
+
+    format_info = data.get('format', {})
+    duration = _float(format_info.get('duration'))
+    if duration is None:
+        durations = [stream['duration'] for stream in streams if stream['duration']]
+        duration = max(durations) if durations else None
+
+    return {
+        'duration': duration,
+        'size': int(format_info['size']) if format_info.get('size') else None,
+        'format_name': format_info.get('format_name'),
+        'bit_rate': int(format_info['bit_rate']) if format_info.get('bit_rate') else None,
+        'streams': streams,
+        'video': next((stream for stream in streams if stream['codec_type'] == 'video'), None),
+        'audio': next((stream for stream in streams if stream['codec_type'] == 'audio'), None),
+    }
+
+
+def parse_loudnorm(stderr: str) -> Optional[dict]:
+    """Extract the measurement block printed by `-af loudnorm=print_format=json`."""
+    match = re.search(r'\{[^{}]*"input_i"[^{}]*\}', stderr)
+    if not match:
+        return None
+    measured = json.loads(match.group(0))
+    return {
+        'integrated_lufs': _float(measured.get('input_i')),
+        'true_peak_db': _float(measured.get('input_tp')),
+        'lra': _float(measured.get('input_lra')),
+        'threshold': _float(measured.get('input_thresh')),
+    }
+
+
+def can_stream_copy_video(metadata: Optional[dict]) -> bool:
+    """Whether the asset's video stream can be copied into an MP4 without re-encoding."""
+    video = (metadata or {}).get('video')
+    return bool(video) and video.get('codec_name') in MP4_VIDEO_CODECS
+
+
+class MediaIndex:
+    """Caches ffprobe metadata and loudness per content hash in a JSON file.
+
+    Args:
+        index_path (str): Where the index is persisted.
+        max_entries (int): Oldest entries beyond this are evicted.
+    """
+
+    def __init__(self, index_path: str, max_entries: int = 5000):
+        self.index_path = index_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._index_mtime = None
+        # path -> (size, mtime_ns, sha256), so unchanged files are not rehashed
+        self._path_hashes = {}
+        self._inflight = {}
+        self._reload()
+
+    @property
+    def available(self) -> bool:
+        return shutil.which('ffprobe') is not None
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+            if mtime == self._index_mtime:
+                return
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return
+        with self._lock:
+            self._entries.update(entries)
+            self._index_mtime = mtime
+
+    def _save(self):
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Merge what other workers wrote since we last read the file
+        self._reload()
+        with self._lock:
+            if len(self._entries) > self.max_entries:
+                ordered = sorted(self._entries.items(), key=lambda item: item[1].get('probed_at', 0))
+                for key, _ in ordered[:len(self._entries) - self.max_entries]:
+                    del self._entries[key]
+            snapshot = json.dumps(self._entries)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(snapshot)
+        os.replace(tmp_path, self.index_path)
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+
+    def lookup(self, sha256: str) -> Optional[dict]:
+        """Return cached metadata for a content hash without probing."""
+        with self._lock:
+            return self._entries.get(sha256)
+
+    async def _hash(self, path: str) -> str:
+        stat = await asyncio.to_thread(os.stat, path)
+        cached = self._path_hashes.get(path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        sha256 = await asyncio.to_thread(_file_sha256, path)
+        self._path_hashes[path] = (stat.st_size, stat.st_mtime_ns, sha256)
+        return sha256
+
+    async def _run(self, *cmd: str):
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+        return process.returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+
+    async def _probe(self, path: str, sha256: str) -> dict:
+        returncode, stdout, stderr = await self._run(
+            'ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', path
+        )
+        if returncode != 0:
+            raise ValueError(f"ffprobe could not read {os.path.basename(path)}: {stderr.strip()}")
+        metadata = parse_ffprobe(json.loads(stdout or '{}'))
+        metadata['loudness'] = None
+        if metadata['audio']:
+            # One decode of the audio track; later loudness normalisation reuses it
+            _, _, stderr = await self._run(
+                'ffmpeg', '-hide_banner', '-nostats', '-i', path, '-map', '0:a:0',
+                '-af', 'loudnorm=I=-14:TP=-1.5:LRA=11:print_format=json', '-f', 'null', '-'
+            )
+            metadata['loudness'] = parse_loudnorm(stderr)
+        metadata['sha256'] = sha256
+        metadata['probed_at'] = time.time()
+        return metadata
+
+    async def get(self, path: str, sha256: str = None) -> Optional[dict]:
+        """Return metadata for the file at path, probing it only on first sight.
+
+        Args:
+            path (str): Media file to describe.
+            sha256 (str): Its content hash, if already known (skips hashing).
+
+        Returns:
+            Optional[dict]: The metadata, or None when ffprobe is not installed.
+
+        Raises:
+            ValueError: If ffprobe cannot read the file.
+        """
+        sha256 = sha256 or await self._hash(path)
+        metadata = self.lookup(sha256)
+        if metadata is None:
+            # Another worker may have probed it; the stat and reread stay off the loop
+            await asyncio.to_thread(self._reload)
+            metadata = self.lookup(sha256)
+        if metadata is not None or not self.available:
+            return metadata
+
+        # Concurrent requests for the same asset share one probe
+        inflight = self._inflight.get(sha256)
+        if inflight is None:
+            inflight = asyncio.ensure_future(self._probe_and_store(path, sha256))
+            self._inflight[sha256] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(sha256, None))
+        # A cancelled caller must not cancel the probe the others are waiting on
+        return await asyncio.shield(inflight)
+
+    async def _probe_and_store(self, path: str, sha256: str) -> dict:
+        metadata = await self._probe(path, sha256)
+        with self._lock:
+            self._entries[sha256] = metadata
+        await asyncio.to_thread(self._save)
+        return metadata
@@ -1,9 +1,28 @@
-import logging
-from py.msg.telegram_message_sender import Update
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext
+"""Telegram bot as an inbound channel into SmallMind/BigMind.
+
+In production the bot runs in webhook mode: create_webhook_blueprint() returns
+a Quart blueprint that can be registered on any app served by Hypercorn.
+Updates are processed concurrently across chats but in order within a chat,
+SmallMind replies straight away and BigMind work is handed off to the job
+pool, with its result pushed back to the chat when it lands.
+"""
+import argparse
 import asyncio
-from dotenv import load_dotenv
+import hmac
+import logging
 import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from quart import Blueprint, Quart, abort, request
+from telegram import Update
+from telegram.ext import (
+    Application, BaseUpdateProcessor, CallbackContext, CommandHandler, MessageHandler, filters
+)
+
+from agents.job_pool import describe_result, get_job_pool
+from tools.telegram_dispatcher import get_telegram_dispatcher
 
 # Enable logging
 logging.basicConfig(
@@ -11,54 +30,167 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently across chats, sequentially within a chat."""
+
+    def __init__(self, max_concurrent_updates: int = 256):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks = {}
+
+    async def do_process_update(self, update, coroutine) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await coroutine
+            return
+
+        # [lock, number of updates holding or waiting on it]
+        entry = self._chat_locks.setdefault(chat.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[chat.id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def format_big_mind_result(result) -> str:
+    """Render a BigMind decision (or exception) as a chat message."""
+    if isinstance(result, Exception):
+        return f"Sorry, that task failed: {result}"
+    return describe_result(result)
+
+
 # Start the bot
 async def start(update: Update, context: CallbackContext) -> None:
     """Send a message when the command /start is issued."""
     user = update.effective_user
     logger.info(f"/start command received from {user.first_name} ({user.id})")
+    await update.effective_message.reply_text("Hi! I'm your AI CMO. Ask me about your campaigns, reports or ads.")
+
+
+async def handle_message(update: Update, context: CallbackContext) -> None:
+    """Route a chat message through SmallMind and hand BigMind work to the job pool."""
+    message = update.effective_message
+    text = message.text
+    chat_id = update.effective_chat.id
+    small_mind = context.bot_data["small_mind"]
+    # Each chat keeps its own conversation memory and result stream
+    session_id = f"telegram:{chat_id}"
+
+    small_mind_response = await asyncio.to_thread(small_mind.process_message, text, session_id=session_id)
+    await message.reply_text(small_mind_response["message_to_user"])
+
+    if small_mind_response.get("activate_big_mind"):
+        dispatcher = get_telegram_dispatcher(context.bot.token)
+
+        def deliver(action, result):
+            dispatcher.send(chat_id, format_big_mind_result(result))
+
+        get_job_pool().submit(small_mind_response.get("action"), text, on_done=deliver, session_id=session_id)
+
 
 # Error handler
-async def error_handler(update: Update, context: CallbackContext) -> None:
+async def error_handler(update: object, context: CallbackContext) -> None:
     """Log Errors caused by Updates."""
     logger.warning(f'Update "{update}" caused error "{context.error}"')
 
-async def log_update(update: Update, context: CallbackContext) -> None:
-    """Log all incoming updates."""
-    logger.info(f"Received update: {update}")
-
-async def trigger_function():
-    print("Triggered function executed!")
-    logger.info("trigger_function was invoked externally.")
-
-def console_listener(app: Application):
-    while True:
-        command = input("Enter command (type 'trigger' to run trigger_function): ").strip()
-        if command.lower() == "trigger":
-            # Schedule the coroutine in the bot's event loop
-            future = asyncio.run_coroutine_threadsafe(trigger_function(), app.loop)
-            try:
-                future.result(timeout=10)  # Wait for the result if needed
-            except Exception as e:
-                print("Error triggering function:", e)
+
+def build_application(token: str, webhook_mode: bool = True, small_mind=None) -> Application:
+    """Build the bot application with concurrent, per-chat ordered update handling."""
+    builder = Application.builder().token(token).concurrent_updates(PerChatUpdateProcessor())
+    if webhook_mode:
+        # Updates arrive through the webhook blueprint, not the polling updater
+        builder = builder.updater(None)
+    app = builder.build()
+
+    if small_mind is None:
+        from agents.runtime import get_small_mind
+        small_mind = get_small_mind()
+    app.bot_data["small_mind"] = small_mind
+
+    app.add_handler(CommandHandler("start", start))
+    # Edits to earlier messages are not new requests
+    app.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND, handle_message))
+    app.add_error_handler(error_handler)
+    return app
+
+
+def create_webhook_blueprint(application: Application, webhook_url: str = None,
+                             secret_token: str = None, path: str = "/telegram/webhook") -> Blueprint:
+    """Return a Quart blueprint that feeds webhook updates into the application.
+
+    The application is started when the host app starts serving and, if
+    webhook_url is given, registered with Telegram at that point. Without a
+    secret_token every request is rejected, since anyone who finds the URL
+    could otherwise post updates as any chat.
+    """
+    blueprint = Blueprint("telegram_webhook", __name__)
+    if not secret_token:
+        logger.warning("TELEGRAM_WEBHOOK_SECRET is not set; the Telegram webhook will reject every request")
+
+    @blueprint.before_app_serving
+    async def start_bot():
+        await application.initialize()
+        await application.start()
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+        logger.info("Telegram webhook handler started")
+
+    @blueprint.after_app_serving
+    async def stop_bot():
+        await application.stop()
+        await application.shutdown()
+
+    @blueprint.route(path, methods=["POST"])
+    async def telegram_webhook():
+        received = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secret_token or not hmac.compare_digest(received.encode(), secret_token.encode()):
+            abort(403)
+        data = await request.get_json(force=True)
+        # Enqueue and acknowledge immediately; the application processes it concurrently
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        return "", 200
+
+    return blueprint
+
 
 def main() -> None:
     """Start the bot."""
     load_dotenv()
 
-    token = os.getenv("BOT_TOKEN")
-    app = Application.builder().token(token).build()
+    parser = argparse.ArgumentParser(description="Run the AI CMO Telegram bot.")
+    parser.add_argument("--polling", action="store_true", help="Use long polling instead of a webhook (local development).")
+    parser.add_argument("--port", type=int, default=int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8443")))
+    args = parser.parse_args()
 
-    app.add_handler(CommandHandler("start", start))
-    
-    # Log all updates
-    app.add_handler(MessageHandler(filters.ALL, log_update))
+    token = os.getenv("BOT_TOKEN")
 
-    # Log errors
-    app.add_error_handler(error_handler)
+    if args.polling:
+        print("Bot is running (polling)...")
+        build_application(token, webhook_mode=False).run_polling(allowed_updates=Update.ALL_TYPES)
+        return
 
-    # Start the bot
-    print("Bot is running...")
-    app.run_polling()
+    app = Quart(__name__)
+    app.register_blueprint(create_webhook_blueprint(
+        build_application(token),
+        webhook_url=os.getenv("TELEGRAM_WEBHOOK_URL"),
+        secret_token=os.getenv("TELEGRAM_WEBHOOK_SECRET")
+    ))
+    print("Bot is running (webhook)...")
+    app.run(host="0.0.0.0", port=args.port)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
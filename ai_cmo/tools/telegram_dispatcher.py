@@ -0,0 +1,302 @@
+"""Asynchronous, rate-limited outbound Telegram delivery.
+
+Messages are queued per chat and delivered from the process's shared
+background event loop (utils.async_runtime) so callers never block on the
+Bot API. Bursts to the same chat are coalesced,
+long texts are split at paragraph boundaries, the Markdown the models write
+is converted to Telegram's HTML subset and very large reports are sent as
+documents instead.
+"""
+import asyncio
+import concurrent.futures
+import html
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+
+from utils.async_runtime import AsyncRuntime, get_async_runtime
+from utils.http_client import AsyncHttpClient
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+CODE_BLOCK = re.compile(r"```[^\n`]*\n?(.*?)```", re.DOTALL)
+# Inline code and links are matched first so markup inside them is left alone
+INLINE_TOKEN = re.compile(r"`([^`\n]+)`|\[([^\]\n]+)\]\((https?://[^)\s]+)\)")
+INLINE_MARKUP = [
+    (re.compile(r"^#{1,6}\s+(?:\*\*)?(.+?)(?:\*\*)?\s*#*\s*$", re.MULTILINE), r"<b>\1</b>"),
+    (re.compile(r"\*\*(?!\s)(.+?)(?<!\s)\*\*"), r"<b>\1</b>"),
+    (re.compile(r"(?<!\w)__(?!\s)(.+?)(?<!\s)__(?!\w)"), r"<b>\1</b>"),
+    (re.compile(r"(?<![\w*])\*(?![\s*])(.+?)(?<![\s*])\*(?![\w*])"), r"<i>\1</i>"),
+    (re.compile(r"(?<!\w)_(?![\s_])(.+?)(?<![\s_])_(?!\w)"), r"<i>\1</i>"),
+    (re.compile(r"~~(?!\s)(.+?)(?<!\s)~~"), r"<s>\1</s>"),
+]
+HTML_TAG = re.compile(r"<(/?)(\w+)[^>]*>")
+# Units chunk_html never splits: paragraph and line breaks, tags, entities and single characters
+HTML_ATOM = re.compile(r"\n\n|\n|<[^>]*>|&#?\w+;|.")
+
+
+def _format_text(text: str) -> str:
+    text = html.escape(text, quote=False)
+    for pattern, replacement in INLINE_MARKUP:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _inline_to_html(text: str) -> str:
+    pieces, position = [], 0
+    for match in INLINE_TOKEN.finditer(text):
+        pieces.append(_format_text(text[position:match.start()]))
+        code, label, url = match.groups()
+        if code is not None:
+            pieces.append(f"<code>{html.escape(code, quote=False)}</code>")
+        else:
+            pieces.append(f'<a href="{html.escape(url)}">{_format_text(label)}</a>')
+        position = match.end()
+    pieces.append(_format_text(text[position:]))
+    return "".join(pieces)
+
+
+def markdown_to_html(text: str) -> str:
+    """Convert Markdown as the models write it into Telegram's HTML subset.
+
+    Headings, bold, italics, strikethrough, links and code become tags;
+    everything else (including characters like "." or "(") is sent as
+    escaped text, so Telegram shows it exactly as written.
+    """
+    pieces = CODE_BLOCK.split(text)
+    for i, piece in enumerate(pieces):
+        pieces[i] = f"<pre>{html.escape(piece, quote=False)}</pre>" if i % 2 else _inline_to_html(piece)
+    return "".join(pieces)
+
+
+def _closing_tags(stack: list) -> str:
+    return "".join(f"</{HTML_TAG.match(tag).group(2)}>" for tag in reversed(stack))
+
+
+def chunk_html(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> list:
+    """Split Telegram HTML into chunks of at most limit characters.
+
+    Splits at paragraph boundaries first, then at line breaks, and only cuts
+    inside a line when a single line is itself too long. Tags and entities are
+    never cut; tags still open at a split are closed at the end of the chunk
+    and reopened at the start of the next, so every chunk is balanced HTML.
+    """
+    if len(text) <= limit:
+        return [text]
+    atoms = HTML_ATOM.findall(text)
+    chunks, reopened, i = [], [], 0
+    while i < len(atoms):
+        body, stack = "".join(reopened), list(reopened)
+        start, breaks = i, {}
+        while i < len(atoms):
+            atom = atoms[i]
+            tag = HTML_TAG.fullmatch(atom)
+            after = (stack[:-1] if tag.group(1) else stack + [atom]) if tag else stack
+            if i > start and len(body) + len(atom) + len(_closing_tags(after)) > limit:
+                break
+            if atom in ("\n\n", "\n"):
+                # Split here by ending the chunk before the separator and dropping it
+                breaks[atom] = (len(body), stack, i + 1)
+            body, stack, i = body + atom, after, i + 1
+        else:
+            chunks.append(body + _closing_tags(stack))
+            break
+        cut = breaks.get("\n\n") or breaks.get("\n")
+        if cut is None or cut[0] <= len("".join(reopened)):
+            cut = (len(body), stack, i)
+        length, reopened, i = cut
+        chunks.append(body[:length] + _closing_tags(reopened))
+    return chunks
+
+
+def html_to_text(text: str) -> str:
+    """The plain text of Telegram HTML, for resending a chunk Telegram could not parse."""
+    return html.unescape(HTML_TAG.sub("", text))
+
+
+class TokenBucket:
+    """Async token bucket: rate tokens per second, bursting up to capacity."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it."""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class _Outgoing:
+    text: str
+    as_document: bool
+    future: concurrent.futures.Future = field(default_factory=concurrent.futures.Future)
+
+
+class TelegramDispatcher:
+    """Queues and delivers Telegram messages from a background event loop.
+
+    Args:
+        bot_token (str): Telegram bot token.
+        global_rate (float): Messages per second across all chats (Telegram allows ~30).
+        per_chat_rate (float): Messages per second to a single chat.
+        coalesce_window (float): Seconds to wait for more messages to the same chat
+            before sending them together.
+        document_threshold (int): Texts longer than this are sent as a document.
+        runtime (AsyncRuntime): Loop to deliver from. Defaults to the process-wide runtime.
+    """
+
+    def __init__(self, bot_token: str, global_rate: float = 30.0, per_chat_rate: float = 1.0,
+                 coalesce_window: float = 0.5, document_threshold: int = 3 * TELEGRAM_MESSAGE_LIMIT,
+                 api_base: str = None, runtime: AsyncRuntime = None):
+        self.bot_token = bot_token
+        self.global_rate = global_rate
+        self.per_chat_rate = per_chat_rate
+        self.coalesce_window = coalesce_window
+        self.document_threshold = document_threshold
+        self.api_base = api_base or os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+
+        self.runtime = runtime
+
+        self._loop = None
+        self._start_lock = threading.Lock()
+        self._queues = {}
+        self._workers = {}
+        self._global_bucket = None
+        self._chat_buckets = {}
+        self._http = None
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = (self.runtime or get_async_runtime()).loop
+
+    def send(self, chat_id, text: str, as_document: bool = False) -> concurrent.futures.Future:
+        """Queue a message without blocking; the future resolves with the delivery result."""
+        self._ensure_started()
+        item = _Outgoing(text=text, as_document=as_document)
+        self._loop.call_soon_threadsafe(self._enqueue, str(chat_id), item)
+        return item.future
+
+    def close(self, timeout: float = 5.0):
+        """Stop the chat workers, abandoning anything still queued.
+
+        The shared loop itself keeps running for its other users.
+        """
+        with self._start_lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+
+        async def shutdown():
+            for worker in self._workers.values():
+                worker.cancel()
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
+            if self._http is not None:
+                await self._http.aclose()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout)
+        self._queues, self._workers, self._chat_buckets, self._http = {}, {}, {}, None
+
+    def _enqueue(self, chat_id: str, item: _Outgoing):
+        if self._http is None:
+            self._http = AsyncHttpClient()
+            self._global_bucket = TokenBucket(self.global_rate)
+        if chat_id not in self._queues:
+            self._queues[chat_id] = asyncio.Queue()
+            self._chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=3)
+            self._workers[chat_id] = self._loop.create_task(self._chat_worker(chat_id))
+        self._queues[chat_id].put_nowait(item)
+
+    async def _chat_worker(self, chat_id: str):
+        queue = self._queues[chat_id]
+        held = None
+        while True:
+            batch = [held or await queue.get()]
+            held = None
+            if not batch[0].as_document and self.coalesce_window > 0:
+                await asyncio.sleep(self.coalesce_window)
+                while not queue.empty():
+                    item = queue.get_nowait()
+                    if item.as_document:
+                        held = item
+                        break
+                    batch.append(item)
+
+            text = "\n\n".join(item.text for item in batch)
+            try:
+                result = await self._deliver(chat_id, text, batch[0].as_document)
+            except Exception as e:
+                result = {"success": False, "details": str(e)}
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_result(result)
+
+    async def _deliver(self, chat_id: str, text: str, as_document: bool) -> dict:
+        if as_document or len(text) > self.document_threshold:
+            return await self._send_document(chat_id, text)
+
+        results = []
+        for chunk in chunk_html(markdown_to_html(text)):
+            results.append(await self._send_text(chat_id, chunk))
+            if not results[-1].get("ok"):
+                break
+        return {
+            "success": all(result.get("ok") for result in results),
+            "details": results
+        }
+
+    async def _call(self, chat_id: str, method: str, **kwargs) -> dict:
+        await self._global_bucket.acquire()
+        await self._chat_buckets[chat_id].acquire()
+        response = await self._http.post(f"{self.api_base}/bot{self.bot_token}/{method}", **kwargs)
+        return response.json()
+
+    async def _send_text(self, chat_id: str, text: str) -> dict:
+        result = await self._call(chat_id, "sendMessage", json={
+            "chat_id": chat_id,
+            "text": text,
+            "parse_mode": "HTML"
+        })
+        if not result.get("ok") and "parse" in str(result.get("description", "")).lower():
+            # Fall back to plain text rather than dropping the message
+            result = await self._call(chat_id, "sendMessage", json={"chat_id": chat_id, "text": html_to_text(text)})
+        return result
+
+    async def _send_document(self, chat_id: str, text: str) -> dict:
+        caption = text.strip().splitlines()[0][:200] if text.strip() else "Report"
+        result = await self._call(
+            chat_id,
+            "sendDocument",
+            data={"chat_id": chat_id, "caption": caption},
+            files={"document": ("report.md", text.encode("utf-8"), "text/markdown")}
+        )
+        return {"success": result.get("ok", False), "details": result}
+
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_telegram_dispatcher(bot_token: str) -> TelegramDispatcher:
+    """Return the process-wide dispatcher for a bot token."""
+    with _dispatchers_lock:
+        if bot_token not in _dispatchers:
+            _dispatchers[bot_token] = TelegramDispatcher(bot_token)
+        return _dispatchers[bot_token]
@@ -1,15 +1,19 @@
 import argparse
-import requests
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.http_client import get_http_client
 
 def send_message(bot_token, chat_id, message):
     """Sends a message to a Telegram user via the bot."""
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+    api_base = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+    url = f"{api_base}/bot{bot_token}/sendMessage"
     payload = {
         "chat_id": chat_id,
         "text": message,
         "parse_mode": "Markdown"
     }
-    response = requests.post(url, json=payload)
+    response = get_http_client().post(url, json=payload)
     return response.json()
 
 def main():
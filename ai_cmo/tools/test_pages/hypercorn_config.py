@@ -0,0 +1,38 @@
+"""Production Hypercorn profile for the voiceover server.
+
+    cd ai_cmo/tools/test_pages
+    hypercorn --config file:hypercorn_config.py voiceover_test:app
+
+Every setting can be overridden through the environment. The app is I/O bound
+on the providers, but each /api/combine spawns a CPU-heavy ffmpeg encode, so
+the default worker count leaves half the cores to ffmpeg. Use
+python -m benchmarks.load_test to find the sustainable concurrency for a box
+before changing these numbers.
+"""
+import importlib.util
+import os
+
+bind = [os.getenv("HYPERCORN_BIND", "0.0.0.0:5001")]
+
+workers = int(os.getenv("HYPERCORN_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+worker_class = os.getenv(
+    "HYPERCORN_WORKER_CLASS",
+    "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+)
+
+# Sits behind a load balancer with a 60s idle timeout; stay above it so the
+# balancer, not us, closes idle connections
+keep_alive_timeout = float(os.getenv("HYPERCORN_KEEP_ALIVE", "75"))
+backlog = int(os.getenv("HYPERCORN_BACKLOG", "2048"))
+# Long enough for in-flight combines to finish on restart
+graceful_timeout = float(os.getenv("HYPERCORN_GRACEFUL_TIMEOUT", "60"))
+# Uploads are up to 100MB (MAX_CONTENT_LENGTH), reads must not time out mid-body
+read_timeout = int(os.getenv("HYPERCORN_READ_TIMEOUT", "120"))
+
+accesslog = os.getenv("HYPERCORN_ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("HYPERCORN_LOG_LEVEL", "WARNING")
+
+# The dev defaults log every request body at DEBUG to stdout and a file
+os.environ.setdefault("VOICEOVER_LOG_LEVEL", "WARNING")
+os.environ.setdefault("VOICEOVER_LOG_FILE", "")
@@ -1,4 +1,5 @@
-from quart import Quart, request, send_file, jsonify
+from quart import Quart, Response, request, send_file, jsonify
+from quart.wrappers.response import FileBody
 from elevenlabs.client import ElevenLabs
 from elevenlabs import play
 import os
@@ -7,21 +8,41 @@ from io import BytesIO
 import traceback
 from openai import OpenAI
 import json
+import base64
+import binascii
+import hashlib
+import re
+import uuid
 import logging
+import logging.handlers
+import queue
+import atexit
 import sys
 import asyncio
+import contextvars
+import functools
+import gc
+from concurrent.futures import ThreadPoolExecutor
+import aiofiles
+import aiofiles.os
 from quart.templating import render_template_string
 import subprocess
-from werkzeug.utils import secure_filename
 
-# Configure logging
+# Configure logging (DEBUG to stdout and a file by default; the Hypercorn
+# profile in hypercorn_config.py turns this down for production and load tests).
+# Handlers run on a QueueListener thread so log writes never block the event loop.
+log_handlers = [logging.StreamHandler(sys.stdout)]
+log_file = os.getenv("VOICEOVER_LOG_FILE", "voiceover_test.log")
+if log_file:
+    log_handlers.append(logging.FileHandler(log_file))
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.getenv("VOICEOVER_LOG_LEVEL", "DEBUG").upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('voiceover_test.log')
-    ]
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
@@ -30,16 +51,65 @@ env_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__
 logger.info(f"Looking for .env file at: {env_path}")
 load_dotenv(dotenv_path=env_path)
 
+class MediaFileBody(FileBody):
+    """File body that reads in large chunks and tracks its own offset.
+
+    Quart's FileBody reads 8KB at a time and awaits tell() before each read,
+    i.e. two aiofiles thread hops per 8KB; a 100MB video took ~25k of them.
+    """
+
+    buffer_size = 256 * 1024
+
+    async def __aenter__(self):
+        await super().__aenter__()
+        self.position = self.begin
+        return self
+
+    async def __anext__(self) -> bytes:
+        if self.position >= self.end:
+            raise StopAsyncIteration()
+        chunk = await self.file.read(min(self.buffer_size, self.end - self.position))
+        if not chunk:
+            raise StopAsyncIteration()
+        self.position += len(chunk)
+        return chunk
+
+
+class MediaResponse(Response):
+    file_body_class = MediaFileBody
+
+
 app = Quart(__name__)
+app.response_class = MediaResponse
+# Per request: single-shot uploads, and each chunk of a resumable upload
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB limit
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from tools.audio_mix import MixConfig, build_filter_graph
+from tools.media_index import MediaIndex, can_stream_copy_video
+from tools.tts_engine import TTSEngine
+from tools.upload_store import UploadError, UploadStore
+from tools.voice_catalog import VoiceCatalog
+
+# Optionally mount the Telegram bot webhook on this server
+if os.getenv("TELEGRAM_WEBHOOK_URL"):
+    from tools.telegram_bot_setup import build_application, create_webhook_blueprint
+    app.register_blueprint(create_webhook_blueprint(
+        build_application(os.getenv("BOT_TOKEN")),
+        webhook_url=os.getenv("TELEGRAM_WEBHOOK_URL"),
+        secret_token=os.getenv("TELEGRAM_WEBHOOK_SECRET")
+    ))
+    logger.info("Telegram webhook mounted at /telegram/webhook")
+
 # Initialize ElevenLabs client
 elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
 if not elevenlabs_api_key:
     logger.error("ELEVENLABS_API_KEY not found in .env file")
     raise ValueError("ELEVENLABS_API_KEY not found in .env file")
 logger.info("ElevenLabs API key found")
-client = ElevenLabs(api_key=elevenlabs_api_key)
+client = ElevenLabs(api_key=elevenlabs_api_key, base_url=os.getenv("ELEVENLABS_BASE_URL"))
+# Scripts are synthesized sentence by sentence in parallel (TTS_CONCURRENCY in flight)
+tts_engine = TTSEngine(client)
 
 # Initialize OpenAI client
 openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -48,14 +118,105 @@ if not openai_api_key:
     raise ValueError("OPENAI_API_KEY not found in .env file")
 logger.info("OpenAI API key found")
 openai_client = OpenAI(api_key=openai_api_key)
+# The SDK imports its resource modules on first attribute access; do that here
+# rather than inside the first request on the event loop
+openai_client.chat.completions
 
 # Create temp directory for uploads
 TEMP_DIR = os.path.join(os.path.dirname(__file__), 'temp')
 os.makedirs(TEMP_DIR, exist_ok=True)
 ALLOWED_EXTENSIONS = {'mp4', 'mov', 'avi', 'mkv', 'webm'}
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Blocking SDK calls (OpenAI) and file hashing run on this pool so they never
+# stall the event loop; it is bounded so bursts queue here instead of piling up
+# threads. ElevenLabs calls go through tts_engine's own pool.
+BLOCKING_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("VOICEOVER_BLOCKING_WORKERS", "16")),
+    thread_name_prefix="voiceover-blocking"
+)
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a blocking callable on BLOCKING_EXECUTOR and await its result."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(BLOCKING_EXECUTOR, functools.partial(context.run, func, *args, **kwargs))
+
+def file_sha256(path: str) -> str:
+    """Hex SHA-256 of a file's contents (blocking; use run_blocking)."""
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+# Uploads, generated audio and final renders are named by content hash, so a
+# given URL never changes and browsers may cache it forever; other files (voice
+# samples, anything not named that way) are revalidated against their ETag on
+# every use
+CONTENT_ADDRESSED_NAME = re.compile(r'^(voiceover|final|upload)_[0-9a-f]{32,64}\.(mp3|wav|json|mp4|mov|avi|mkv|webm)$')
+AUDIO_MIMETYPES = {'.mp3': 'audio/mpeg', '.wav': 'audio/wav'}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+async def send_media(filepath: str, mimetype: str) -> Response:
+    """Send a media file with byte-range (206), ETag/Last-Modified (304) and Cache-Control handling."""
+    immutable = bool(CONTENT_ADDRESSED_NAME.match(os.path.basename(filepath)))
+    response = await send_file(
+        filepath,
+        mimetype=mimetype,
+        conditional=True,
+        cache_timeout=IMMUTABLE_MAX_AGE if immutable else 0
+    )
+    # Advertised on full responses too, so players know they can seek with ranges
+    response.headers['Accept-Ranges'] = 'bytes'
+    if immutable:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+# Uploads are streamed to TEMP_DIR as upload_<sha256>.<ext>; resumable uploads
+# allow source footage beyond MAX_CONTENT_LENGTH, up to UPLOAD_MAX_BYTES
+# ffprobe metadata (duration, streams, loudness) per content hash; uploads are
+# probed while being stored, generated audio and renders right after writing
+media_index = MediaIndex(os.getenv("MEDIA_INDEX_PATH", os.path.join(TEMP_DIR, 'media_index.json')))
+upload_store = UploadStore(
+    TEMP_DIR,
+    ALLOWED_EXTENSIONS,
+    max_bytes=int(os.getenv("UPLOAD_MAX_BYTES", str(10 * 1024 ** 3))),
+    probe=media_index.get
+)
+TUS_HEADERS = {'Tus-Resumable': '1.0.0'}
+
+async def synthesize_sample(text: str, voice_id: str) -> bytes:
+    return (await tts_engine.synthesize(text, voice_id)).audio
+
+# Voice list cached for VOICE_CATALOG_TTL and revalidated by ETag; one sample
+# clip per voice is cached so auditions in the picker are instant
+voice_catalog = VoiceCatalog(
+    os.getenv("VOICE_CACHE_DIR", os.path.join(TEMP_DIR, 'voices')),
+    api_key=elevenlabs_api_key,
+    base_url=os.getenv("ELEVENLABS_BASE_URL"),
+    synthesize=synthesize_sample
+)
+
+_background_tasks = set()
+
+def index_in_background(path: str, sha256: str = None):
+    """Probe a freshly written asset without delaying the response."""
+    async def probe():
+        try:
+            await media_index.get(path, sha256)
+        except Exception as e:
+            logger.warning(f"Could not index {path}: {e}")
+    task = asyncio.create_task(probe())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+def resolve_temp_path(path: str):
+    """Return path if it points at an existing file inside TEMP_DIR, else None."""
+    if not path:
+        return None
+    resolved = os.path.realpath(path)
+    if os.path.dirname(resolved) != os.path.realpath(TEMP_DIR) or not os.path.isfile(resolved):
+        return None
+    return resolved
 
 # HTML template
 HTML_TEMPLATE = """
@@ -236,6 +397,8 @@ HTML_TEMPLATE = """
                     <option value="EXAVITQu4vr4xnSDxMaL">Bella</option>
                     <option value="ErXwobaYiN019PkySvjV">Antoni</option>
                 </select>
+                <button id="playSample" type="button">Play sample</button>
+                <audio id="voiceSample" preload="none"></audio>
             </div>
             <button id="generateVoiceover">Preview Voiceover</button>
             <div id="voiceoverLoading" class="loading">Generating voiceover...</div>
@@ -389,7 +552,8 @@ HTML_TEMPLATE = """
                     },
                     body: JSON.stringify({
                         prompt: prompt.value,
-                        duration: duration.value
+                        duration: duration.value,
+                        video_path: savedVideoPath
                     }),
                 });
 
@@ -450,6 +614,37 @@ HTML_TEMPLATE = """
         const combinationError = document.getElementById('combinationError');
         const finalVideoContainer = document.getElementById('finalVideoContainer');
 
+        // Replace the built-in voices with the cached ElevenLabs catalog
+        const playSampleBtn = document.getElementById('playSample');
+        const voiceSample = document.getElementById('voiceSample');
+        const voiceSamples = {};
+
+        (async () => {
+            try {
+                const response = await fetch('/api/voices');
+                if (!response.ok) return;
+                const data = await response.json();
+                if (!data.voices.length) return;
+                const selected = voice.value;
+                voice.innerHTML = '';
+                for (const v of data.voices) {
+                    const option = document.createElement('option');
+                    option.value = v.voice_id;
+                    option.textContent = v.category ? `${v.name} (${v.category})` : v.name;
+                    voice.appendChild(option);
+                    voiceSamples[v.voice_id] = v.sample_url;
+                }
+                if (data.voices.some(v => v.voice_id === selected)) voice.value = selected;
+            } catch (error) {
+                console.log('Voice catalog unavailable, keeping built-in voices:', error);
+            }
+        })();
+
+        playSampleBtn.onclick = () => {
+            voiceSample.src = voiceSamples[voice.value] || `/api/voices/${voice.value}/sample`;
+            voiceSample.play();
+        };
+
         generateVoiceoverBtn.onclick = async () => {
             if (!scriptTextarea.value.trim()) {
                 voiceoverError.textContent = 'Please enter text or select a script';
@@ -485,7 +680,7 @@ HTML_TEMPLATE = """
                 currentVoiceoverAudioUrl = data.audio_url;
                 audioContainer.innerHTML = `
                     <audio controls autoplay>
-                        <source src="${data.audio_url}" type="audio/mpeg">
+                        <source src="${data.audio_url}">
                         Your browser does not support the audio element.
                     </audio>
                 `;
@@ -581,10 +776,16 @@ HTML_TEMPLATE = """
 </html>
 """
 
+_index_html = None
+
 @app.route('/')
 async def index():
+    global _index_html
     logger.info("Serving index page")
-    return await render_template_string(HTML_TEMPLATE)
+    # The template is static, so compile and render it once
+    if _index_html is None:
+        _index_html = await render_template_string(HTML_TEMPLATE)
+    return _index_html
 
 @app.route('/api/generate-scripts', methods=['POST'])
 async def generate_scripts_endpoint():
@@ -604,6 +805,13 @@ async def generate_scripts_endpoint():
             logger.warning("No prompt provided")
             return jsonify({'error': 'No prompt provided'}), 400
 
+        # Target the uploaded video's real length when we know it
+        video_path = await asyncio.to_thread(resolve_temp_path, data.get('video_path'))
+        if video_path:
+            metadata = await media_index.get(video_path)
+            if metadata and metadata.get('duration'):
+                duration = str(max(1, round(metadata['duration'])))
+
         logger.info(f"Generating scripts for duration: {duration}s")
         scripts = await generate_scripts(prompt, duration)
         
@@ -644,19 +852,8 @@ async def generate():
 
         # Generate audio
         logger.debug("Calling ElevenLabs API")
-        audio = client.text_to_speech.convert(
-            text=text,
-            voice_id=voice_id,
-            model_id="eleven_multilingual_v2",
-            output_format="mp3_44100_128",
-        )
-
-        # Convert generator to bytes
-        logger.debug("Converting audio generator to bytes")
-        audio_data = b''
-        for chunk in audio:
-            if chunk:
-                audio_data += chunk
+        voiceover = await tts_engine.synthesize(text, voice_id)
+        audio_data = voiceover.audio
 
         if not audio_data:
             logger.error("No audio data generated")
@@ -666,19 +863,27 @@ async def generate():
 
         # Save audio to temporary file
         temp_path = os.path.join(app.root_path, 'temp')
-        os.makedirs(temp_path, exist_ok=True)
+        await aiofiles.os.makedirs(temp_path, exist_ok=True)
         
-        audio_filename = f"voiceover_{abs(hash(text + voice_id))}.mp3"
+        audio_sha256 = hashlib.sha256(audio_data).hexdigest()
+        audio_filename = f"voiceover_{audio_sha256[:32]}.{voiceover.format}"
         audio_filepath = os.path.join(temp_path, audio_filename)
         
         logger.debug(f"Saving audio to {audio_filepath}")
-        with open(audio_filepath, 'wb') as f:
-            f.write(audio_data)
+        async with aiofiles.open(audio_filepath, 'wb') as f:
+            await f.write(audio_data)
+        # Sentence offsets travel with the audio so /api/combine can time subtitles exactly
+        if voiceover.segments:
+            async with aiofiles.open(segments_path(audio_filepath), 'w', encoding='utf-8') as f:
+                await f.write(json.dumps(voiceover.segments_as_dicts()))
+        index_in_background(audio_filepath, audio_sha256)
 
         logger.info("Voiceover generated successfully")
         return jsonify({
             'message': 'Voiceover generated successfully',
-            'audio_url': f'/api/audio/{audio_filename}'
+            'audio_url': f'/api/audio/{audio_filename}',
+            'duration': voiceover.duration,
+            'segments': voiceover.segments_as_dicts()
         })
 
     except Exception as e:
@@ -692,19 +897,48 @@ async def serve_audio(filename):
         logger.info(f"Serving audio file: {filename}")
         filepath = os.path.join(app.root_path, 'temp', filename)
         
-        if not os.path.exists(filepath):
+        if not await aiofiles.os.path.exists(filepath):
             logger.warning(f"Audio file not found: {filepath}")
             return jsonify({'error': 'Audio file not found'}), 404
             
-        return await send_file(
-            filepath,
-            mimetype='audio/mpeg'
-        )
+        return await send_media(filepath, AUDIO_MIMETYPES.get(os.path.splitext(filename)[1], 'audio/mpeg'))
     except Exception as e:
         logger.error(f"Error serving audio file {filename}:")
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 404
 
+@app.route('/api/voices')
+async def list_voices():
+    """List the cached ElevenLabs voices with a sample URL for each."""
+    try:
+        catalog = await voice_catalog.catalog()
+    except RuntimeError as e:
+        logger.error(str(e))
+        return jsonify({'error': str(e)}), 502
+
+    response = jsonify({
+        'voices': [
+            {**voice, 'sample_url': f"/api/voices/{voice['voice_id']}/sample"}
+            for voice in catalog['voices']
+        ],
+        'stale': catalog['stale']
+    })
+    response.set_etag(catalog['version'])
+    response.headers['Cache-Control'] = 'no-cache'
+    return await response.make_conditional(request)
+
+@app.route('/api/voices/<voice_id>/sample')
+async def voice_sample(voice_id):
+    """Serve a voice's cached sample clip, fetching it on first request."""
+    try:
+        path = await voice_catalog.sample(voice_id)
+    except KeyError:
+        return jsonify({'error': 'Unknown voice'}), 404
+    except RuntimeError as e:
+        logger.error(f"Sample for voice {voice_id} unavailable: {e}")
+        return jsonify({'error': str(e)}), 502
+    return await send_media(path, AUDIO_MIMETYPES.get(os.path.splitext(path)[1], 'audio/mpeg'))
+
 @app.route('/api/video/<filename>')
 async def serve_video(filename):
     """Serve a generated video file.
@@ -719,102 +953,136 @@ async def serve_video(filename):
         logger.info(f"Serving video file: {filename}")
         filepath = os.path.join(TEMP_DIR, filename)
         
-        if not os.path.exists(filepath):
+        if not await aiofiles.os.path.exists(filepath):
             logger.warning(f"Video file not found: {filepath}")
             return jsonify({'error': 'Video file not found'}), 404
             
-        return await send_file(
-            filepath,
-            mimetype='video/mp4'
-        )
+        return await send_media(filepath, 'video/mp4')
     except Exception as e:
         logger.error(f"Error serving video file {filename}:")
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 404
 
-async def extract_audio_ffmpeg(video_path: str, audio_path: str) -> bool:
-    """Extract audio from video using FFmpeg.
-    
-    Args:
-        video_path (str): Path to the input video file
-        audio_path (str): Path where the audio should be saved
-        
-    Returns:
-        bool: True if extraction was successful, False otherwise
-    """
-    try:
-        logger.info(f"Extracting audio from {video_path} to {audio_path}")
-        # Use FFmpeg to extract audio, converting to mp3 format
-        cmd = [
-            'ffmpeg',
-            '-i', video_path,           # Input file
-            '-vn',                      # Disable video
-            '-acodec', 'libmp3lame',    # Use MP3 codec
-            '-q:a', '2',                # High quality (0-9, lower is better)
-            '-y',                       # Overwrite output file
-            audio_path
-        ]
-        
-        # Run FFmpeg command
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
-        
-        if process.returncode != 0:
-            logger.error(f"FFmpeg error: {stderr.decode()}")
-            return False
-            
-        logger.info("Audio extraction completed successfully")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error during audio extraction: {str(e)}")
-        logger.error(traceback.format_exc())
-        return False
-
 @app.route('/api/upload-video', methods=['POST'])
 async def upload_video():
+    """Stream a multipart video upload to disk, deduplicated by content hash."""
     try:
         logger.info("Received video upload request")
-        
-        if 'video' not in (await request.files):
-            logger.warning("No video file in request")
+
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
+            logger.warning("Upload is not multipart/form-data")
             return jsonify({'error': 'No video file uploaded'}), 400
-            
-        video_file = (await request.files)['video']
-        
-        if not video_file or not allowed_file(video_file.filename):
-            logger.warning("Invalid file type")
-            return jsonify({'error': 'Invalid file type'}), 400
-            
-        # Secure the filename and save the video in temp directory
-        filename = secure_filename(video_file.filename)
-        video_path = os.path.join(TEMP_DIR, filename)
-        await video_file.save(video_path)
-        logger.info(f"Video saved to {video_path}")
-        
+
+        stored = await upload_store.save_multipart(request.body, boundary.encode(), 'video')
+        logger.info(f"Video saved to {stored['path']} (deduplicated: {stored['deduplicated']})")
+        metadata = media_index.lookup(stored['sha256']) or {}
+
         # Return both the URL for preview and the file path for processing
         return jsonify({
             'message': 'Video uploaded successfully',
-            'video_url': f'/api/video/{filename}',
-            'video_path': video_path
+            'video_url': f"/api/video/{stored['filename']}",
+            'video_path': stored['path'],
+            'sha256': stored['sha256'],
+            'deduplicated': stored['deduplicated'],
+            'duration': metadata.get('duration')
         })
-        
+
+    except UploadError as e:
+        logger.warning(f"Upload rejected: {e}")
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         logger.error("Error processing video upload:")
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/uploads', methods=['OPTIONS'])
+async def resumable_upload_options():
+    """Advertise the tus protocol subset supported by the resumable upload API."""
+    return '', 204, {
+        **TUS_HEADERS,
+        'Tus-Version': '1.0.0',
+        'Tus-Extension': 'creation',
+        'Tus-Max-Size': str(upload_store.max_bytes)
+    }
+
+@app.route('/api/uploads', methods=['POST'])
+async def create_resumable_upload():
+    """Create a resumable upload (tus creation): Upload-Length and an optional
+    Upload-Metadata "filename <base64>" header."""
+    try:
+        length = int(request.headers.get('Upload-Length', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Length header required'}), 400, TUS_HEADERS
+
+    metadata = {}
+    for item in request.headers.get('Upload-Metadata', '').split(','):
+        key, _, value = item.strip().partition(' ')
+        if key:
+            try:
+                metadata[key] = base64.b64decode(value, validate=True).decode('utf-8') if value else ''
+            except (binascii.Error, UnicodeDecodeError):
+                return jsonify({'error': f'Upload-Metadata value for {key} is not valid base64 UTF-8'}), 400, TUS_HEADERS
+
+    try:
+        upload_id = await upload_store.create(length, metadata.get('filename', ''))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status, TUS_HEADERS
+    logger.info(f"Created resumable upload {upload_id} ({length} bytes)")
+    return '', 201, {**TUS_HEADERS, 'Location': f'/api/uploads/{upload_id}'}
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'HEAD'])
+async def resumable_upload_status(upload_id):
+    """HEAD returns Upload-Offset for resuming; GET also returns the stored video once complete."""
+    try:
+        status = await upload_store.status(upload_id)
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status, TUS_HEADERS
+
+    headers = {
+        **TUS_HEADERS,
+        'Upload-Offset': str(status['offset']),
+        'Upload-Length': str(status['length']),
+        'Cache-Control': 'no-store'
+    }
+    if request.method == 'HEAD':
+        return '', 200, headers
+
+    body = {'offset': status['offset'], 'length': status['length'], 'complete': status['complete']}
+    if status['complete']:
+        body.update({
+            'video_url': f"/api/video/{status['result']['filename']}",
+            'video_path': status['result']['path'],
+            'sha256': status['result']['sha256']
+        })
+    return jsonify(body), 200, headers
+
+@app.route('/api/uploads/<upload_id>', methods=['PATCH'])
+async def append_resumable_upload(upload_id):
+    """Append the request body at Upload-Offset, streaming it to disk."""
+    if request.mimetype != 'application/offset+octet-stream':
+        return jsonify({'error': 'Content-Type must be application/offset+octet-stream'}), 415, TUS_HEADERS
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Upload-Offset header required'}), 400, TUS_HEADERS
+
+    try:
+        progress = await upload_store.append(upload_id, offset, request.body)
+    except UploadError as e:
+        logger.warning(f"Resumable upload {upload_id} rejected: {e}")
+        return jsonify({'error': str(e)}), e.status, TUS_HEADERS
+
+    if progress['complete']:
+        logger.info(f"Resumable upload {upload_id} stored as {progress['result']['path']}")
+    return '', 204, {**TUS_HEADERS, 'Upload-Offset': str(progress['offset'])}
+
 async def generate_scripts(prompt: str, duration: str) -> list:
     """Generate multiple script variations using GPT-4."""
     try:
         logger.info(f"Generating scripts for prompt: {prompt[:100]}... (duration: {duration}s)")
         
-        completion = await asyncio.to_thread(
+        completion = await run_blocking(
             openai_client.chat.completions.create,
             model="gpt-4",
             messages=[
@@ -851,12 +1119,26 @@ async def generate_scripts(prompt: str, duration: str) -> list:
         logger.error(traceback.format_exc())
         raise
 
-async def generate_srt_subtitles(text: str, duration: int) -> str:
+def segments_path(audio_path: str) -> str:
+    """Path of the JSON file holding a voiceover's per-sentence offsets."""
+    return os.path.splitext(audio_path)[0] + '.json'
+
+def format_srt_timestamp(seconds: float) -> str:
+    """Format seconds as an SRT timestamp (HH:MM:SS,mmm)."""
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{milliseconds:03d}"
+
+async def generate_srt_subtitles(text: str, duration: float, segments: list = None) -> str:
     """Generate SRT subtitles from script text.
     
     Args:
         text (str): The script text to convert to subtitles
-        duration (int): Total duration in seconds
+        duration (float): Total duration in seconds (the voiceover's, when known)
+        segments (list): Exact per-sentence offsets from the TTS engine; when given,
+            each sentence is shown exactly while it is spoken
         
     Returns:
         str: SRT formatted subtitles
@@ -864,26 +1146,27 @@ async def generate_srt_subtitles(text: str, duration: int) -> str:
     try:
         logger.info(f"Generating SRT subtitles for text: {text[:100]}...")
         
-        # Split text into sentences
-        sentences = [s.strip() for s in text.split('.') if s.strip()]
-        
-        # Calculate rough timing for each sentence
-        time_per_sentence = duration / len(sentences)
+        if segments:
+            cues = [(segment['start'], segment['end'], segment['text']) for segment in segments]
+        else:
+            # Split text into sentences and spread them evenly over the duration
+            sentences = [s.strip() for s in text.split('.') if s.strip()]
+            time_per_sentence = duration / len(sentences)
+            cues = [
+                ((i - 1) * time_per_sentence, i * time_per_sentence, sentence + ".")
+                for i, sentence in enumerate(sentences, 1)
+            ]
         
         # Generate SRT format
         srt_content = []
-        for i, sentence in enumerate(sentences, 1):
-            start_time = (i - 1) * time_per_sentence
-            end_time = i * time_per_sentence
-            
-            # Format timestamps as HH:MM:SS,mmm
-            start_str = f"{int(start_time//3600):02d}:{int((start_time%3600)//60):02d}:{int(start_time%60):02d},000"
-            end_str = f"{int(end_time//3600):02d}:{int((end_time%3600)//60):02d}:{int(end_time%60):02d},000"
+        for i, (start_time, end_time, caption) in enumerate(cues, 1):
+            start_str = format_srt_timestamp(start_time)
+            end_str = format_srt_timestamp(end_time)
             
             srt_content.extend([
                 str(i),
                 f"{start_str} --> {end_str}",
-                sentence.strip() + ".",
+                caption,
                 ""
             ])
         
@@ -891,14 +1174,14 @@ async def generate_srt_subtitles(text: str, duration: int) -> str:
         
         # Save to file
         temp_path = os.path.join(app.root_path, 'temp')
-        os.makedirs(temp_path, exist_ok=True)
+        await aiofiles.os.makedirs(temp_path, exist_ok=True)
         
-        filename = f"subtitles_{abs(hash(text))}.srt"
+        filename = f"subtitles_{uuid.uuid4().hex}.srt"
         filepath = os.path.join(temp_path, filename)
         
         logger.debug(f"Saving subtitles to {filepath}")
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(srt_text)
+        async with aiofiles.open(filepath, 'w', encoding='utf-8') as f:
+            await f.write(srt_text)
             
         logger.info("Subtitles generated successfully")
         return filepath
@@ -908,13 +1191,25 @@ async def generate_srt_subtitles(text: str, duration: int) -> str:
         logger.error(traceback.format_exc())
         raise
 
-async def combine_video_audio_subtitles(video_path: str, audio_path: str, subtitles_path: str) -> str:
+async def combine_video_audio_subtitles(video_path: str, audio_path: str, subtitles_path: str,
+                                        video_metadata: dict = None, audio_metadata: dict = None,
+                                        burn_subtitles: bool = True, keep_source_audio: bool = True,
+                                        mix_config: MixConfig = None) -> str:
     """Combine video, audio and subtitles into a single video file using FFmpeg.
+
+    The voiceover is mixed over the video's own soundtrack (ducked under speech)
+    and loudness-normalised in the same filter graph as the subtitle burn.
     
     Args:
         video_path (str): Path to the input video file
         audio_path (str): Path to the audio file
         subtitles_path (str): Path to the SRT subtitles file
+        video_metadata (dict): The video's media index entry, if known
+        audio_metadata (dict): The voiceover's media index entry, if known
+        burn_subtitles (bool): Burn subtitles into the picture; otherwise add them
+            as a soft subtitle track, which lets compatible video be stream-copied
+        keep_source_audio (bool): Keep the video's soundtrack under the voiceover
+        mix_config (MixConfig): Loudness target and ducking settings
         
     Returns:
         str: Path to the output video file
@@ -922,26 +1217,43 @@ async def combine_video_audio_subtitles(video_path: str, audio_path: str, subtit
     try:
         logger.info("Combining video, audio and subtitles...")
         
-        # Create output filename
-        output_filename = f"final_{os.path.basename(video_path)}"
-        output_path = os.path.join(app.root_path, 'temp', output_filename)
-        
-        # FFmpeg command to combine video, audio and burn subtitles
-        cmd = [
-            'ffmpeg',
-            '-i', video_path,           # Input video
-            '-i', audio_path,           # Input audio
-            '-c:v', 'libx264',          # Video codec
-            '-c:a', 'aac',              # Audio codec
-            '-b:a', '192k',             # Audio bitrate
-            '-map', '0:v:0',            # Map first video stream from first input
-            '-map', '1:a:0',            # Map first audio stream from second input
-            '-vf', f"subtitles='{subtitles_path}'",  # Burn subtitles into video
-            '-shortest',                # Match shortest input duration
-            '-y',                       # Overwrite output file
-            output_path
-        ]
+        # Render under a unique name; renamed to its content hash once complete
+        output_path = os.path.join(app.root_path, 'temp', f"render_{uuid.uuid4().hex}.mp4")
         
+        video_metadata = video_metadata or {}
+        audio_metadata = audio_metadata or {}
+        # Without metadata we cannot tell whether the video has a soundtrack, so it is dropped
+        source_has_audio = keep_source_audio and bool(video_metadata.get('audio'))
+        filter_graph, maps = build_filter_graph(
+            voice_loudness=audio_metadata.get('loudness'),
+            source_has_audio=source_has_audio,
+            source_loudness=video_metadata.get('loudness'),
+            subtitles_path=subtitles_path if burn_subtitles else None,
+            config=mix_config
+        )
+
+        cmd = ['ffmpeg', '-i', video_path, '-i', audio_path]
+        if not burn_subtitles:
+            cmd += ['-i', subtitles_path]
+        # One filter graph for subtitles, ducking and loudness: a single encode
+        cmd += ['-filter_complex', filter_graph, *maps]
+        if burn_subtitles:
+            # Burning subtitles changes every frame, so the video is re-encoded
+            cmd += ['-c:v', 'libx264']
+        else:
+            copy_video = can_stream_copy_video(video_metadata)
+            logger.info(f"Soft subtitles; video stream {'copied' if copy_video else 're-encoded'}")
+            cmd += ['-map', '2:s:0', '-c:s', 'mov_text', '-c:v', 'copy' if copy_video else 'libx264']
+        cmd += ['-c:a', 'aac', '-b:a', '192k']
+
+        video_duration = video_metadata.get('duration')
+        if video_duration:
+            # Keep the whole video; -shortest would cut it at the end of the voiceover
+            cmd += ['-t', f"{video_duration:.3f}"]
+        else:
+            cmd += ['-shortest']
+        cmd += ['-y', output_path]
+
         # Run FFmpeg command
         process = await asyncio.create_subprocess_exec(
             *cmd,
@@ -955,8 +1267,13 @@ async def combine_video_audio_subtitles(video_path: str, audio_path: str, subtit
             logger.error(f"FFmpeg error: {stderr.decode()}")
             raise Exception(f"FFmpeg error: {stderr.decode()}")
             
-        logger.info(f"Successfully combined video, audio and subtitles to: {output_path}")
-        return output_path
+        digest = await run_blocking(file_sha256, output_path)
+        final_path = os.path.join(app.root_path, 'temp', f"final_{digest[:32]}.mp4")
+        await aiofiles.os.replace(output_path, final_path)
+        index_in_background(final_path, digest)
+
+        logger.info(f"Successfully combined video, audio and subtitles to: {final_path}")
+        return final_path
         
     except Exception as e:
         logger.error(f"Error combining video, audio and subtitles: {str(e)}")
@@ -978,7 +1295,12 @@ async def combine():
         video_path = data.get('video_path')
         audio_url = data.get('audio_url')
         text = data.get('text')
-        duration = int(data.get('duration', '30'))
+        burn_subtitles = data.get('burn_subtitles', True)
+        keep_source_audio = data.get('keep_source_audio', True)
+        try:
+            mix_config = MixConfig.for_platform(data.get('platform', 'meta'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         if not video_path:
             logger.warning("No video path provided")
@@ -990,33 +1312,64 @@ async def combine():
             logger.warning("No text provided")
             return jsonify({'error': 'No text provided'}), 400
 
-        # Get the audio file path from the URL
-        audio_filename = audio_url.split('/')[-1]
-        audio_path = os.path.join(app.root_path, 'temp', audio_filename)
-        
-        if not os.path.exists(audio_path):
+        # Only files we stored in TEMP_DIR may be read or handed to ffmpeg
+        audio_path = await asyncio.to_thread(resolve_temp_path, os.path.join(TEMP_DIR, audio_url.split('/')[-1]))
+        video_path = await asyncio.to_thread(resolve_temp_path, video_path)
+
+        if not audio_path:
             logger.error("Audio file not found")
             return jsonify({'error': 'Audio file not found'}), 404
+        if not video_path:
+            logger.error("Video file not found")
+            return jsonify({'error': 'Video file not found'}), 404
 
-        # Generate subtitles
+        # Durations come from the media index; the client's value is only a fallback
+        try:
+            video_metadata = await media_index.get(video_path)
+            audio_metadata = await media_index.get(audio_path)
+        except ValueError as e:
+            logger.warning(f"Unreadable media: {e}")
+            return jsonify({'error': str(e)}), 400
+        video_duration = (video_metadata or {}).get('duration')
+        audio_duration = (audio_metadata or {}).get('duration')
+
+        warnings = []
+        if video_duration and audio_duration and audio_duration > video_duration + 0.05:
+            warnings.append(
+                f"Voiceover is {audio_duration:.1f}s but the video is {video_duration:.1f}s; "
+                f"the voiceover will be cut off"
+            )
+
+        # Generate subtitles timed to the voiceover
         logger.info("Generating subtitles...")
-        subtitles_filepath = await generate_srt_subtitles(text, duration)
+        segments = None
+        if await aiofiles.os.path.exists(segments_path(audio_path)):
+            async with aiofiles.open(segments_path(audio_path), 'r', encoding='utf-8') as f:
+                segments = json.loads(await f.read())
+        subtitle_duration = audio_duration or video_duration or float(data.get('duration', '30'))
+        subtitles_filepath = await generate_srt_subtitles(text, subtitle_duration, segments)
 
         # Combine video, audio and subtitles
         logger.info("Combining video, audio and subtitles...")
         final_video_path = await combine_video_audio_subtitles(
             video_path,
             audio_path,
-            subtitles_filepath
+            subtitles_filepath,
+            video_metadata=video_metadata,
+            audio_metadata=audio_metadata,
+            burn_subtitles=burn_subtitles,
+            keep_source_audio=keep_source_audio,
+            mix_config=mix_config
         )
 
         # Clean up subtitles file
-        os.remove(subtitles_filepath)
+        await aiofiles.os.remove(subtitles_filepath)
 
         logger.info("Process completed successfully")
         return jsonify({
             'message': 'Video with voiceover and subtitles generated successfully',
-            'video_url': f'/api/video/{os.path.basename(final_video_path)}'
+            'video_url': f'/api/video/{os.path.basename(final_video_path)}',
+            'warnings': warnings
         })
 
     except Exception as e:
@@ -1024,6 +1377,29 @@ async def combine():
         logger.error(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
+@app.before_serving
+async def freeze_startup_objects():
+    """Move everything allocated during import into the GC's permanent generation.
+
+    The SDKs and their models make up most of the heap, and full collections
+    would otherwise walk all of it on the event loop thread mid-request.
+    """
+    gc.collect()
+    gc.freeze()
+
+@app.before_serving
+async def prefetch_voice_samples():
+    """Warm the voice catalog and sample clips in the background."""
+    if os.getenv("VOICE_SAMPLE_PREFETCH", "1") == "0":
+        return
+
+    async def prefetch():
+        try:
+            await voice_catalog.prefetch_samples()
+        except Exception as e:
+            logger.warning(f"Voice sample prefetch failed: {e}")
+    app.add_background_task(prefetch)
+
 if __name__ == '__main__':
     logger.info("Starting Quart application")
     # Create temp directory if it doesn't exist
@@ -1036,4 +1412,5 @@ if __name__ == '__main__':
     logger.info(f"OpenAI API key present: {bool(openai_api_key)}")
     logger.info(f"ElevenLabs API key present: {bool(elevenlabs_api_key)}")
     
+    # Development server only; see hypercorn_config.py for production
     app.run(debug=True, port=5001) 
@@ -0,0 +1,196 @@
+"""Sentence-level TTS fan-out with gapless stitching.
+
+A script is split at sentence boundaries and every sentence is synthesized
+concurrently (bounded by the engine's worker pool), each request carrying the
+surrounding text as previous_text/next_text so prosody stays continuous.
+Sentences come back as raw PCM, so they are concatenated sample-accurately
+(no MP3 encoder delay or padding between them) into a single WAV, and every
+sentence's exact start and end offsets fall out of the sample counts.
+
+Raw PCM at 44.1kHz is only offered on ElevenLabs' Pro plan, so the engine asks
+for a rate every plan allows (TTS_SAMPLE_RATE, 24kHz by default). If the API
+still rejects the PCM format, the engine stops fanning out and synthesizes
+whole scripts as MP3 instead, without sentence offsets.
+"""
+import asyncio
+import functools
+import io
+import os
+import re
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+# Whitespace after terminal punctuation, optionally followed by a closing quote or bracket
+SENTENCE_BOUNDARY = re.compile(r'(?:(?<=[.!?…])|(?<=[.!?…]["”\')\]]))\s+')
+# How much surrounding text is sent as context with each sentence
+CONTEXT_CHARS = 1000
+SAMPLE_WIDTH = 2  # ElevenLabs pcm_* output is 16-bit mono little-endian
+# Offered on every plan, unlike pcm_44100
+DEFAULT_SAMPLE_RATE = 24000
+FALLBACK_FORMAT = "mp3_44100_128"
+
+
+def is_format_rejected(error: Exception) -> bool:
+    """Whether an ElevenLabs API error says the requested output format is not allowed."""
+    status = getattr(error, "status_code", None)
+    return status in (400, 401, 403, 422) and "format" in str(getattr(error, "body", "")).lower()
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split a script into sentences, keeping their punctuation."""
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text.strip()) if sentence.strip()]
+
+
+@dataclass
+class SpeechSegment:
+    """One synthesized sentence and where it sits in the stitched audio.
+
+    Attributes:
+        text (str): The sentence.
+        start (float): Offset of its first sample, in seconds.
+        end (float): Offset just past its last sample, in seconds.
+    """
+    text: str
+    start: float
+    end: float
+
+
+@dataclass
+class Voiceover:
+    """A stitched voiceover.
+
+    Attributes:
+        audio (bytes): File contents: WAV (16-bit mono PCM), or MP3 when the
+            plan does not allow PCM output.
+        sample_rate (int): Sample rate of the audio.
+        duration (Optional[float]): Length in seconds; None for MP3.
+        segments (List[SpeechSegment]): Per-sentence offsets, in order; empty for MP3.
+        format (str): File extension of the audio, "wav" or "mp3".
+    """
+    audio: bytes
+    sample_rate: int
+    duration: Optional[float]
+    segments: List[SpeechSegment] = field(default_factory=list)
+    format: str = "wav"
+
+    def segments_as_dicts(self) -> List[dict]:
+        return [asdict(segment) for segment in self.segments]
+
+
+def stitch_pcm(clips: List[bytes], texts: List[str], sample_rate: int) -> Voiceover:
+    """Concatenate 16-bit mono PCM clips into a WAV and record each clip's offsets."""
+    pcm = bytearray()
+    segments = []
+    for clip, text in zip(clips, texts):
+        # Drop a trailing odd byte so every clip starts on a sample boundary
+        clip = clip[:len(clip) - len(clip) % SAMPLE_WIDTH]
+        start = len(pcm) // SAMPLE_WIDTH
+        pcm += clip
+        segments.append(SpeechSegment(text, start / sample_rate, len(pcm) // SAMPLE_WIDTH / sample_rate))
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(pcm))
+    return Voiceover(buffer.getvalue(), sample_rate, len(pcm) // SAMPLE_WIDTH / sample_rate, segments)
+
+
+class TTSEngine:
+    """Synthesizes scripts sentence by sentence through an ElevenLabs client.
+
+    Args:
+        client: A (synchronous) ElevenLabs client.
+        model_id (str): ElevenLabs model ID. Defaults to "eleven_multilingual_v2".
+        sample_rate (int): PCM sample rate to request. Defaults to the
+            TTS_SAMPLE_RATE environment variable, or 24000.
+        fallback_format (str): Output format for whole-script synthesis when the
+            PCM format is rejected. Defaults to "mp3_44100_128".
+        max_concurrency (int): Sentences in flight at once, across all scripts
+            (ElevenLabs limits concurrent requests per plan). Defaults to the
+            TTS_CONCURRENCY environment variable, or 4.
+    """
+
+    def __init__(self, client, model_id: str = "eleven_multilingual_v2", sample_rate: int = None,
+                 max_concurrency: int = None, fallback_format: str = FALLBACK_FORMAT):
+        self.client = client
+        self.model_id = model_id
+        self.sample_rate = sample_rate or int(os.getenv("TTS_SAMPLE_RATE", str(DEFAULT_SAMPLE_RATE)))
+        self.fallback_format = fallback_format
+        # Cleared once the API rejects pcm_<sample_rate> for this account
+        self.fanout = True
+        # The pool size is the rate limit: requests beyond it queue here
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_concurrency or int(os.getenv("TTS_CONCURRENCY", "4")),
+            thread_name_prefix="tts"
+        )
+
+    def _synthesize_sentence(self, text: str, voice_id: str, model_id: str,
+                             previous_text: str, next_text: str) -> bytes:
+        audio = self.client.text_to_speech.convert(
+            voice_id=voice_id,
+            text=text,
+            model_id=model_id,
+            output_format=f"pcm_{self.sample_rate}",
+            previous_text=previous_text or None,
+            next_text=next_text or None,
+        )
+        return b''.join(chunk for chunk in audio if chunk)
+
+    def _synthesize_whole(self, text: str, voice_id: str, model_id: str) -> Voiceover:
+        audio = self.client.text_to_speech.convert(
+            voice_id=voice_id,
+            text=text,
+            model_id=model_id,
+            output_format=self.fallback_format,
+        )
+        sample_rate = int(self.fallback_format.split('_')[1])
+        return Voiceover(b''.join(chunk for chunk in audio if chunk), sample_rate, None, format="mp3")
+
+    async def synthesize(self, text: str, voice_id: str, model_id: str = None) -> Voiceover:
+        """Synthesize a script and return the stitched voiceover with sentence offsets.
+
+        Args:
+            text (str): The script.
+            voice_id (str): ElevenLabs voice ID.
+            model_id (str): ElevenLabs model ID. Defaults to the engine's model.
+
+        Returns:
+            Voiceover: WAV audio, duration and per-sentence segments, or MP3
+                audio without them if the account cannot get PCM output.
+        """
+        sentences = split_sentences(text)
+        if not sentences:
+            raise ValueError("No text to synthesize")
+        loop = asyncio.get_running_loop()
+        model_id = model_id or self.model_id
+
+        if self.fanout:
+            try:
+                return await self._synthesize_sentences(loop, sentences, voice_id, model_id)
+            except Exception as e:
+                if not is_format_rejected(e):
+                    raise
+                print(f"ElevenLabs rejected pcm_{self.sample_rate}; synthesizing whole scripts as "
+                      f"{self.fallback_format} from now on: {e}")
+                self.fanout = False
+        return await loop.run_in_executor(
+            self.executor, functools.partial(self._synthesize_whole, text, voice_id, model_id)
+        )
+
+    async def _synthesize_sentences(self, loop, sentences: List[str], voice_id: str, model_id: str) -> Voiceover:
+        def context(i):
+            previous_text = ' '.join(sentences[:i])[-CONTEXT_CHARS:]
+            next_text = ' '.join(sentences[i + 1:])[:CONTEXT_CHARS]
+            return previous_text, next_text
+
+        clips = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, functools.partial(
+                self._synthesize_sentence, sentence, voice_id, model_id, *context(i)
+            ))
+            for i, sentence in enumerate(sentences)
+        ))
+        return stitch_pcm(clips, sentences, self.sample_rate)
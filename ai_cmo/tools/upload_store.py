@@ -0,0 +1,344 @@
+"""Streaming, content-addressed storage for uploaded source videos.
+
+Uploads are written to disk chunk by chunk as they arrive, hashed with SHA-256
+on the fly and stored as upload_<sha256>.<ext>, so identical re-uploads are
+deduplicated instead of overwriting each other. The container is checked from
+its first bytes while streaming and, when ffprobe is installed, probed once
+the file is complete.
+
+Large source footage can be sent through the resumable (tus-style) API:
+create() an upload with its total length, append() chunks at the current
+offset and resume from status() after a dropped connection. Appends hold an
+flock on the upload's lock file, so a client may resume through any worker
+process sharing the upload directory.
+"""
+import asyncio
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import AsyncIterable, Awaitable, Callable, Optional
+
+import aiofiles
+import aiofiles.os
+from werkzeug.sansio.multipart import Data, Epilogue, File, MultipartDecoder, NeedData
+
+SNIFF_BYTES = 64
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """An upload was rejected; status is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_container(header: bytes) -> Optional[str]:
+    """Identify a video container from its first bytes.
+
+    Args:
+        header (bytes): At least the first 12 bytes of the file.
+
+    Returns:
+        Optional[str]: "mp4" (ISO BMFF, including MOV), "matroska" (MKV/WebM),
+            "avi", or None if the bytes match no supported container.
+    """
+    if len(header) >= 12 and header[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+        return "mp4"
+    if header.startswith(b'\x1a\x45\xdf\xa3'):
+        return "matroska"
+    if header.startswith(b'RIFF') and header[8:12] == b'AVI ':
+        return "avi"
+    return None
+
+
+async def probe_format(path: str) -> Optional[str]:
+    """Return ffprobe's format_name for a file, or None when ffprobe is not installed.
+
+    Raises:
+        ValueError: If ffprobe cannot read the file as media.
+    """
+    if not shutil.which('ffprobe'):
+        return None
+    process = await asyncio.create_subprocess_exec(
+        'ffprobe', '-v', 'error', '-show_entries', 'format=format_name', '-of', 'json', path,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        raise ValueError(stderr.decode(errors='replace').strip())
+    return json.loads(stdout or b'{}').get('format', {}).get('format_name')
+
+
+def _file_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+class _IncomingFile:
+    """Appends to a partial file, hashing and sniffing bytes as they arrive."""
+
+    def __init__(self, path: str, max_bytes: int, offset: int = 0, header: bytes = b'', hasher=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = offset
+        self.header = header
+        self.hasher = hasher
+        self.container = sniff_container(header) if len(header) >= SNIFF_BYTES else None
+        self._file = None
+
+    async def open(self) -> "_IncomingFile":
+        self._file = await aiofiles.open(self.path, 'ab')
+        return self
+
+    async def close(self):
+        if self._file is not None:
+            await self._file.close()
+            self._file = None
+
+    async def discard(self):
+        await self.close()
+        try:
+            await aiofiles.os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def check_container(self):
+        self.container = sniff_container(self.header)
+        if self.container is None:
+            raise UploadError("File is not a supported video container", 415)
+
+    async def write(self, data: bytes):
+        if not data:
+            return
+        if self.size + len(data) > self.max_bytes:
+            raise UploadError(f"Upload exceeds {self.max_bytes} bytes", 413)
+        # Reject non-video payloads as soon as the header is in, not after the whole body
+        if len(self.header) < SNIFF_BYTES:
+            self.header += data[:SNIFF_BYTES - len(self.header)]
+            if len(self.header) >= SNIFF_BYTES:
+                self.check_container()
+        await self._file.write(data)
+        self.size += len(data)
+        if self.hasher is not None:
+            self.hasher.update(data)
+
+
+class UploadStore:
+    """Stores uploaded videos under content-addressed names.
+
+    Args:
+        root (str): Directory for completed uploads (served as /api/video/<name>).
+        allowed_extensions (set): File extensions accepted for uploads.
+        max_bytes (int): Largest accepted upload.
+        expiry (float): Seconds after which abandoned resumable uploads are removed.
+        probe (callable): Async probe(path, sha256) run on each new file before it
+            is kept, raising ValueError for unreadable media. Defaults to a bare
+            ffprobe format check.
+    """
+
+    def __init__(self, root: str, allowed_extensions: set, max_bytes: int = 10 * 1024 ** 3,
+                 expiry: float = 24 * 3600, probe: Callable[[str, str], Awaitable] = None):
+        self.root = root
+        self.partial_dir = os.path.join(root, 'uploads')
+        self.allowed_extensions = allowed_extensions
+        self.max_bytes = max_bytes
+        self.expiry = expiry
+        self.probe = probe or (lambda path, sha256: probe_format(path))
+        # Running (hasher, offset) of resumable uploads handled by this process;
+        # another worker or a restart falls back to rehashing the finished file
+        self._hashers = {}
+        self._locks = {}
+        os.makedirs(self.partial_dir, exist_ok=True)
+
+    def _extension(self, filename: str) -> str:
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        if extension not in self.allowed_extensions:
+            raise UploadError("Invalid file type")
+        return extension
+
+    async def _finalize(self, incoming: _IncomingFile, extension: str, digest: str) -> dict:
+        try:
+            if incoming.container is None:
+                # Files shorter than the sniff window are checked here
+                incoming.check_container()
+            filename = f"upload_{digest[:32]}.{extension}"
+            path = os.path.join(self.root, filename)
+            deduplicated = await aiofiles.os.path.exists(path)
+            if not deduplicated:
+                try:
+                    await self.probe(incoming.path, digest)
+                except ValueError as e:
+                    raise UploadError(f"Not a readable video: {e}", 415)
+                await aiofiles.os.replace(incoming.path, path)
+        finally:
+            await incoming.discard()
+
+        return {
+            'filename': filename,
+            'path': path,
+            'sha256': digest,
+            'size': incoming.size,
+            'container': incoming.container,
+            'deduplicated': deduplicated
+        }
+
+    async def save_multipart(self, body: AsyncIterable[bytes], boundary: bytes, field_name: str) -> dict:
+        """Stream the file part named field_name of a multipart/form-data body to disk.
+
+        Other parts are skipped; nothing but the current chunk is held in memory.
+
+        Returns:
+            dict: filename, path, sha256, size, container and whether an identical
+                file was already stored (deduplicated).
+
+        Raises:
+            UploadError: If the part is missing, not a video or too large.
+        """
+        # The decoder only buffers the unparsed tail of each chunk; events are drained below
+        decoder = MultipartDecoder(boundary)
+        extension, incoming, in_file = None, None, False
+        try:
+            async for chunk in body:
+                decoder.receive_data(chunk)
+                event = decoder.next_event()
+                while not isinstance(event, (NeedData, Epilogue)):
+                    if isinstance(event, File) and event.name == field_name and incoming is None:
+                        extension = self._extension(event.filename or '')
+                        partial_path = os.path.join(self.partial_dir, f"{uuid.uuid4().hex}.stream")
+                        incoming = await _IncomingFile(partial_path, self.max_bytes, hasher=hashlib.sha256()).open()
+                        in_file = True
+                    elif isinstance(event, Data):
+                        if in_file:
+                            await incoming.write(event.data)
+                            in_file = event.more_data
+                    else:
+                        in_file = False
+                    event = decoder.next_event()
+        except BaseException:
+            if incoming is not None:
+                await incoming.discard()
+            raise
+
+        if incoming is None:
+            raise UploadError("No video file uploaded")
+        await incoming.close()
+        return await self._finalize(incoming, extension, incoming.hasher.hexdigest())
+
+    def _record_path(self, upload_id: str) -> str:
+        if not UPLOAD_ID_PATTERN.match(upload_id):
+            raise UploadError("Unknown upload", 404)
+        return os.path.join(self.partial_dir, f"{upload_id}.json")
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.partial_dir, f"{upload_id}.part")
+
+    @contextlib.asynccontextmanager
+    async def _append_lock(self, upload_id: str):
+        """Serialize appends to one upload across coroutines and worker processes."""
+        lock_path = os.path.join(os.path.dirname(self._record_path(upload_id)), f"{upload_id}.lock")
+        async with self._locks.setdefault(upload_id, asyncio.Lock()):
+            # Closing the file releases the flock
+            with open(lock_path, 'a+b') as lock_file:
+                await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+                yield
+
+    async def _read_record(self, upload_id: str) -> dict:
+        try:
+            async with aiofiles.open(self._record_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.loads(await f.read())
+        except FileNotFoundError:
+            raise UploadError("Unknown upload", 404)
+
+    async def _write_record(self, upload_id: str, record: dict):
+        record_path = self._record_path(upload_id)
+        async with aiofiles.open(f"{record_path}.tmp", 'w', encoding='utf-8') as f:
+            await f.write(json.dumps(record))
+        await aiofiles.os.replace(f"{record_path}.tmp", record_path)
+
+    async def create(self, length: int, filename: str) -> str:
+        """Start a resumable upload of length bytes and return its id."""
+        self._extension(filename)
+        if length <= 0 or length > self.max_bytes:
+            raise UploadError(f"Upload length must be between 1 and {self.max_bytes} bytes", 413)
+        await self.expire()
+        upload_id = uuid.uuid4().hex
+        async with aiofiles.open(self._part_path(upload_id), 'wb'):
+            pass
+        await self._write_record(upload_id, {
+            'length': length,
+            'filename': filename,
+            'created_at': time.time(),
+            'complete': False
+        })
+        self._hashers[upload_id] = (hashlib.sha256(), 0)
+        return upload_id
+
+    async def status(self, upload_id: str) -> dict:
+        """Offset and length of a resumable upload, plus its result once complete."""
+        record = await self._read_record(upload_id)
+        if not record['complete']:
+            record['offset'] = (await aiofiles.os.stat(self._part_path(upload_id))).st_size
+        return record
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterable[bytes]) -> dict:
+        """Append chunks to a resumable upload at offset.
+
+        Returns:
+            dict: The new offset, the length and whether the upload is complete
+                (with the stored file's details under "result" once it is).
+
+        Raises:
+            UploadError: 409 if offset is not the current end of the upload.
+        """
+        async with self._append_lock(upload_id):
+            record = await self.status(upload_id)
+            if record['complete']:
+                raise UploadError("Upload already complete", 409)
+            if offset != record['offset']:
+                raise UploadError(f"Upload offset is {record['offset']}", 409)
+
+            partial_path = self._part_path(upload_id)
+            hasher, hashed_offset = self._hashers.pop(upload_id, (None, None))
+            if hashed_offset != offset:
+                hasher = None
+            header = b''
+            if offset:
+                async with aiofiles.open(partial_path, 'rb') as f:
+                    header = await f.read(SNIFF_BYTES)
+            incoming = await _IncomingFile(partial_path, record['length'], offset, header, hasher).open()
+            try:
+                async for chunk in chunks:
+                    await incoming.write(chunk)
+            finally:
+                await incoming.close()
+                if hasher is not None:
+                    self._hashers[upload_id] = (hasher, incoming.size)
+
+            if incoming.size < record['length']:
+                return {'offset': incoming.size, 'length': record['length'], 'complete': False}
+
+            self._hashers.pop(upload_id, None)
+            self._locks.pop(upload_id, None)
+            digest = hasher.hexdigest() if hasher is not None else await asyncio.to_thread(_file_sha256, partial_path)
+            result = await self._finalize(incoming, self._extension(record['filename']), digest)
+            await self._write_record(upload_id, {**record, 'complete': True, 'offset': incoming.size, 'result': result})
+            return {'offset': incoming.size, 'length': record['length'], 'complete': True, 'result': result}
+
+    async def expire(self):
+        """Remove resumable uploads untouched for longer than the expiry window."""
+        cutoff = time.time() - self.expiry
+        for entry in await aiofiles.os.scandir(self.partial_dir):
+            if entry.stat().st_mtime < cutoff:
+                try:
+                    await aiofiles.os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
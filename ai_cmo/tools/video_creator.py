@@ -1,15 +1,16 @@
-from typing import Optional, Dict, Any, Literal
+from typing import Optional, Dict, Any, Literal, Callable
 import os
 from pathlib import Path
-import fal_client
-from dataclasses import dataclass, field
+from dataclasses import asdict, dataclass, field
+from functools import cached_property
 from dotenv import load_dotenv
 import asyncio
-import openai
-import requests
-from elevenlabs.client import ElevenLabs
-from elevenlabs import play
+import hashlib
 import tempfile
+import threading
+
+from tools.tts_engine import TTSEngine
+from utils.singleflight import get_singleflight, make_key
 
 # Load environment variables from .env file
 env_path = Path(__file__).parents[1] / '.env'
@@ -24,14 +25,19 @@ class VoiceConfig:
     
     Attributes:
         enabled (bool): Whether to generate a voiceover for the video.
-        voice_id (str): ElevenLabs voice ID to use. Defaults to "JBFqnCBsd6RMkjVDRZzb".
+        voice_id (str): ElevenLabs voice ID to use (see /api/voices in the voiceover app).
+            Defaults to the ELEVENLABS_VOICE_ID environment variable, or "JBFqnCBsd6RMkjVDRZzb".
         model_id (str): ElevenLabs model ID to use. Defaults to "eleven_multilingual_v2".
-        output_format (str): Audio output format. Defaults to "mp3_44100_128".
+        output_format (str): Audio output format when sentence_fanout is off.
+            Defaults to "mp3_44100_128".
+        sentence_fanout (bool): Synthesize sentences concurrently and stitch them
+            into a WAV with per-sentence offsets. Defaults to True.
     """
     enabled: bool = False
-    voice_id: str = "JBFqnCBsd6RMkjVDRZzb"
+    voice_id: str = field(default_factory=lambda: os.getenv("ELEVENLABS_VOICE_ID", "JBFqnCBsd6RMkjVDRZzb"))
     model_id: str = "eleven_multilingual_v2"
     output_format: str = "mp3_44100_128"
+    sentence_fanout: bool = True
 
 @dataclass
 class ScriptConfig:
@@ -96,13 +102,38 @@ class VideoCreator:
         self.openai_api_key = os.getenv("OPENAI_API_KEY")
         if not self.openai_api_key:
             raise ValueError("OPENAI_API_KEY not found in .env file.")
-        openai.api_key = self.openai_api_key
 
-        # Initialize ElevenLabs client
+        # Check ElevenLabs API key
         self.elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
         if not self.elevenlabs_api_key:
             raise ValueError("ELEVENLABS_API_KEY not found in .env file.")
-        self.elevenlabs_client = ElevenLabs()
+
+        # Progress callbacks of every caller sharing a render, by render key
+        self._watchers = {}
+        self._watchers_lock = threading.Lock()
+
+    # The SDKs below are imported on first use rather than with this module
+
+    @cached_property
+    def fal(self):
+        """fal.ai client module; replaceable so benchmarks can route it to a local stub."""
+        import fal_client
+        return fal_client
+
+    @cached_property
+    def openai_client(self):
+        """AsyncOpenAI client, bound to the event loop of the first script request."""
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(api_key=self.openai_api_key)
+
+    @cached_property
+    def elevenlabs_client(self):
+        from elevenlabs.client import ElevenLabs
+        return ElevenLabs(base_url=os.getenv("ELEVENLABS_BASE_URL"))
+
+    @cached_property
+    def tts_engine(self) -> TTSEngine:
+        return TTSEngine(self.elevenlabs_client)
 
     async def _generate_script(self, prompt: str, duration: str) -> str:
         """Generate a script using GPT-4.
@@ -118,7 +149,7 @@ class VideoCreator:
             Exception: If script generation fails.
         """
         try:
-            response = await openai.ChatCompletion.acreate(
+            response = await self.openai_client.chat.completions.create(
                 model="gpt-4",
                 messages=[
                     {"role": "system", "content": "You are a professional script writer. Create engaging, concise scripts that match the timing constraints."},
@@ -129,7 +160,7 @@ class VideoCreator:
         except Exception as e:
             raise Exception(f"Failed to generate script: {str(e)}")
 
-    async def _generate_voiceover(self, text: str, voice_config: VoiceConfig) -> bytes:
+    async def _generate_voiceover(self, text: str, voice_config: VoiceConfig) -> Dict[str, Any]:
         """Generate a voiceover using ElevenLabs text-to-speech.
 
         Args:
@@ -137,21 +168,28 @@ class VideoCreator:
             voice_config (VoiceConfig): Configuration for voice generation.
 
         Returns:
-            bytes: The generated audio data.
+            Dict[str, Any]: The audio bytes under "audio" and, with sentence_fanout,
+                the per-sentence offsets under "segments".
 
         Raises:
             Exception: If voiceover generation fails.
         """
         try:
             print(f"Generating voiceover for text: {text[:100]}...")
-            audio = self.elevenlabs_client.text_to_speech.convert(
+            if voice_config.sentence_fanout:
+                voiceover = await self.tts_engine.synthesize(text, voice_config.voice_id, voice_config.model_id)
+                print("Voiceover generated successfully")
+                # No segments when the plan forced the engine to whole-script MP3
+                return {"audio": voiceover.audio, "segments": voiceover.segments_as_dicts() or None}
+
+            audio = await asyncio.to_thread(lambda: b''.join(self.elevenlabs_client.text_to_speech.convert(
                 text=text,
                 voice_id=voice_config.voice_id,
                 model_id=voice_config.model_id,
                 output_format=voice_config.output_format,
-            )
+            )))
             print("Voiceover generated successfully")
-            return audio
+            return {"audio": audio, "segments": None}
         except Exception as e:
             raise Exception(f"Failed to generate voiceover: {str(e)}")
 
@@ -165,6 +203,7 @@ class VideoCreator:
             audio_data (bytes): The audio data to play.
         """
         try:
+            from elevenlabs import play
             print("Playing generated voiceover...")
             play(audio_data)
         except Exception as e:
@@ -185,34 +224,74 @@ class VideoCreator:
         except Exception as e:
             raise Exception(f"Failed to save audio: {str(e)}")
 
-    async def create_video(self, config: VideoGenerationConfig) -> Dict[str, Any]:
+    async def create_video(self, config: VideoGenerationConfig,
+                           progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Generate a video from a local image using the Kling Video API.
 
         If script generation is enabled, this will also generate a script using GPT-4.
         If voice generation is enabled, this will generate a voiceover using ElevenLabs.
+        Concurrent calls with the same settings and image share one render, and each
+        caller's progress callback sees its stages.
 
         Args:
             config (VideoGenerationConfig): Configuration for video generation including
                 prompt (video description), image_url (local image path), duration,
                 aspect ratio, script settings, and voice settings.
+            progress (Optional[Callable[[str], None]]): Called with a short message as
+                each stage starts, e.g. to show render progress on a page.
 
         Returns:
             Dict[str, Any]: The API response containing the generated video information,
-                optionally the script, and optionally the voiceover audio data.
+                optionally the script, and optionally the voiceover audio data with its
+                per-sentence segments.
 
         Raises:
             Exception: If video generation fails.
         """
+        key = await asyncio.to_thread(self._render_key, config)
+        report = progress or (lambda message: None)
+        with self._watchers_lock:
+            watchers = self._watchers.setdefault(key, [])
+            watchers.append(report)
+
+        def broadcast(message: str):
+            with self._watchers_lock:
+                current = list(watchers)
+            for watcher in current:
+                watcher(message)
+
+        try:
+            # An identical render already in flight is joined rather than repeated
+            return await get_singleflight().do_async(key, lambda: self._render(config, broadcast))
+        finally:
+            with self._watchers_lock:
+                watchers.remove(report)
+                if not watchers and self._watchers.get(key) is watchers:
+                    del self._watchers[key]
+
+    def _render_key(self, config: VideoGenerationConfig) -> str:
+        """Singleflight key: the config, with the image identified by its content."""
+        parameters = asdict(config)
+        try:
+            with open(config.image_url, "rb") as f:
+                # Uploads of the same picture get fresh file names
+                parameters["image_url"] = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            pass
+        return make_key("create_video", parameters)
+
+    async def _render(self, config: VideoGenerationConfig, report: Callable[[str], None]) -> Dict[str, Any]:
         try:
             # Get the URL for the image
             print(f"Uploading image from path: {config.image_url}")
-            image_url = fal_client.upload_file(config.image_url)
+            report("Uploading image")
+            image_url = await self.fal.upload_file_async(config.image_url)
             print(f"Image successfully uploaded to: {image_url}")
 
             print(f"Starting video generation with config: {config}")
             
             # Submit the request asynchronously
-            handler = await fal_client.submit_async(
+            handler = await self.fal.submit_async(
                 "fal-ai/kling-video/v1.6/pro/image-to-video",
                 arguments={
                     "prompt": config.prompt,
@@ -224,6 +303,7 @@ class VideoCreator:
             
             request_id = handler.request_id
             print(f"Request submitted with ID: {request_id}")
+            report("Rendering video")
             
             # Poll for results
             max_attempts = 30  # 5 minutes total (10 second intervals)
@@ -232,7 +312,9 @@ class VideoCreator:
             while attempt < max_attempts:
                 try:
                     print(f"Checking for results (attempt {attempt + 1}/{max_attempts})...")
-                    result = await fal_client.result_async(
+                    if attempt:
+                        report(f"Rendering video (checked {attempt} times)")
+                    result = await self.fal.result_async(
                         "fal-ai/kling-video/v1.6/pro/image-to-video",
                         request_id
                     )
@@ -258,6 +340,7 @@ class VideoCreator:
                     # If script generation is enabled, generate script
                     if config.script.enabled:
                         print("Generating script...")
+                        report("Writing script")
                         
                         # Generate or use provided script
                         script = config.script.base_script
@@ -269,9 +352,12 @@ class VideoCreator:
                         # If voice generation is enabled and we have a script, generate voiceover
                         if config.voice.enabled:
                             print("Generating voiceover...")
-                            audio_data = await self._generate_voiceover(script, config.voice)
-                            response["voiceover"] = audio_data
+                            report("Recording voiceover")
+                            voiceover = await self._generate_voiceover(script, config.voice)
+                            response["voiceover"] = voiceover["audio"]
+                            response["voiceover_segments"] = voiceover["segments"]
 
+                    report("Done")
                     return response
                     
                 except Exception as e:
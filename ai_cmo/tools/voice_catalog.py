@@ -0,0 +1,226 @@
+"""Locally cached ElevenLabs voice catalog with pre-generated sample clips.
+
+The voice list is kept in a JSON cache that is served as-is while it is younger
+than the TTL and revalidated with If-None-Match afterwards, so an unchanged
+catalog costs one 304. If ElevenLabs cannot be reached the stale copy keeps
+being served. Each voice gets a short sample clip cached on disk: the voice's
+free preview_url when it has one, otherwise a one-off TTS render of
+SAMPLE_TEXT, so auditioning voices in the picker never waits on (or pays for)
+a synthesis call after the first.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import Awaitable, Callable, List, Optional
+
+import aiofiles
+import aiofiles.os
+
+from utils.http_client import AsyncHttpClient
+
+logger = logging.getLogger(__name__)
+
+ELEVENLABS_API_BASE = "https://api.elevenlabs.io"
+SAMPLE_TEXT = "Hi there! This is how your next ad could sound with my voice."
+VOICE_ID_PATTERN = re.compile(r'^[A-Za-z0-9]{1,64}$')
+SAMPLE_EXTENSIONS = {'audio/mpeg': 'mp3', 'audio/mp3': 'mp3', 'audio/wav': 'wav', 'audio/x-wav': 'wav'}
+
+
+def summarize_voice(voice: dict) -> dict:
+    """Keep the fields of an ElevenLabs voice object the picker uses."""
+    return {
+        'voice_id': voice['voice_id'],
+        'name': voice.get('name') or voice['voice_id'],
+        'category': voice.get('category'),
+        'labels': voice.get('labels') or {},
+        'description': voice.get('description'),
+        'preview_url': voice.get('preview_url'),
+    }
+
+
+class VoiceCatalog:
+    """Caches the ElevenLabs voice list and one sample clip per voice.
+
+    Args:
+        cache_dir (str): Directory for catalog.json and the samples/ folder.
+        api_key (str): ElevenLabs API key.
+        base_url (str): ElevenLabs API base URL. Defaults to the public API.
+        ttl (float): Seconds the catalog is used without revalidating. Defaults
+            to the VOICE_CATALOG_TTL environment variable, or one hour.
+        synthesize (callable): Async synthesize(text, voice_id) returning WAV
+            (or MP3) bytes, used for voices without a preview_url.
+        sample_concurrency (int): Samples fetched at once while prefetching.
+    """
+
+    def __init__(self, cache_dir: str, api_key: str, base_url: str = None, ttl: float = None,
+                 synthesize: Callable[[str, str], Awaitable[bytes]] = None, sample_concurrency: int = 4):
+        self.cache_dir = cache_dir
+        self.samples_dir = os.path.join(cache_dir, 'samples')
+        self.catalog_path = os.path.join(cache_dir, 'catalog.json')
+        self.api_key = api_key
+        self.base_url = (base_url or ELEVENLABS_API_BASE).rstrip('/')
+        self.ttl = ttl if ttl is not None else float(os.getenv("VOICE_CATALOG_TTL", "3600"))
+        self.synthesize = synthesize
+        self.sample_concurrency = sample_concurrency
+        self._catalog = None
+        self._http = None
+        self._refresh_lock = None
+        self._sample_tasks = {}
+        os.makedirs(self.samples_dir, exist_ok=True)
+
+    def _client(self) -> AsyncHttpClient:
+        # Created on first use so it binds to the serving event loop
+        if self._http is None:
+            self._http = AsyncHttpClient()
+        return self._http
+
+    async def _read_cache(self) -> Optional[dict]:
+        try:
+            async with aiofiles.open(self.catalog_path, 'r', encoding='utf-8') as f:
+                return json.loads(await f.read())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    async def _write_cache(self, catalog: dict):
+        tmp_path = f"{self.catalog_path}.{os.getpid()}.tmp"
+        async with aiofiles.open(tmp_path, 'w', encoding='utf-8') as f:
+            await f.write(json.dumps(catalog))
+        await aiofiles.os.replace(tmp_path, self.catalog_path)
+
+    async def _revalidate(self, cached: Optional[dict]) -> dict:
+        headers = {'xi-api-key': self.api_key}
+        if cached and cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        response = await self._client().get(f"{self.base_url}/v1/voices", headers=headers)
+
+        if response.status_code == 304 and cached:
+            catalog = {**cached, 'fetched_at': time.time()}
+        elif response.status_code == 200:
+            voices = [summarize_voice(voice) for voice in response.json().get('voices', [])]
+            body = json.dumps(voices, sort_keys=True).encode()
+            catalog = {
+                'voices': voices,
+                'etag': response.headers.get('ETag'),
+                # Our own validator for /api/voices, stable while the list is unchanged
+                'version': hashlib.sha256(body).hexdigest()[:32],
+                'fetched_at': time.time(),
+            }
+        else:
+            raise RuntimeError(f"Voice list request failed with status {response.status_code}")
+        await self._write_cache(catalog)
+        return catalog
+
+    async def catalog(self, force: bool = False) -> dict:
+        """Return the catalog, revalidating it once it is older than the TTL.
+
+        Returns:
+            dict: voices, version (a validator for the list), fetched_at and
+                stale (True when the cached copy is served because refreshing failed).
+
+        Raises:
+            RuntimeError: If there is no cached copy and the list cannot be fetched.
+        """
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            cached = self._catalog or await self._read_cache()
+            if cached and not force and time.time() - cached['fetched_at'] < self.ttl:
+                self._catalog = cached
+                return {**cached, 'stale': False}
+            try:
+                self._catalog = await self._revalidate(cached)
+                return {**self._catalog, 'stale': False}
+            except Exception as e:
+                if not cached:
+                    raise RuntimeError(f"Could not load the ElevenLabs voice list: {e}")
+                logger.warning(f"Serving cached voice list, refresh failed: {e}")
+                self._catalog = cached
+                return {**cached, 'stale': True}
+
+    async def voices(self) -> List[dict]:
+        """The cached voice list."""
+        return (await self.catalog())['voices']
+
+    def _sample_key(self, voice: dict) -> str:
+        # A changed preview (or sample text) gets a new file instead of a stale clip
+        source = voice.get('preview_url') or SAMPLE_TEXT
+        return f"{voice['voice_id']}_{hashlib.sha256(source.encode()).hexdigest()[:16]}"
+
+    def cached_sample(self, voice: dict) -> Optional[str]:
+        """Path of the voice's sample clip if it is already cached."""
+        key = self._sample_key(voice)
+        for extension in ('mp3', 'wav'):
+            path = os.path.join(self.samples_dir, f"{key}.{extension}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    async def _fetch_sample(self, voice: dict) -> str:
+        if voice.get('preview_url'):
+            response = await self._client().get(voice['preview_url'])
+            if response.status_code != 200:
+                raise RuntimeError(f"Preview download failed with status {response.status_code}")
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+            audio, extension = response.content, SAMPLE_EXTENSIONS.get(content_type, 'mp3')
+        elif self.synthesize is not None:
+            audio = await self.synthesize(SAMPLE_TEXT, voice['voice_id'])
+            extension = 'wav' if audio[:4] == b'RIFF' else 'mp3'
+        else:
+            raise RuntimeError(f"Voice {voice['voice_id']} has no preview and no synthesizer is configured")
+
+        path = os.path.join(self.samples_dir, f"{self._sample_key(voice)}.{extension}")
+        async with aiofiles.open(f"{path}.tmp", 'wb') as f:
+            await f.write(audio)
+        await aiofiles.os.replace(f"{path}.tmp", path)
+        return path
+
+    async def sample(self, voice_id: str) -> str:
+        """Return the path of a voice's sample clip, fetching it on first request.
+
+        Raises:
+            KeyError: If the voice is not in the catalog.
+            RuntimeError: If the sample cannot be fetched or synthesized.
+        """
+        if not VOICE_ID_PATTERN.match(voice_id):
+            raise KeyError(voice_id)
+        voice = next((voice for voice in await self.voices() if voice['voice_id'] == voice_id), None)
+        if voice is None:
+            raise KeyError(voice_id)
+        path = self.cached_sample(voice)
+        if path:
+            return path
+
+        # Concurrent auditions of the same voice share one download or synthesis
+        task = self._sample_tasks.get(voice_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch_sample(voice))
+            self._sample_tasks[voice_id] = task
+            task.add_done_callback(lambda _: self._sample_tasks.pop(voice_id, None))
+        return await asyncio.shield(task)
+
+    async def prefetch_samples(self, limit: int = None) -> int:
+        """Cache a sample for every voice (or the first limit voices) missing one.
+
+        Returns:
+            int: Number of samples fetched.
+        """
+        voices = await self.voices()
+        missing = [voice for voice in voices[:limit] if not self.cached_sample(voice)]
+        semaphore = asyncio.Semaphore(self.sample_concurrency)
+
+        async def fetch(voice):
+            async with semaphore:
+                try:
+                    await self.sample(voice['voice_id'])
+                    return True
+                except Exception as e:
+                    logger.warning(f"Could not cache sample for voice {voice['voice_id']}: {e}")
+                    return False
+
+        fetched = sum(await asyncio.gather(*(fetch(voice) for voice in missing)))
+        logger.info(f"Cached {fetched} of {len(missing)} missing voice samples")
+        return fetched
@@ -0,0 +1,167 @@
+"""One long-lived background event loop per process.
+
+Streamlit runs each page script on its own thread and re-runs it on every
+interaction, so calling asyncio.run() from a button handler creates (and tears
+down) a fresh event loop per click and blocks the script thread until the
+coroutine finishes. Pages instead hand coroutines to the shared runtime and
+get a concurrent.futures.Future back immediately; progress is polled from the
+page (e.g. in an st.fragment with run_every) while the user keeps working.
+
+Because every render runs on the same loop, async SDK clients created lazily
+inside those coroutines (fal, OpenAI, httpx pools) are bound to that loop once
+and shared by all of them, instead of being rebuilt per asyncio.run().
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import itertools
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List
+
+
+async def _in_context(coro, context: contextvars.Context):
+    # The task gets a copy of the loop thread's context; give it the caller's values instead
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+@dataclass
+class BackgroundJob:
+    """A coroutine running on the shared loop, with progress messages for polling.
+
+    Attributes:
+        id (int): Process-unique job number.
+        label (str): Short description shown to the user.
+        future (concurrent.futures.Future): Resolves with the coroutine's result.
+        progress (List[str]): Progress messages, oldest first.
+        started_at (float): time.time() when the job was submitted.
+    """
+    id: int
+    label: str
+    future: concurrent.futures.Future = None
+    progress: List[str] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+
+    def report(self, message: str):
+        """Record a progress message; safe to call from any thread."""
+        self.progress.append(message)
+
+    @property
+    def status(self) -> str:
+        """"running", "done" or "failed"."""
+        if not self.future.done():
+            return "running"
+        return "failed" if self.future.cancelled() or self.future.exception() else "done"
+
+    @property
+    def last_progress(self) -> str:
+        return self.progress[-1] if self.progress else "Queued"
+
+
+class AsyncRuntime:
+    """Runs an asyncio event loop on a daemon thread, started on first use.
+
+    Args:
+        name (str): Name of the loop thread.
+    """
+
+    def __init__(self, name: str = "async-runtime"):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running background loop, starting its thread if necessary."""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def in_loop_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop without blocking.
+
+        The coroutine sees the caller's context variables (e.g. the active trace
+        span). Cancelling the returned future cancels the task.
+        """
+        context = contextvars.copy_context()
+        return asyncio.run_coroutine_threadsafe(_in_context(coro, context), self.loop)
+
+    def run(self, coro: Awaitable, timeout: float = None):
+        """Run a coroutine on the loop and wait for its result.
+
+        Raises:
+            RuntimeError: If called from the loop thread itself, which would deadlock.
+        """
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("AsyncRuntime.run() called from the runtime's own loop; await the coroutine instead")
+        return self.submit(coro).result(timeout)
+
+    def start_job(self, label: str, make_coro: Callable[[Callable[[str], None]], Awaitable]) -> BackgroundJob:
+        """Submit make_coro(report) as a BackgroundJob.
+
+        Args:
+            label (str): Short description of the job.
+            make_coro (callable): Called with the job's report callback; returns
+                the coroutine to run.
+
+        Returns:
+            BackgroundJob: The job, whose future and progress can be polled.
+        """
+        job = BackgroundJob(id=next(self._job_ids), label=label)
+        job.future = self.submit(make_coro(job.report))
+        return job
+
+    def close(self, timeout: float = 5.0):
+        """Cancel outstanding tasks and stop the loop thread."""
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+        if loop is None:
+            return
+
+        async def shutdown():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout)
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            loop.close()
+
+
+_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_async_runtime() -> AsyncRuntime:
+    """Return the process-wide background runtime."""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is None:
+            _runtime = AsyncRuntime()
+        return _runtime
@@ -0,0 +1,45 @@
+import threading
+
+
+class AdaptiveBatchSizer:
+    """Picks batch sizes by additive increase, multiplicative decrease (AIMD).
+
+    Each batch that finishes under the target latency, having used the full
+    current size, grows the size by a fixed step. A failed or slow batch cuts it
+    by a factor, so the size settles just below the point where the provider
+    slows down or starts to fail.
+
+    Args:
+        initial (int): Starting batch size.
+        minimum (int): Smallest batch size.
+        maximum (int): Largest batch size.
+        target_latency (float): Seconds a batch may take before the size is cut.
+        increase (int): Items added after a good batch.
+        decrease (float): Factor applied after a slow or failed batch.
+    """
+
+    def __init__(self, initial: int = 8, minimum: int = 1, maximum: int = 64, target_latency: float = 3.0,
+                 increase: int = 4, decrease: float = 0.5):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self._size = max(minimum, min(maximum, initial))
+        self._lock = threading.Lock()
+        self.history = []
+
+    @property
+    def size(self) -> int:
+        with self._lock:
+            return self._size
+
+    def record(self, batch_size: int, seconds: float, ok: bool = True) -> int:
+        """Feed back one batch's outcome; returns the new size."""
+        with self._lock:
+            if not ok or seconds > self.target_latency:
+                self._size = max(self.minimum, int(self._size * self.decrease))
+            elif batch_size >= self._size:
+                self._size = min(self.maximum, self._size + self.increase)
+            self.history.append(self._size)
+            return self._size
@@ -0,0 +1,309 @@
+"""Shared outbound HTTP transport for tools that call Meta, Telegram and friends.
+
+Both clients keep per-host keep-alive pools, apply default timeouts, retry
+transient failures with jittered exponential backoff and throttle a host
+when its rate-limit headers say we're close to being cut off.
+
+Requests that may not be safely repeated (POST, PATCH) are only retried when
+the server cannot have acted on them: the connection was never established,
+or the server answered 429 or asked us to come back via Retry-After. A read
+timeout or a 5xx on a POST may mean the message was already sent.
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from utils.metrics import MetricsRegistry
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"}
+
+# Meta usage headers; values are percentages of the rate-limit budget.
+META_USAGE_HEADERS = ("X-Business-Use-Case-Usage", "X-Ad-Account-Usage", "X-App-Usage")
+
+
+def parse_meta_usage(headers, threshold: float = 90.0, max_pause: float = 60.0) -> float:
+    """Return how long to pause a host based on Meta's usage headers, in seconds.
+
+    Honours estimated_time_to_regain_access (minutes) when Meta reports it and
+    otherwise pauses proportionally once any usage figure crosses threshold.
+    """
+    pause = 0.0
+    for header in META_USAGE_HEADERS:
+        raw = headers.get(header)
+        if not raw:
+            continue
+        try:
+            usage = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+
+        if header == "X-Business-Use-Case-Usage":
+            entries = [entry for values in usage.values() if isinstance(values, list) for entry in values]
+        else:
+            entries = [usage]
+
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            regain_minutes = entry.get("estimated_time_to_regain_access") or 0
+            if regain_minutes:
+                pause = max(pause, float(regain_minutes) * 60)
+            peak = max(
+                (float(entry.get(key) or 0) for key in ("call_count", "total_cputime", "total_time", "acc_id_util_pct")),
+                default=0.0
+            )
+            if peak >= threshold:
+                pause = max(pause, max_pause * min(1.0, (peak - threshold + 1) / (100 - threshold + 1)))
+    return pause
+
+
+def parse_retry_after(headers, body=None) -> float:
+    """Return the server-requested retry delay in seconds, or 0.
+
+    Reads the Retry-After header and Telegram's parameters.retry_after field.
+    """
+    delay = 0.0
+    raw = headers.get("Retry-After")
+    if raw:
+        try:
+            delay = float(raw)
+        except ValueError:
+            pass
+    if isinstance(body, dict):
+        retry_after = (body.get("parameters") or {}).get("retry_after")
+        if retry_after:
+            delay = max(delay, float(retry_after))
+    return delay
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff for the given (0-based) attempt."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class _HostThrottle:
+    """Tracks per-host "don't call before" deadlines."""
+
+    def __init__(self):
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+    def block(self, host: str, seconds: float):
+        if seconds <= 0:
+            return
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._blocked_until[host] = max(until, self._blocked_until.get(host, 0.0))
+
+    def wait_time(self, host: str) -> float:
+        with self._lock:
+            return max(0.0, self._blocked_until.get(host, 0.0) - time.monotonic())
+
+
+class _TransportBase:
+    def __init__(self, timeout: float = None, connect_timeout: float = None, max_retries: int = None,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0, pool_maxsize: int = 10,
+                 usage_threshold: float = 90.0, max_throttle: float = 300.0):
+        self.timeout = timeout if timeout is not None else float(os.getenv("HTTP_TIMEOUT", "30"))
+        self.connect_timeout = connect_timeout if connect_timeout is not None else float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("HTTP_MAX_RETRIES", "3"))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_maxsize = pool_maxsize
+        self.usage_threshold = usage_threshold
+        self.max_throttle = max_throttle
+        self.throttle = _HostThrottle()
+        self.metrics = MetricsRegistry()
+
+    def host_metrics(self) -> dict:
+        """Return latency/error summaries keyed by host."""
+        return self.metrics.snapshot()
+
+    def _should_retry(self, method: str, status: int, retry_after: float, attempt: int) -> bool:
+        if attempt >= self.max_retries or status not in RETRY_STATUSES:
+            return False
+        if method.upper() in IDEMPOTENT_METHODS:
+            return True
+        # The server refused the request outright, so sending it again can't duplicate it
+        return status == 429 or retry_after > 0
+
+    def _should_retry_error(self, method: str, connect_error: bool, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return connect_error or method.upper() in IDEMPOTENT_METHODS
+
+    def _after_response(self, host: str, status: int, headers, body) -> float:
+        """Update host throttling from a response and return the server-requested delay."""
+        self.throttle.block(host, min(self.max_throttle, parse_meta_usage(headers, self.usage_threshold)))
+        retry_after = parse_retry_after(headers, body) if status in RETRY_STATUSES else 0.0
+        self.throttle.block(host, min(self.max_throttle, retry_after))
+        return retry_after
+
+    @staticmethod
+    def _rewind_files(files):
+        for value in (files or {}).values():
+            file_obj = value[1] if isinstance(value, tuple) else value
+            if hasattr(file_obj, "seek"):
+                file_obj.seek(0)
+
+
+def _is_connect_error(error: requests.RequestException) -> bool:
+    """Whether a requests error happened before the request reached the server."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    # Refused connections and DNS failures arrive wrapped in a MaxRetryError
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.ConnectTimeoutError)
+
+
+def _json_or_none(content_type: str, parse):
+    if "json" not in (content_type or ""):
+        return None
+    try:
+        return parse()
+    except ValueError:
+        return None
+
+
+class HttpClient(_TransportBase):
+    """Synchronous pooled client built on a shared requests.Session."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request, retrying transient failures and honouring rate limits."""
+        host = urlsplit(url).netloc
+        kwargs.setdefault("timeout", (self.connect_timeout, self.timeout))
+        histogram = self.metrics.histogram(host)
+
+        attempt = 0
+        while True:
+            wait = self.throttle.wait_time(host)
+            if wait:
+                time.sleep(wait)
+            self._rewind_files(kwargs.get("files"))
+
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                histogram.record(time.perf_counter() - start, error=True)
+                if not self._should_retry_error(method, _is_connect_error(e), attempt):
+                    raise
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                attempt += 1
+                continue
+
+            histogram.record(time.perf_counter() - start, error=response.status_code >= 400)
+            body = _json_or_none(response.headers.get("Content-Type"), response.json)
+            retry_after = self._after_response(host, response.status_code, response.headers, body)
+            if not self._should_retry(method, response.status_code, retry_after, attempt):
+                return response
+            # Hand a streamed response's connection back to the pool before trying again
+            response.close()
+            time.sleep(max(retry_after, backoff_delay(attempt, self.backoff_base, self.backoff_max)))
+            attempt += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def download(self, url: str, file_path: str, chunk_size: int = 1024 * 1024) -> str:
+        """Stream a remote file to disk and return its path."""
+        response = self.request("GET", url, stream=True)
+        response.raise_for_status()
+        with open(file_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+        return file_path
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncHttpClient(_TransportBase):
+    """Asynchronous pooled client built on httpx.AsyncClient.
+
+    An instance is bound to the event loop it is first used on.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        import httpx
+
+        self._httpx = httpx
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_maxsize * 4),
+        )
+
+    async def request(self, method: str, url: str, **kwargs):
+        """Send a request, retrying transient failures and honouring rate limits."""
+        host = urlsplit(url).netloc
+        histogram = self.metrics.histogram(host)
+
+        attempt = 0
+        while True:
+            wait = self.throttle.wait_time(host)
+            if wait:
+                await asyncio.sleep(wait)
+            self._rewind_files(kwargs.get("files"))
+
+            start = time.perf_counter()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except (self._httpx.TransportError, self._httpx.TimeoutException) as e:
+                histogram.record(time.perf_counter() - start, error=True)
+                connect_error = isinstance(e, (self._httpx.ConnectError, self._httpx.ConnectTimeout, self._httpx.PoolTimeout))
+                if not self._should_retry_error(method, connect_error, attempt):
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+                attempt += 1
+                continue
+
+            histogram.record(time.perf_counter() - start, error=response.status_code >= 400)
+            body = _json_or_none(response.headers.get("Content-Type"), response.json)
+            retry_after = self._after_response(host, response.status_code, response.headers, body)
+            if not self._should_retry(method, response.status_code, retry_after, attempt):
+                return response
+            await response.aclose()
+            await asyncio.sleep(max(retry_after, backoff_delay(attempt, self.backoff_base, self.backoff_max)))
+            attempt += 1
+
+    async def get(self, url: str, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Return the process-wide synchronous client."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient()
+        return _http_client
@@ -1,24 +1,219 @@
+import atexit
+import fcntl
+import glob
+import gzip
 import json
+import mmap
 import os
+import queue
+import shutil
+import threading
+import time
 from datetime import datetime
 
+_STOP = object()
+
+
 class PromptLogger:
-    def __init__(self, log_file_path):
+    """Buffered JSON Lines interaction logger.
+
+    log_interaction() only enqueues the entry; a background writer thread
+    serialises batches, appends them under an exclusive file lock (so several
+    processes can share one log), fsyncs at most every fsync_interval seconds
+    and rotates the file by size or age into gzip archives.
+    """
+
+    def __init__(self, log_file_path, max_bytes: int = 10 * 1024 * 1024, rotate_interval: float = 24 * 3600,
+                 backup_count: int = 5, fsync_interval: float = 1.0, batch_size: int = 256):
         self.log_file_path = log_file_path
-        
-    def log_interaction(self, origin: str, content: dict | str):
-        """Log an interaction with timestamp by appending to the file"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.fsync_interval = fsync_interval
+        self.batch_size = batch_size
+
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._opened_at = 0.0
+        self._last_fsync = 0.0
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="prompt-logger", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def log_interaction(self, origin: str, content: dict | str, session_id: str = None):
+        """Queue an interaction with timestamp; serialisation and I/O happen off-thread.
+
+        content must not be mutated after it has been logged.
+        """
         log_entry = {
-            "timestamp": timestamp,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "origin": origin,
             "content": content
         }
-        
-        # Convert to pretty JSON string
-        log_str = json.dumps(log_entry, indent=2)
-        
-        # Append to file
-        with open(self.log_file_path, 'a', encoding='utf-8') as f:
-            f.write(log_str + "\n")  # Add newline between entries
\ No newline at end of file
+        if session_id is not None:
+            log_entry["session_id"] = session_id
+        self._queue.put(log_entry)
+
+    def flush(self, timeout: float = 5.0):
+        """Block until everything queued so far has been written and fsynced."""
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """Flush pending entries and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join(timeout=5.0)
+
+    def _open(self):
+        directory = os.path.dirname(self.log_file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.log_file_path, "ab")
+        self._opened_at = time.time()
+
+    def _needs_reopen(self) -> bool:
+        # Another process may have rotated the file underneath us
+        try:
+            return os.stat(self.log_file_path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _rotate(self):
+        # Rename while still holding the lock so other processes reopen a fresh file
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        rotated = f"{self.log_file_path}.{stamp}-{os.getpid()}"
+        os.rename(self.log_file_path, rotated)
+        self._file.close()
+        self._file = None
+        with open(rotated, "rb") as src, gzip.open(f"{rotated}.gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+
+        archives = sorted(glob.glob(f"{glob.escape(self.log_file_path)}.*.gz"))
+        for old in archives[:-self.backup_count] if self.backup_count else archives:
+            os.remove(old)
+        self._open()
+
+    def _write_batch(self, lines: list, force_fsync: bool):
+        if self._file is None:
+            self._open()
+
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            if self._needs_reopen():
+                self._file.close()
+                self._open()
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            if lines:
+                self._file.write(b"".join(lines))
+                self._file.flush()
+            now = time.time()
+            if force_fsync or now - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._file.fileno())
+                self._last_fsync = now
+            if self._file.tell() >= self.max_bytes or now - self._opened_at >= self.rotate_interval:
+                self._rotate()
+        finally:
+            if self._file is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def _discard_file(self):
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+        except Exception:
+            pass
+        self._file = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                continue
+
+            lines, waiters = [], []
+            while True:
+                if item is _STOP:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    try:
+                        lines.append((json.dumps(item, default=str) + "\n").encode("utf-8"))
+                    except Exception as e:
+                        # e.g. a circular reference; drop the entry, not the logger
+                        print(f"PromptLogger could not serialize an entry: {e}")
+                if stopping or len(lines) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            try:
+                self._write_batch(lines, force_fsync=bool(waiters) or stopping)
+            except Exception as e:
+                # Keep the writer alive; the next batch reopens the file
+                print(f"PromptLogger write failed: {e}")
+                self._discard_file()
+            finally:
+                for waiter in waiters:
+                    waiter.set()
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_log(log_file_path, session_id: str = None, origin: str = None):
+    """Yield logged entries in order, optionally filtered by session or origin.
+
+    Plain logs are memory-mapped rather than read into memory; rotated .gz
+    archives are streamed. Lines that aren't valid JSON are skipped.
+    """
+    def matches(entry):
+        return ((session_id is None or entry.get("session_id") == session_id)
+                and (origin is None or entry.get("origin") == origin))
+
+    def parse(line):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    if log_file_path.endswith(".gz"):
+        with gzip.open(log_file_path, "rb") as f:
+            for line in f:
+                entry = parse(line)
+                if isinstance(entry, dict) and matches(entry):
+                    yield entry
+        return
+
+    with open(log_file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            while start < len(mapped):
+                end = mapped.find(b"\n", start)
+                if end == -1:
+                    end = len(mapped)
+                entry = parse(mapped[start:end])
+                if isinstance(entry, dict) and matches(entry):
+                    yield entry
+                start = end + 1
+
+
+def replay_session(log_file_path, session_id: str):
+    """Return every entry of a session across rotated archives and the live log."""
+    archives = sorted(glob.glob(f"{glob.escape(log_file_path)}.*.gz"))
+    paths = archives + ([log_file_path] if os.path.exists(log_file_path) else [])
+    return [entry for path in paths for entry in read_log(path, session_id=session_id)]
@@ -0,0 +1,57 @@
+import asyncio
+import time
+
+from utils.metrics import LatencyHistogram
+
+
+class LoopLagMonitor:
+    """Measures how late an event loop wakes up a periodic sleeper.
+
+    Any lag well above zero means something ran on the loop without yielding
+    (a blocking SDK call, synchronous file I/O, ...). max_lag is the worst
+    stall seen since start().
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.histogram = LatencyHistogram(max_samples=10000)
+        self.max_lag = 0.0
+        self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - start - self.interval)
+            self.histogram.record(lag)
+            self.max_lag = max(self.max_lag, lag)
+
+    def start(self):
+        """Start sampling on the running loop."""
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def summary(self) -> dict:
+        stats = self.histogram.summary()
+        return {
+            "samples": stats["count"],
+            "p50_ms": stats["p50_ms"],
+            "p95_ms": stats["p95_ms"],
+            "p99_ms": stats["p99_ms"],
+            "max_ms": self.max_lag * 1000,
+        }
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
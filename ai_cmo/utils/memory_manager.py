@@ -0,0 +1,199 @@
+"""Per-session conversation memory with a fixed-size context.
+
+Each session keeps its recent turns verbatim, a rolling summary of everything
+older and a small slot store of key facts (ad account, date range, last video
+URL, ...) pulled out of every turn. context_messages()/context_text() return
+the slots, the summary and as many recent turns as fit the token budget, so
+prompts stay the same size however long the conversation runs.
+
+Once the unsummarized turns outgrow the budget, the oldest are folded into the
+summary on a background thread; the request path only appends and reads. If
+the summarizer fails the turns are folded in extractively instead, so memory
+stays bounded either way.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Key facts pinned per session: slot name -> pattern whose first group is the value
+SLOT_PATTERNS = {
+    "account_id": re.compile(r'\b(act_\d+)\b|\bad account(?: id)?[:\s#]+(\d{6,})\b', re.IGNORECASE),
+    "date_range": re.compile(
+        r'\b(\d{4}-\d{2}-\d{2}\s*(?:-|to|–)\s*\d{4}-\d{2}-\d{2}'
+        r'|(?:last|past) \d+ days|last (?:week|month|quarter|year)|Q[1-4](?: \d{4})?)\b',
+        re.IGNORECASE
+    ),
+    "video_url": re.compile(r'(https?://[^\s"\'<>]+?\.(?:mp4|mov|webm)(?:\?[^\s"\'<>]*)?)', re.IGNORECASE),
+    "upload_id": re.compile(r'\bupload[_ ]id["\']?\s*[:=]\s*["\']?([\w-]+)', re.IGNORECASE),
+}
+# Longest single turn kept verbatim; longer turns are cut (after slot extraction)
+MAX_TURN_TOKENS = 400
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return max(1, len(text) // 4)
+
+
+def truncate_tokens(text: str, tokens: int, keep: str = "head") -> str:
+    """Cut text to roughly tokens tokens, keeping its start ("head") or end ("tail")."""
+    limit = tokens * 4
+    if len(text) <= limit:
+        return text
+    return text[:limit - 1] + "…" if keep == "head" else "…" + text[-(limit - 1):]
+
+
+def extract_slots(text: str) -> Dict[str, str]:
+    """Return the key facts mentioned in text; the last mention of each wins."""
+    slots = {}
+    for name, pattern in SLOT_PATTERNS.items():
+        for match in pattern.finditer(text):
+            slots[name] = next(group for group in match.groups() if group)
+    return slots
+
+
+def fallback_summary(summary: str, turns: List[dict], tokens: int) -> str:
+    """Fold turns into the summary without a model: one clipped line per turn."""
+    lines = [summary] if summary else []
+    lines += [f"{turn['role']}: {truncate_tokens(turn['content'], 40)}" for turn in turns]
+    return truncate_tokens("\n".join(lines), tokens, keep="tail")
+
+
+class _Session:
+    def __init__(self):
+        self.turns = []
+        self.summary = ""
+        self.slots = {}
+        self.compacting = False
+
+
+class MemoryManager:
+    """Keeps bounded per-session history for the agents.
+
+    Args:
+        summarize (callable): summarize(summary, turns) -> str, folding turns
+            (dicts with role and content) into the previous summary. Without
+            one, turns are folded in extractively.
+        budget_tokens (int): Size of the context returned per session. Defaults
+            to the MEMORY_BUDGET_TOKENS environment variable, or 1500.
+        summary_tokens (int): Part of the budget reserved for the summary.
+        max_sessions (int): Sessions kept; the least recently used is dropped.
+    """
+
+    def __init__(self, summarize: Callable[[str, List[dict]], str] = None, budget_tokens: int = None,
+                 summary_tokens: int = 300, max_sessions: int = 1000):
+        self.summarize = summarize
+        self.budget_tokens = budget_tokens or int(os.getenv("MEMORY_BUDGET_TOKENS", "1500"))
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory")
+
+    def _session(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session()
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _slots_text(self, session: _Session) -> str:
+        return "\n".join(f"- {name}: {value}" for name, value in session.slots.items())
+
+    def _recent_budget(self, session: _Session) -> int:
+        # Whatever the slots and summary leave over goes to verbatim turns
+        used = estimate_tokens(self._slots_text(session)) + min(estimate_tokens(session.summary), self.summary_tokens)
+        return max(self.budget_tokens - used, self.budget_tokens // 4)
+
+    def add_turn(self, session_id: str, role: str, content: str):
+        """Record a turn, pick up any key facts in it and compact in the background if needed."""
+        if not session_id or not content:
+            return
+        slots = extract_slots(content)
+        turn = {"role": role, "content": truncate_tokens(content, MAX_TURN_TOKENS)}
+        turn["tokens"] = estimate_tokens(turn["content"])
+        with self._lock:
+            session = self._session(session_id)
+            session.slots.update(slots)
+            session.turns.append(turn)
+            if session.compacting or sum(t["tokens"] for t in session.turns) <= self._recent_budget(session):
+                return
+            session.compacting = True
+        self.executor.submit(self._compact, session_id, session)
+
+    def set_slot(self, session_id: str, name: str, value: str):
+        """Pin a fact directly, e.g. the URL of a video that just finished."""
+        with self._lock:
+            self._session(session_id).slots[name] = value
+
+    def slots(self, session_id: str) -> Dict[str, str]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return dict(session.slots) if session else {}
+
+    def _compact(self, session_id: str, session: _Session):
+        try:
+            with self._lock:
+                # Fold the oldest turns until the rest fill half the recent budget
+                # (always keeping the newest turn verbatim)
+                keep_tokens = self._recent_budget(session) // 2
+                count, kept = len(session.turns) - 1, session.turns[-1]["tokens"]
+                while count > 0 and kept + session.turns[count - 1]["tokens"] <= keep_tokens:
+                    count -= 1
+                    kept += session.turns[count]["tokens"]
+                folded = session.turns[:count]
+                previous = session.summary
+            if not folded:
+                return
+            try:
+                summary = self.summarize(previous, folded) if self.summarize else None
+            except Exception as e:
+                print(f"Summarizing session {session_id} failed, folding turns in extractively: {e}")
+                summary = None
+            summary = summary or fallback_summary(previous, folded, self.summary_tokens)
+            with self._lock:
+                # Only appends happen meanwhile, so the folded turns are still at the front
+                del session.turns[:len(folded)]
+                session.summary = truncate_tokens(summary, self.summary_tokens, keep="tail")
+        finally:
+            with self._lock:
+                session.compacting = False
+
+    def _context(self, session_id: str):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return "", "", []
+            budget = self._recent_budget(session)
+            recent, used = [], 0
+            for turn in reversed(session.turns):
+                if used + turn["tokens"] > budget:
+                    break
+                recent.append({"role": turn["role"], "content": turn["content"]})
+                used += turn["tokens"]
+            return self._slots_text(session), truncate_tokens(session.summary, self.summary_tokens), recent[::-1]
+
+    def context_messages(self, session_id: Optional[str]) -> List[dict]:
+        """Chat messages for the session: a system note with facts and summary, then recent turns."""
+        if not session_id:
+            return []
+        slots, summary, recent = self._context(session_id)
+        notes = []
+        if slots:
+            notes.append(f"Known facts about this user's work:\n{slots}")
+        if summary:
+            notes.append(f"Summary of the earlier conversation:\n{summary}")
+        messages = [{"role": "system", "content": "\n\n".join(notes)}] if notes else []
+        return messages + recent
+
+    def context_text(self, session_id: Optional[str]) -> str:
+        """The same context as a single block of text, for prompts that take one user message."""
+        parts = []
+        for message in self.context_messages(session_id):
+            parts.append(message["content"] if message["role"] == "system" else f"{message['role']}: {message['content']}")
+        return "\n\n".join(parts)
@@ -0,0 +1,76 @@
+import threading
+from collections import deque
+
+
+def _percentile(sorted_samples: list, p: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, int(round(p / 100 * (len(sorted_samples) - 1)))))
+    return sorted_samples[index]
+
+
+class LatencyHistogram:
+    """Thread-safe latency recorder with percentile summaries.
+
+    Keeps the most recent max_samples observations for percentiles and
+    running totals for count and mean over the whole lifetime.
+    """
+
+    def __init__(self, max_samples: int = 2048):
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def record(self, seconds: float, error: bool = False):
+        """Record one observation, in seconds."""
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+            if error:
+                self.errors += 1
+
+    def percentile(self, p: float) -> float:
+        """Return the p-th percentile (0-100) of recent samples, in seconds."""
+        with self._lock:
+            samples = sorted(self._samples)
+        return _percentile(samples, p)
+
+    def summary(self) -> dict:
+        """Return count, error count and latency percentiles in milliseconds."""
+        with self._lock:
+            samples = sorted(self._samples)
+            count, errors, total = self.count, self.errors, self.total
+
+        return {
+            "count": count,
+            "errors": errors,
+            "mean_ms": (total / count * 1000) if count else 0.0,
+            "p50_ms": _percentile(samples, 50) * 1000,
+            "p95_ms": _percentile(samples, 95) * 1000,
+            "p99_ms": _percentile(samples, 99) * 1000,
+            "max_ms": samples[-1] * 1000 if samples else 0.0,
+        }
+
+
+class MetricsRegistry:
+    """Named collection of latency histograms."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> LatencyHistogram:
+        """Return the histogram for name, creating it on first use."""
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = LatencyHistogram()
+            return self._histograms[name]
+
+    def snapshot(self) -> dict:
+        """Return summaries for every histogram, keyed by name."""
+        with self._lock:
+            items = list(self._histograms.items())
+        return {name: histogram.summary() for name, histogram in items}
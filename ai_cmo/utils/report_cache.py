@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+# Section headings requested from the report model, in order.
+REPORT_SECTIONS = [
+    "Executive Summary",
+    "Campaign Performance Overview",
+    "Key Metrics Analysis",
+    "Week-over-Week Performance",
+    "Areas for Optimization",
+    "Recommendations",
+]
+
+# Sections that depend on the most recent period and are regenerated when only
+# that period changes.
+PERIOD_SENSITIVE_SECTIONS = ["Week-over-Week Performance", "Recommendations"]
+
+PERIOD_START_KEYS = ("Reporting starts", "date_start")
+
+
+def data_hash(data) -> str:
+    """Return a stable SHA-256 hash of JSON-serialisable campaign data."""
+    encoded = json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def report_fingerprint(account_id, start_date, end_date, data) -> str:
+    """Fingerprint a report request by account, date window and data hash."""
+    key = f"{account_id}|{start_date}|{end_date}|{data_hash(data)}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def split_latest_period(data):
+    """Split per-period rows into (latest_rows, earlier_rows).
+
+    All rows that start on the latest date (e.g. one per campaign) belong to the
+    latest period. Returns (None, data) when the data isn't a list of period
+    rows or covers fewer than two distinct periods, since there is then no
+    earlier report to build on.
+    """
+    if not isinstance(data, list) or not data or not all(isinstance(row, dict) for row in data):
+        return None, data
+
+    def period_start(row):
+        for key in PERIOD_START_KEYS:
+            if key in row:
+                return str(row[key])
+        return None
+
+    starts = [period_start(row) for row in data]
+    if any(start is None for start in starts) or len(set(starts)) < 2:
+        return None, data
+
+    latest_start = max(starts)
+    latest = [row for row, start in zip(data, starts) if start == latest_start]
+    earlier = [row for row, start in zip(data, starts) if start != latest_start]
+    return latest, earlier
+
+
+def split_sections(report: str, titles: list = REPORT_SECTIONS) -> dict:
+    """Split a report into its numbered sections.
+
+    Returns an ordered mapping of section title to section text (heading
+    included), or an empty dict if any of the given titles is missing.
+    """
+    positions = []
+    for title in titles:
+        pattern = re.compile(rf"^[#*\s]*(\d+\.\s*)?\**{re.escape(title)}\b.*$", re.IGNORECASE | re.MULTILINE)
+        match = pattern.search(report)
+        if not match:
+            return {}
+        positions.append((match.start(), title))
+
+    positions.sort()
+    if [title for _, title in positions] != list(titles):
+        return {}
+
+    sections = {}
+    for i, (start, title) in enumerate(positions):
+        end = positions[i + 1][0] if i + 1 < len(positions) else len(report)
+        sections[title] = report[start:end].strip()
+    return sections
+
+
+def join_sections(sections: dict) -> str:
+    """Reassemble a report from its sections in canonical order."""
+    return "\n\n".join(sections[title] for title in REPORT_SECTIONS if title in sections)
+
+
+class ReportCache:
+    """Persists generated reports keyed by their data fingerprint.
+
+    Each entry also records a fingerprint of the data excluding the latest
+    period (base_fingerprint) and of all of its periods (data_fingerprint), so
+    a request whose earlier periods match a previous report - either because
+    the latest period was refreshed or because a new one was appended - can
+    reuse that report's sections.
+    """
+
+    def __init__(self, cache_path: str, max_entries: int = 50):
+        self.cache_path = cache_path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def _save(self):
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def get(self, fingerprint: str):
+        """Return the cached entry for an exact fingerprint, if any."""
+        with self._lock:
+            return self._entries.get(fingerprint)
+
+    def find_previous(self, account_id, base_fingerprint: str):
+        """Return the newest entry for the account built on the same earlier periods."""
+        with self._lock:
+            candidates = [
+                entry for entry in self._entries.values()
+                if entry.get("account_id") == account_id
+                and base_fingerprint in (entry.get("base_fingerprint"), entry.get("data_fingerprint"))
+            ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda entry: entry.get("created_at", ""))
+
+    def put(self, fingerprint: str, account_id, base_fingerprint: str, data_fingerprint: str, report: str):
+        """Store a report and evict the oldest entries beyond max_entries."""
+        with self._lock:
+            self._entries[fingerprint] = {
+                "account_id": account_id,
+                "base_fingerprint": base_fingerprint,
+                "data_fingerprint": data_fingerprint,
+                "report": report,
+                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            if len(self._entries) > self.max_entries:
+                ordered = sorted(self._entries.items(), key=lambda item: item[1].get("created_at", ""))
+                for key, _ in ordered[:len(self._entries) - self.max_entries]:
+                    del self._entries[key]
+            self._save()
@@ -0,0 +1,139 @@
+"""In-process pub/sub for background results, keyed by session ID.
+
+BigMind jobs finish on worker threads long after the page that started them
+has rendered. They publish their results here under the originating session
+ID; Streamlit pages poll events() (e.g. from an st.fragment) and the voice
+agent subscribes with a callback, so results reach the user as they land
+instead of on their next "is it done?" turn. Each session keeps its recent
+events, so a subscriber that arrives late (or a page after a rerun) replays
+what it missed by passing the last sequence number it saw.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List
+
+
+@dataclass
+class ResultEvent:
+    """One published result.
+
+    Attributes:
+        seq (int): Position in the session's stream, starting at 1.
+        session_id (str): Session the result belongs to.
+        kind (str): Event type, e.g. "started", "result" or "error".
+        payload (Dict[str, Any]): Event data.
+        created_at (float): time.time() when it was published.
+    """
+    seq: int
+    session_id: str
+    kind: str
+    payload: Dict[str, Any] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+
+
+class _Session:
+    def __init__(self, history_size: int):
+        self.events = deque(maxlen=history_size)
+        self.seq = itertools.count(1)
+        self.subscribers = {}
+        self.touched = time.monotonic()
+
+
+class ResultBus:
+    """Publishes results to per-session subscribers and keeps them for replay.
+
+    Args:
+        history_size (int): Events kept per session for replay.
+        session_ttl (float): Seconds after its last event or subscription
+            change before an idle session without subscribers is dropped.
+    """
+
+    def __init__(self, history_size: int = 100, session_ttl: float = 3600):
+        self.history_size = history_size
+        self.session_ttl = session_ttl
+        self._sessions = {}
+        self._subscriber_ids = itertools.count(1)
+        # Reentrant so a subscriber callback may publish follow-up events
+        self._lock = threading.RLock()
+
+    def _session(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session(self.history_size)
+        session.touched = time.monotonic()
+        return session
+
+    def _prune(self):
+        cutoff = time.monotonic() - self.session_ttl
+        for session_id in [sid for sid, s in self._sessions.items() if s.touched < cutoff and not s.subscribers]:
+            del self._sessions[session_id]
+
+    def publish(self, session_id: str, kind: str, payload: Dict[str, Any] = None) -> ResultEvent:
+        """Store an event and deliver it to the session's subscribers.
+
+        Callbacks run on the publishing thread, in order, and must not block;
+        a failing callback does not stop delivery to the others.
+        """
+        with self._lock:
+            self._prune()
+            session = self._session(session_id)
+            event = ResultEvent(next(session.seq), session_id, kind, payload or {})
+            session.events.append(event)
+            for callback in list(session.subscribers.values()):
+                try:
+                    callback(event)
+                except Exception as e:
+                    print(f"Result subscriber for session {session_id} failed: {e}")
+        return event
+
+    def events(self, session_id: str, after: int = 0) -> List[ResultEvent]:
+        """Return the session's retained events with seq greater than after."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            return [event for event in session.events if event.seq > after]
+
+    def subscribe(self, session_id: str, callback: Callable[[ResultEvent], None], after: int = None) -> Callable[[], None]:
+        """Call callback with each new event for the session.
+
+        Args:
+            session_id (str): Session to follow.
+            callback (callable): Receives each ResultEvent.
+            after (int): Replay retained events with seq greater than this
+                first. None skips the replay.
+
+        Returns:
+            callable: Unsubscribes when called.
+        """
+        with self._lock:
+            session = self._session(session_id)
+            if after is not None:
+                # Under the lock, so nothing published meanwhile is missed or reordered
+                for event in [event for event in session.events if event.seq > after]:
+                    callback(event)
+            subscriber_id = next(self._subscriber_ids)
+            session.subscribers[subscriber_id] = callback
+
+        def unsubscribe():
+            with self._lock:
+                session.subscribers.pop(subscriber_id, None)
+                session.touched = time.monotonic()
+
+        return unsubscribe
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_result_bus() -> ResultBus:
+    """Return the process-wide result bus."""
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = ResultBus()
+        return _bus
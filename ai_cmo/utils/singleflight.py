@@ -0,0 +1,225 @@
+"""Share one execution among concurrent identical calls.
+
+When several callers ask for the same work at once (two users fetching the
+same insight window, an impatient double click on "Generate Video"), the
+first caller runs it and the others wait for and receive its result. Within a
+process callers meet in an in-memory table. Across worker processes the one
+running a key holds an flock on a lock file under SINGLEFLIGHT_DIR and writes
+its result next to it; a process that was waiting on the lock picks that
+result up instead of running the work again. Results are pickled, so the
+directory must be private to the current user: it is created with mode 0700,
+and sharing across processes is turned off if it belongs to anyone else.
+
+Only overlapping calls share: a result written before a caller started
+waiting is never reused, so this is deduplication, not caching.
+"""
+import asyncio
+import concurrent.futures
+import dataclasses
+import fcntl
+import hashlib
+import json
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+_MISSING = object()
+# Result files older than this are deleted
+RESULT_MAX_AGE = 3600
+
+
+def make_key(name: str, parameters: Any) -> str:
+    """Stable key for a call: the name plus a hash of its normalized parameters."""
+    if dataclasses.is_dataclass(parameters):
+        parameters = dataclasses.asdict(parameters)
+    encoded = json.dumps(parameters, sort_keys=True, default=str).encode("utf-8")
+    return f"{name}:{hashlib.sha256(encoded).hexdigest()}"
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls that share a key.
+
+    Args:
+        directory (str): Where lock and result files live for cross-process
+            sharing. Defaults to the SINGLEFLIGHT_DIR environment variable, or
+            a per-user folder in the system temp directory.
+        cross_process (bool): Whether to coordinate with other processes too.
+    """
+
+    def __init__(self, directory: str = None, cross_process: bool = True):
+        self.directory = directory or os.getenv(
+            "SINGLEFLIGHT_DIR", os.path.join(tempfile.gettempdir(), f"ai_cmo_singleflight-{os.getuid()}")
+        )
+        self.cross_process = cross_process and self._secure_directory()
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+
+    def _secure_directory(self) -> bool:
+        """Make sure only the current user can write results others will unpickle."""
+        try:
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            info = os.lstat(self.directory)
+            if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+                print(f"{self.directory} is not a directory owned by this user; "
+                      "calls will only be shared within this process")
+                return False
+            if info.st_mode & 0o077:
+                os.chmod(self.directory, 0o700)
+        except OSError as e:
+            print(f"Cannot use {self.directory} to share calls across processes: {e}")
+            return False
+        return True
+
+    def _join(self, key: str):
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self._calls[key] = concurrent.futures.Future()
+            return future, True
+
+    def _finish(self, key: str, future: concurrent.futures.Future, result=_MISSING, error: BaseException = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _paths(self, key: str):
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.lock"), os.path.join(self.directory, f"{name}.result")
+
+    def _read_result(self, path: str, started: float):
+        try:
+            with open(path, "rb") as f:
+                finished_at, value = pickle.load(f)
+            # Written by a run that overlapped with this call, not an older one
+            return value if finished_at >= started else _MISSING
+        except FileNotFoundError:
+            return _MISSING
+        except Exception as e:
+            # A truncated or foreign file is not worth failing the call over; run the work instead
+            print(f"Ignoring unreadable shared result {os.path.basename(path)}: {e}")
+            return _MISSING
+
+    def _write_result(self, path: str, value):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump((time.time(), value), f)
+            os.replace(tmp_path, path)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            print(f"Result of {os.path.basename(path)} cannot be shared with other processes: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._prune()
+
+    def _prune(self):
+        cutoff = time.time() - RESULT_MAX_AGE
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".result") and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+        except OSError:
+            pass
+
+    def _check_shared(self, result_path: str, started: float):
+        value = self._read_result(result_path, started)
+        if value is not _MISSING:
+            with self._lock:
+                self.shared += 1
+        return value
+
+    def _executed(self):
+        with self._lock:
+            self.executions += 1
+
+    def do(self, key: str, fn: Callable[[], Any]):
+        """Run fn() unless an identical call is in flight; either way return its result.
+
+        If the shared execution raises, every caller waiting on it gets the error.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = self._run(key, fn)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def _run(self, key: str, fn: Callable[[], Any]):
+        if not self.cross_process:
+            self._executed()
+            return fn()
+        started = time.time()
+        lock_path, result_path = self._paths(key)
+        # Closing the file releases the lock, even if fn raises
+        with open(lock_path, "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            shared = self._check_shared(result_path, started)
+            if shared is not _MISSING:
+                return shared
+            self._executed()
+            result = fn()
+            self._write_result(result_path, result)
+            return result
+
+    async def do_async(self, key: str, make_coro: Callable[[], Awaitable]):
+        """Async do(): await make_coro() unless an identical call is in flight.
+
+        Callers may be on different event loops or threads.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await self._run_async(key, make_coro)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def _run_async(self, key: str, make_coro: Callable[[], Awaitable]):
+        if not self.cross_process:
+            self._executed()
+            return await make_coro()
+        started = time.time()
+        lock_path, result_path = self._paths(key)
+        lock_file = open(lock_path, "a+b")
+        try:
+            # Waiting for another process must not block the event loop
+            await asyncio.to_thread(fcntl.flock, lock_file, fcntl.LOCK_EX)
+            shared = self._check_shared(result_path, started)
+            if shared is not _MISSING:
+                return shared
+            self._executed()
+            result = await make_coro()
+            await asyncio.to_thread(self._write_result, result_path, result)
+            return result
+        finally:
+            lock_file.close()
+
+
+_singleflight = None
+_singleflight_lock = threading.Lock()
+
+
+def get_singleflight() -> SingleFlight:
+    """Return the process-wide SingleFlight."""
+    global _singleflight
+    with _singleflight_lock:
+        if _singleflight is None:
+            _singleflight = SingleFlight()
+        return _singleflight
@@ -0,0 +1,285 @@
+"""Lightweight span tracing with OpenTelemetry-compatible export.
+
+Spans are recorded with span()/traced(), nest through contextvars and feed
+per-stage latency histograms. When TRACE_FILE is set, finished spans are
+appended to it as OTLP/JSON lines (one ExportTraceServiceRequest per line,
+the format read by the OpenTelemetry Collector's otlpjsonfile receiver);
+when OTEL_EXPORTER_OTLP_ENDPOINT is set they are also POSTed to a collector.
+
+Summarise a trace file with:
+    python -m utils.tracing summarize trace.jsonl
+"""
+import argparse
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from utils.metrics import LatencyHistogram, MetricsRegistry
+
+SERVICE_NAME = "ai_cmo"
+
+# USD per 1M tokens: (input, output)
+MODEL_PRICES = {
+    "llama-3.1-8b-instant": (0.05, 0.08),
+    "claude-3-5-sonnet-latest": (3.00, 15.00),
+    "claude-3-5-haiku-latest": (0.80, 4.00),
+    "o3-mini-2025-01-31": (1.10, 4.40),
+    "gpt-4": (30.00, 60.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float:
+    """Return the USD cost of a call, or 0 for unknown models."""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def usage_from_response(response):
+    """Return (input_tokens, output_tokens) from an OpenAI/Groq or Anthropic response."""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return 0, 0
+    if hasattr(usage, "input_tokens"):
+        return usage.input_tokens or 0, usage.output_tokens or 0
+    return getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0
+
+
+class Span:
+    """A timed operation with attributes, linked to its parent by trace/span IDs."""
+
+    def __init__(self, name: str, parent=None, attributes: dict = None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.error = None
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def record_usage(self, model: str, input_tokens: int, output_tokens: int):
+        """Attach token counts and estimated cost for an LLM call."""
+        self.attributes["llm.model"] = model
+        self.attributes["llm.input_tokens"] = self.attributes.get("llm.input_tokens", 0) + input_tokens
+        self.attributes["llm.output_tokens"] = self.attributes.get("llm.output_tokens", 0) + output_tokens
+        self.attributes["llm.cost_usd"] = (
+            self.attributes.get("llm.cost_usd", 0.0) + estimate_cost(model, input_tokens, output_tokens)
+        )
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+
+    def to_otlp(self) -> dict:
+        def any_value(value):
+            if isinstance(value, bool):
+                return {"boolValue": value}
+            if isinstance(value, int):
+                return {"intValue": str(value)}
+            if isinstance(value, float):
+                return {"doubleValue": value}
+            return {"stringValue": str(value)}
+
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": any_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        return span
+
+
+class SpanExporter:
+    """Buffers finished spans and writes them as OTLP/JSON lines."""
+
+    def __init__(self, file_path: str = None, endpoint: str = None, flush_interval: float = 2.0, max_batch: int = 128):
+        self.file_path = file_path
+        self.endpoint = endpoint
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def export(self, span: Span):
+        with self._lock:
+            self._buffer.append(span.to_otlp())
+            if len(self._buffer) >= self.max_batch:
+                self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+        if not spans:
+            return
+        request = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": spans}],
+            }]
+        }
+        try:
+            if self.file_path:
+                with open(self.file_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(request) + "\n")
+            if self.endpoint:
+                from utils.http_client import get_http_client
+                get_http_client().post(f"{self.endpoint.rstrip('/')}/v1/traces", json=request)
+        except Exception as e:
+            print(f"Span export failed: {e}")
+
+
+class Tracer:
+    """Creates spans and keeps per-stage latency histograms."""
+
+    def __init__(self, exporter: SpanExporter = None):
+        self.exporter = exporter
+        self.metrics = MetricsRegistry()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Time a block as a child of the current span."""
+        span = Span(name, parent=_current_span.get(), attributes=attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.finish()
+            self.metrics.histogram(name).record(span.duration, error=span.error is not None)
+            if self.exporter:
+                self.exporter.export(span)
+
+    def traced(self, name: str = None):
+        """Decorator that wraps a sync or async function in a span."""
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(span_name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def histograms(self) -> dict:
+        """Return p50/p95/p99 latency summaries keyed by span name."""
+        return self.metrics.snapshot()
+
+
+def current_span():
+    """Return the active span, or None outside of any span."""
+    return _current_span.get()
+
+
+def record_llm_usage(model: str, response):
+    """Attach token usage and cost from an LLM response to the active span."""
+    span = _current_span.get()
+    if span is not None:
+        span.record_usage(model, *usage_from_response(response))
+
+
+tracer = Tracer(
+    SpanExporter(os.getenv("TRACE_FILE"), os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"))
+    if os.getenv("TRACE_FILE") or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") else None
+)
+span = tracer.span
+traced = tracer.traced
+
+
+def summarize_trace_file(path: str) -> dict:
+    """Aggregate an OTLP/JSON lines file into per-span latency, token and cost stats."""
+    histograms = defaultdict(LatencyHistogram)
+    tokens = defaultdict(lambda: {"input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0})
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            for resource_spans in request.get("resourceSpans", []):
+                for scope_spans in resource_spans.get("scopeSpans", []):
+                    for item in scope_spans.get("spans", []):
+                        name = item["name"]
+                        duration = (int(item["endTimeUnixNano"]) - int(item["startTimeUnixNano"])) / 1e9
+                        failed = item.get("status", {}).get("code") == 2
+                        histograms[name].record(duration, error=failed)
+                        for attribute in item.get("attributes", []):
+                            value = attribute["value"]
+                            number = float(value.get("intValue", value.get("doubleValue", 0)) or 0)
+                            if attribute["key"] == "llm.input_tokens":
+                                tokens[name]["input_tokens"] += int(number)
+                            elif attribute["key"] == "llm.output_tokens":
+                                tokens[name]["output_tokens"] += int(number)
+                            elif attribute["key"] == "llm.cost_usd":
+                                tokens[name]["cost_usd"] += number
+
+    return {name: {**histogram.summary(), **tokens[name]} for name, histogram in histograms.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trace tools for AI CMO.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summarize = subparsers.add_parser("summarize", help="Summarize a trace file.")
+    summarize.add_argument("trace_file")
+    summarize.add_argument("--json", action="store_true", help="Print machine-readable JSON.")
+    args = parser.parse_args(argv)
+
+    summary = summarize_trace_file(args.trace_file)
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    header = f"{'span':<40} {'count':>6} {'err':>4} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'tokens':>9} {'cost $':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, stats in sorted(summary.items(), key=lambda item: -item[1]["p95_ms"]):
+        total_tokens = stats["input_tokens"] + stats["output_tokens"]
+        print(f"{name:<40} {stats['count']:>6} {stats['errors']:>4} {stats['p50_ms']:>9.1f} "
+              f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {total_tokens:>9} {stats['cost_usd']:>9.4f}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+"""Local, memory-mapped vector index for retrieving past work.
+
+Chunks of generated reports, insight snapshots and creative metadata are
+embedded and appended to a directory on disk:
+
+    vectors.f32   float32 rows, L2-normalised, memory-mapped for search
+    records.jsonl one JSON record (text plus metadata) per row
+    lists.i32     IVF list of each row, once the index has been trained
+    ivf.npy       IVF centroids
+    info.json     dimension and training state
+
+Search is exact (one matrix-vector product over the memory map) until the
+index reaches ivf_threshold rows; it then trains an inverted-file index with
+spherical k-means and scans only the nprobe closest lists, which keeps
+queries in the low milliseconds at 100k+ chunks. Adds are incremental: rows
+are appended and, once trained, assigned to their nearest list.
+
+Several processes may share one index directory: writes hold an flock on
+its lock file and first reload whatever other writers appended, and searches
+pick up other writers' rows before scanning.
+
+Embeddings come from a pluggable callable taking a list of texts and returning
+an (n, dim) array; the default HashingEmbedder needs no model or network, so
+indexing and tests work offline.
+"""
+import contextlib
+import fcntl
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.'%][a-z0-9]+)*")
+
+
+def chunk_text(text: str, max_chars: int = 1000) -> List[str]:
+    """Split text at blank lines into chunks of at most about max_chars."""
+    chunks, current = [], ""
+    for paragraph in (p.strip() for p in text.split("\n\n")):
+        if not paragraph:
+            continue
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+        while len(current) > max_chars:
+            chunks.append(current[:max_chars])
+            current = current[max_chars:]
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class HashingEmbedder:
+    """Offline embedding by signed feature hashing of words and word pairs.
+
+    Args:
+        dim (int): Embedding dimension.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+
+    def __call__(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = TOKEN_PATTERN.findall(text.lower())
+            for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+                h = zlib.crc32(feature.encode())
+                vectors[row, h % self.dim] += -1.0 if h >> 31 else 1.0
+        return vectors
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Cluster unit vectors by cosine similarity; returns (k, dim) unit centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        empty = ~sums.any(axis=1)
+        # Reseed empty clusters from random points instead of losing them
+        sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class VectorIndex:
+    """Append-only embedding index with exact or IVF search.
+
+    Args:
+        path (str): Directory holding the index files.
+        embed (callable): Maps a list of texts to an (n, dim) array. Defaults to
+            a HashingEmbedder of the index's dimension (256 for a new index).
+        nprobe (int): IVF lists scanned per query.
+        ivf_threshold (int): Row count at which the IVF index is trained
+            automatically. It is retrained whenever the index has grown 4x since.
+    """
+
+    def __init__(self, path: str, embed: Callable[[Sequence[str]], np.ndarray] = None,
+                 nprobe: int = 16, ivf_threshold: int = 20000):
+        self.path = path
+        self.nprobe = nprobe
+        self.ivf_threshold = ivf_threshold
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.records_path = os.path.join(path, "records.jsonl")
+        self.lists_path = os.path.join(path, "lists.i32")
+        self.centroids_path = os.path.join(path, "ivf.npy")
+        self.info_path = os.path.join(path, "info.json")
+        self.lock_path = os.path.join(path, "lock")
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._seen = None
+        with self._file_lock():
+            pass  # loads the index
+        self.embed = embed or HashingEmbedder(self.dim or 256)
+
+    def _load(self):
+        self.info = {}
+        if os.path.exists(self.info_path):
+            with open(self.info_path, encoding="utf-8") as f:
+                self.info = json.load(f)
+        self.dim = self.info.get("dim")
+
+        # Record offsets are kept in memory; record bodies are read on demand
+        offsets, position = [], 0
+        if os.path.exists(self.records_path):
+            with open(self.records_path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # torn final write
+                    offsets.append(position)
+                    position += len(line)
+        rows = os.path.getsize(self.vectors_path) // (self.dim * 4) if self.dim and os.path.exists(self.vectors_path) else 0
+        # A crash between the two appends leaves one file ahead; the shorter one wins
+        self.count = min(rows, len(offsets))
+        self._offsets = offsets[:self.count]
+        self._records_end = offsets[self.count] if self.count < len(offsets) else position
+        self._matrix = None
+
+        self.centroids = np.load(self.centroids_path) if os.path.exists(self.centroids_path) else None
+        self._assignment = None
+        self._lists = None
+        if self.centroids is not None:
+            assignment = np.fromfile(self.lists_path, dtype=np.int32) if os.path.exists(self.lists_path) else np.zeros(0, np.int32)
+            if len(assignment) < self.count:
+                # Rows added after the last assignment write get assigned now
+                missing = self._assign(self._rows(len(assignment), self.count))
+                assignment = np.concatenate([assignment, missing])
+                assignment.tofile(self.lists_path)
+            self._assignment = assignment[:self.count]
+        self._seen = self._disk_state()
+
+    def _disk_state(self) -> tuple:
+        def stat(path):
+            try:
+                result = os.stat(path)
+            except FileNotFoundError:
+                return None
+            return result.st_size, result.st_mtime_ns
+        return tuple(stat(path) for path in (self.vectors_path, self.records_path, self.info_path, self.centroids_path))
+
+    @contextlib.contextmanager
+    def _file_lock(self):
+        """Exclusive lock shared with every process using this directory; reloads their writes."""
+        # Closing the file releases the lock
+        with open(self.lock_path, "a+b") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if self._disk_state() != self._seen:
+                self._load()
+            yield
+            self._seen = self._disk_state()
+
+    def _write_info(self):
+        tmp_path = f"{self.info_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.info, f)
+        os.replace(tmp_path, self.info_path)
+
+    def _rows(self, start: int, end: int) -> np.ndarray:
+        if self._matrix is None or len(self._matrix) < end:
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.count, self.dim)) \
+                if self.count else np.zeros((0, self.dim or 0), np.float32)
+        return self._matrix[start:end]
+
+    def _assign(self, vectors: np.ndarray, batch: int = 16384) -> np.ndarray:
+        return np.concatenate([
+            np.argmax(vectors[i:i + batch] @ self.centroids.T, axis=1).astype(np.int32)
+            for i in range(0, len(vectors), batch)
+        ] or [np.zeros(0, np.int32)])
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, texts: Sequence[str], metadatas: Sequence[dict] = None) -> List[int]:
+        """Embed and append texts; returns their row IDs."""
+        if not texts:
+            return []
+        metadatas = metadatas or [{}] * len(texts)
+        return self.add_vectors(self.embed(list(texts)), [{**m, "text": t} for t, m in zip(texts, metadatas)])
+
+    def add_vectors(self, vectors: np.ndarray, records: Sequence[dict]) -> List[int]:
+        """Append precomputed vectors with their records; returns their row IDs."""
+        vectors = _normalize(np.atleast_2d(vectors))
+        if len(vectors) != len(records):
+            raise ValueError("vectors and records must have the same length")
+        with self._lock, self._file_lock():
+            if self.dim is None:
+                self.dim = self.info["dim"] = int(vectors.shape[1])
+                self._write_info()
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}")
+
+            start = self.count
+            lines = [json.dumps(record, default=str).encode("utf-8") + b"\n" for record in records]
+            with open(self.records_path, "r+b" if os.path.exists(self.records_path) else "wb") as f:
+                f.seek(self._records_end)
+                f.truncate()
+                f.writelines(lines)
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(start * self.dim * 4)
+                f.write(vectors.tobytes())
+            for line in lines:
+                self._offsets.append(self._records_end)
+                self._records_end += len(line)
+            self.count += len(vectors)
+            self._matrix = None
+
+            if self.centroids is not None:
+                assignment = self._assign(vectors)
+                with open(self.lists_path, "ab") as f:
+                    f.truncate(start * 4)
+                    f.write(assignment.tobytes())
+                self._assignment = np.concatenate([self._assignment, assignment])
+                self._lists = None
+            trained_rows = self.info.get("trained_rows", 0)
+            if self.count >= self.ivf_threshold and (not trained_rows or self.count >= 4 * trained_rows):
+                self._train()
+        return list(range(start, start + len(vectors)))
+
+    def train(self, nlist: int = None):
+        """(Re)build the IVF index over every row."""
+        with self._lock, self._file_lock():
+            self._train(nlist)
+
+    def _train(self, nlist: int = None, sample_size: int = 32):
+        nlist = nlist or min(max(int(math.sqrt(self.count)), 16), 1024)
+        nlist = min(nlist, self.count)
+        matrix = self._rows(0, self.count)
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(self.count, size=min(self.count, nlist * sample_size), replace=False))
+        self.centroids = spherical_kmeans(np.asarray(matrix[sample]), nlist)
+        self._assignment = self._assign(matrix)
+
+        np.save(f"{self.centroids_path}.tmp.npy", self.centroids)
+        os.replace(f"{self.centroids_path}.tmp.npy", self.centroids_path)
+        self._assignment.tofile(f"{self.lists_path}.tmp")
+        os.replace(f"{self.lists_path}.tmp", self.lists_path)
+        self.info.update(trained_rows=self.count, nlist=nlist)
+        self._write_info()
+        self._lists = None
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            order = np.argsort(self._assignment, kind="stable").astype(np.int64)
+            bounds = np.concatenate([[0], np.cumsum(np.bincount(self._assignment, minlength=len(self.centroids)))])
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._lists
+
+    def record(self, row: int) -> dict:
+        """Return the stored record (text and metadata) of a row."""
+        with open(self.records_path, "rb") as f:
+            f.seek(self._offsets[row])
+            return json.loads(f.readline())
+
+    def search(self, query: str, k: int = 5, where: Dict[str, str] = None) -> List[dict]:
+        """Return the k chunks most similar to query.
+
+        Args:
+            query (str): Text to search for.
+            k (int): Number of results.
+            where (Dict[str, str]): Only return records whose fields equal these values.
+
+        Returns:
+            List[dict]: id, score (cosine similarity), text and metadata, best first.
+        """
+        return self.search_vector(self.embed([query])[0], k, where)
+
+    def _rank(self, rows, scores: np.ndarray, k: int, where: Dict[str, str]) -> List[dict]:
+        # Rank a few times k first; only fall back to a full sort if filtering rejects too many
+        first = min(len(scores), k * 10 if where else k)
+        results = []
+        for limit in [first] + ([len(scores)] if first < len(scores) else []):
+            top = np.argpartition(-scores, limit - 1)[:limit] if limit < len(scores) else np.arange(len(scores))
+            results = []
+            for i in top[np.argsort(-scores[top])]:
+                row = int(rows[i]) if rows is not None else int(i)
+                record = self.record(row)
+                if where and any(record.get(key) != value for key, value in where.items()):
+                    continue
+                text = record.pop("text", "")
+                results.append({"id": row, "score": float(scores[i]), "text": text, "metadata": record})
+                if len(results) == k:
+                    return results
+        return results
+
+    def search_vector(self, vector: np.ndarray, k: int = 5, where: Dict[str, str] = None) -> List[dict]:
+        """search() for a precomputed query vector."""
+        query = _normalize(vector)
+        with self._lock:
+            if self._disk_state() != self._seen:
+                # Another process has added rows since we last looked
+                with self._file_lock():
+                    pass
+            if not self.count:
+                return []
+            matrix = self._rows(0, self.count)
+            if self.centroids is not None:
+                probe = np.argsort(self.centroids @ query)[::-1][:self.nprobe]
+                lists = self._inverted_lists()
+                rows = np.sort(np.concatenate([lists[i] for i in probe]))
+                results = self._rank(rows, matrix[rows] @ query, k, where)
+                # A filter can leave the probed lists short; rare sources then get an exact scan
+                if len(results) == k or not where:
+                    return results
+            return self._rank(None, matrix @ query, k, where)